@@ -0,0 +1,616 @@
+#!/usr/bin/env python3
+"""
+bench.py
+Banco de pruebas de rendimiento de los generadores (py2dot.py, py2draw.py y
+py_to_dot.py) con fuentes Python sintéticas de tamaño creciente.
+
+Ejes:
+  lines    código lineal, de 10 a 100.000 sentencias
+  elif     anchura de una cadena if/elif sobre el mismo sujeto (decisión múltiple)
+  elif-flat  anchura de una cadena if/elif con un sujeto distinto en cada rama
+           (diamantes anidados; con miles de ramas, el parseo plano de flowir)
+  nesting  profundidad de bucles anidados (for/while alternos)
+  try      densidad de try/except sobre 5.000 sentencias (0 -> todas)
+
+Por caso se mide por separado:
+  parse      texto -> AST (flowir.parse_source)
+  build      AST -> FlowGraph (común a las tres herramientas)
+  <tool>.serialize   FlowGraph -> texto de salida
+  <tool>.write       texto -> fichero
+Se toma el mínimo de --repeat ejecuciones. El pico de memoria de cada fase se
+mide aparte, en una pasada con tracemalloc, para no falsear los tiempos.
+
+Cada ejecución se añade al histórico JSON (--history). Con --save-baseline los
+resultados pasan a ser la referencia (--baseline); con --check el programa
+termina con código 1 si alguna fase es más lenta que la referencia en más de
+--margin. Los dos ficheros van por defecto a la carpeta de la caché
+(PY2FLOW_CACHE_DIR, ver build_cache.py), fuera del árbol de trabajo.
+Con --graphviz N se mide en su lugar el render: N grafos pequeños con un
+proceso de Graphviz por grafo frente a los lotes de dot2pdf (--batch).
+Con --verify no se mide nada: se comprueban casos límite de la salida
+(VERIFY_CHECKS) y el programa termina con código 1 si alguno falla.
+Uso:
+  bench.py                      todos los ejes
+  bench.py --axes lines,elif --quick
+  bench.py --save-baseline
+  bench.py --check --margin 0.25
+  bench.py --graphviz 200 -j 4 --batch 32
+  bench.py --verify
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+
+import catalog
+import py2dot
+import py2draw
+import py_to_dot
+from build_cache import default_cache_dir
+from flowir import FlowBuilder, _parse_flat_elif, build_flow, parse_source
+
+AXES = {
+    "lines": [10, 100, 1000, 10000, 100000],
+    "elif": [10, 100, 1000, 10000],
+    "elif-flat": [10, 100, 1000, 10000],
+    "nesting": [5, 10, 20, 40, 80],   # el tokenizer de CPython admite 100 niveles
+    "try": [0, 0.1, 0.25, 0.5, 1.0],
+}
+TRY_STATEMENTS = 5000
+
+TOOLS = {
+    "py2dot": lambda g: py2dot.graph_to_dot(g),
+    "py2draw": lambda g: py2draw.generate_mxfile(
+        py2draw.MXGRAPH_MODEL_TEMPLATE.format(cells=py2draw.build_cells(g))),
+    "py_to_dot": lambda g: py_to_dot.generate_dot(list(py_to_dot.linear_nodes(g))),
+}
+
+
+# -------------------------
+# Fuentes sintéticas
+# -------------------------
+
+def _stmt(i, indent=""):
+    # Una de cada diez sentencias es de E/S (paralelogramo en los diagramas)
+    if i % 10 == 9:
+        return f"{indent}print('valor', v{i % 100})\n"
+    return f"{indent}v{i % 100} = v{(i + 1) % 100} + {i}\n"
+
+
+def gen_lines(n):
+    return "".join(_stmt(i) for i in range(n))
+
+
+def gen_elif(n):
+    parts = ["x = int(input())\n", "if x == 0:\n", "    y = 0\n"]
+    for i in range(1, n):
+        parts.append(f"elif x == {i}:\n    y = {i}\n")
+    parts.append("else:\n    y = -1\nprint(y)\n")
+    return "".join(parts)
+
+
+def gen_elif_flat(n):
+    # Cada condición mira una variable distinta: no es una escalera de decisión múltiple
+    parts = ["x0 = int(input())\n", "if x0 == 0:\n", "    y = 0\n"]
+    for i in range(1, n):
+        parts.append(f"elif x{i} == {i}:\n    y = {i}\n")
+    parts.append("else:\n    y = -1\nprint(y)\n")
+    return "".join(parts)
+
+
+def gen_elif_tail(n):
+    # Escalera sobre x que acaba en condiciones de otro tipo: decisión múltiple + diamantes
+    return gen_elif(n).replace("else:\n", "elif z == 1:\n    y = -2\nelif flag:\n    y = -3\nelse:\n")
+
+
+def gen_nesting(depth):
+    parts = []
+    for d in range(depth):
+        indent = "    " * d
+        if d % 2:
+            parts.append(f"{indent}while i{d} < 3:\n")
+        else:
+            parts.append(f"{indent}for i{d} in range(3):\n")
+        parts.append(_stmt(d, indent + "    "))
+    parts.append(f"{'    ' * depth}print('fondo')\n")
+    return "".join(parts)
+
+
+def gen_try(density):
+    """TRY_STATEMENTS sentencias; la fracción `density` va dentro de un try/except."""
+    parts = []
+    acc = 0.0
+    for i in range(TRY_STATEMENTS):
+        acc += density
+        if acc >= 1.0:
+            acc -= 1.0
+            parts.append("try:\n")
+            parts.append(_stmt(i, "    "))
+            parts.append("except ValueError as e:\n    print(e)\n")
+        else:
+            parts.append(_stmt(i))
+    return "".join(parts)
+
+
+GENERATORS = {"lines": gen_lines, "elif": gen_elif, "elif-flat": gen_elif_flat,
+              "nesting": gen_nesting, "try": gen_try}
+
+
+# -------------------------
+# Medición
+# -------------------------
+
+def run_case(src, out_dir, collect):
+    """
+    Ejecuta una vez todas las fases sobre src. collect(fase, func) mide y
+    devuelve el resultado de func(). Devuelve el FlowGraph.
+    """
+    tree = collect("parse", lambda: parse_source(src))
+    graph = collect("build", lambda: FlowBuilder(src).build(tree))
+    for tool, serialize in TOOLS.items():
+        text = collect(f"{tool}.serialize", lambda: serialize(graph))
+        path = os.path.join(out_dir, tool + ".out")
+
+        def write():
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+
+        collect(f"{tool}.write", write)
+        del text
+    return graph
+
+
+def time_case(src, out_dir, repeat):
+    best = {}
+
+    def collect(phase, func):
+        t0 = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - t0
+        best[phase] = min(best.get(phase, elapsed), elapsed)
+        return result
+
+    graph = None
+    for _ in range(repeat):
+        graph = run_case(src, out_dir, collect)
+    return best, len(graph), graph.num_edges
+
+
+def memory_case(src, out_dir):
+    """Pico de memoria (MiB) asignado durante cada fase."""
+    peaks = {}
+
+    def collect(phase, func):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = func()
+        peaks[phase] = (tracemalloc.get_traced_memory()[1] - base) / (1024 * 1024)
+        return result
+
+    tracemalloc.start()
+    try:
+        run_case(src, out_dir, collect)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def run_benchmarks(axes, quick, repeat, memory):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="py2flow-bench-") as out_dir:
+        for axis in axes:
+            sizes = AXES[axis][:-1] if quick else AXES[axis]
+            for size in sizes:
+                case = f"{axis}-{size}"
+                src = GENERATORS[axis](size)
+                times, nodes, edges = time_case(src, out_dir, repeat)
+                entry = {"nodes": nodes, "edges": edges, "bytes": len(src.encode("utf-8")),
+                         "time": times}
+                if memory:
+                    entry["peak_mib"] = memory_case(src, out_dir)
+                results[case] = entry
+                print_case(case, entry)
+    return results
+
+
+def bench_graphviz(count, jobs, batch):
+    """
+    Renderiza `count` grafos pequeños (como los de los ejercicios) con
+    dot2pdf.render_all, primero con un proceso por grafo y después por lotes.
+    """
+    import dot2pdf    # solo aquí: necesita Graphviz y PyPDF2
+    sources = [gen_lines(5 + i % 20) if i % 3 else gen_elif(2 + i % 6) for i in range(count)]
+    with tempfile.TemporaryDirectory(prefix="py2flow-bench-") as out_dir:
+        pairs = []
+        for i, src in enumerate(sources):
+            dot_path = os.path.join(out_dir, f"g{i:05}.dot")
+            with open(dot_path, "w", encoding="utf-8") as f:
+                f.write(py2dot.render(src))
+            pairs.append((dot_path, dot_path[:-4] + ".pdf"))
+        results = {}
+        for name, size in (("por fichero", 1), ("por lotes", batch)):
+            t0 = time.perf_counter()
+            rendered = dot2pdf.render_all(pairs, jobs, size)
+            wall = time.perf_counter() - t0
+            errors = sum(1 for err, _ in rendered if err is not None)
+            processes = -(-count // max(1, min(size, -(-count // jobs))))
+            results[name] = wall
+            print(f"{name:<12} {count} grafos, {processes:5} procesos de dot: {wall:8.3f} s "
+                  f"({wall / count * 1000:7.2f} ms/grafo, -j {jobs})"
+                  + (f", {errors} errores" if errors else ""))
+    print(f"Lotes de {batch}: {results['por fichero'] / results['por lotes']:.1f}x más rápido")
+
+
+# -------------------------
+# Comprobaciones (--verify)
+# -------------------------
+
+# Ramas con literales de cadena: la etiqueta de cada arista CASE es texto del
+# fuente, con sus comillas (y alguna barra invertida)
+VERIFY_SOURCES = {
+    "if-cadenas": ('op = input()\n'
+                   'if op == "+":\n    r = a + b\n'
+                   'elif op == "-":\n    r = a - b\n'
+                   'elif op == "\\\\":\n    r = a // b\n'
+                   'else:\n    r = 0\n'),
+    "match-cadenas": ('cmd = input()\n'
+                      'match cmd:\n'
+                      '    case "salir":\n        exit()\n'
+                      '    case "ayuda" | "?":\n        print("Escribe \\"salir\\"")\n'
+                      '    case _:\n        print(cmd)\n'),
+}
+
+_DOT_STRING = r'"(?:[^"\\]|\\.)*"'
+_DOT_ATTRS = rf'( \[\w+=({_DOT_STRING}|\w+)(, \w+=({_DOT_STRING}|\w+))*\])?;'
+_DOT_ID = re.compile(r'\s*n\d+\b')
+_DOT_NODE = re.compile(rf'\s*n\d+{_DOT_ATTRS}')
+_DOT_EDGE = re.compile(rf'\s*n\d+ -> n\d+{_DOT_ATTRS}')
+_DOT_EDGE_LABEL = re.compile(rf'label=({_DOT_STRING})')
+
+
+def verify_dot_labels():
+    """
+    Cada línea de nodo o arista de py2dot es DOT válido y cada etiqueta de
+    arista, desescapada, es la del FlowGraph. Devuelve [mensaje de fallo].
+    """
+    failures = []
+    for name, src in VERIFY_SOURCES.items():
+        graph = build_flow(src)
+        lines = py2dot.graph_to_dot(graph).splitlines()
+        got = []
+        for line in lines:
+            if not _DOT_ID.match(line):
+                continue        # cabecera, clusters, llaves
+            if "->" not in line:
+                if not _DOT_NODE.fullmatch(line):
+                    failures.append(f"{name}: DOT no válido: {line.strip()}")
+                continue
+            if not _DOT_EDGE.fullmatch(line):
+                failures.append(f"{name}: DOT no válido: {line.strip()}")
+            m = _DOT_EDGE_LABEL.search(line)
+            got.append(re.sub(r"\\(.)", r"\1", m.group(1)[1:-1]) if m else None)
+        want = [label or py2dot.EDGE_LABELS.get(kind) for _, _, kind, label in graph.edges()]
+        if got != want:
+            failures.append(f"{name}: etiquetas de arista {got} en lugar de {want}")
+    return failures
+
+
+def verify_linear_paths():
+    """
+    py_to_dot da el mismo DOT por el IR que con --stream en cadenas if/elif:
+    cada condición es su propio nodo, con el texto completo. Devuelve [fallo].
+    """
+    failures = []
+    sources = dict(VERIFY_SOURCES, **{"elif-10": gen_elif(10)})
+    for name, src in sources.items():
+        out = io.StringIO()
+        py_to_dot.write_stream(io.StringIO(src).readline, out)
+        if py_to_dot.render(src) != out.getvalue():
+            failures.append(f"{name}: el DOT del IR no coincide con el de --stream")
+    return failures
+
+
+# Tamaños de verify_flat_elif y crecimiento tolerado del tiempo por rama entre
+# el primero y el último (lineal: ~1; cuadrático: 5 entre 2.000 y 10.000)
+FLAT_ELIF_SIZES = (2000, 5000, 10000)
+FLAT_ELIF_GROWTH = 2.5
+
+# Formas de cadena de verify_flat_elif: (generador, nodos mínimos por rama)
+FLAT_ELIF_SHAPES = {
+    "elif-flat": (gen_elif_flat, 3),   # diamante, asignación y unión por rama
+    "elif-tail": (gen_elif_tail, 1),   # una arista CASE y su asignación por rama
+}
+
+
+def verify_flat_elif():
+    """
+    Una cadena if/elif de hasta 10.000 ramas se convierte con build_flow sin
+    RecursionError y en tiempo lineal: el tiempo por rama no crece más de
+    FLAT_ELIF_GROWTH veces. Se prueban sujetos distintos en cada rama (sin
+    escalera de decisión múltiple) y una escalera que termina en condiciones
+    de otro tipo. Se mide siempre el parseo plano (_parse_flat_elif) más la
+    construcción, porque con pocas ramas build_flow usa ast.parse y los
+    tiempos no serían comparables. Devuelve [fallo].
+    """
+    failures = []
+    for shape, (gen, min_nodes) in FLAT_ELIF_SHAPES.items():
+        per_branch = []
+        for n in FLAT_ELIF_SIZES:
+            src = gen(n)
+            try:
+                graph = build_flow(src)
+            except RecursionError:
+                failures.append(f"{shape}-{n}: RecursionError")
+                break
+            if len(graph) < min_nodes * n:
+                failures.append(f"{shape}-{n}: {len(graph)} nodos, "
+                                f"se esperaban al menos {min_nodes * n}")
+                break
+            best = None
+            for _ in range(2):
+                t0 = time.perf_counter()
+                FlowBuilder(src).build(_parse_flat_elif(src, "<bench>"))
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+            per_branch.append(best / n)
+            print(f"  {shape}-{n:<6} {best:.3f} s ({best / n * 1e6:.1f} µs/rama)")
+        else:
+            growth = per_branch[-1] / per_branch[0]
+            if growth > FLAT_ELIF_GROWTH:
+                failures.append(f"{shape}: el tiempo por rama crece {growth:.1f}x de "
+                                f"{FLAT_ELIF_SIZES[0]} a {FLAT_ELIF_SIZES[-1]} ramas "
+                                f"(máximo {FLAT_ELIF_GROWTH}x): no es lineal")
+    return failures
+
+
+# (script, extensión de la salida, opciones) de cada forma de generar
+KEEP_OUTPUT_RUNS = [
+    ("py2dot.py", ".dot", []), ("py2dot.py", ".dot", ["--no-cache"]),
+    ("py2draw.py", ".drawio.xml", []), ("py2draw.py", ".drawio.xml", ["--no-cache"]),
+    ("py_to_dot.py", ".dot", []), ("py_to_dot.py", ".dot", ["--no-cache"]),
+    ("py_to_dot.py", ".dot", ["--stream"]),
+]
+
+
+def verify_keep_output():
+    """
+    Un fuente con error de sintaxis no toca la última salida buena: se genera
+    desde un .py válido, se le añade un error y se vuelve a generar; el
+    fichero de salida tiene que seguir siendo el mismo. Se ejecutan los
+    scripts de verdad, con la caché y el catálogo en una carpeta temporal.
+    Devuelve [fallo].
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="bench-verify-") as tmp:
+        env = dict(os.environ, PY2FLOW_CACHE_DIR=os.path.join(tmp, "cache"))
+        env.pop("PY2FLOW_CATALOG", None)
+        src = os.path.join(tmp, "prog.py")
+        for script, ext, flags in KEEP_OUTPUT_RUNS:
+            name = " ".join([script] + flags)
+            out = os.path.join(tmp, "prog" + ext)
+            cmd = [sys.executable, os.path.join(here, script), src] + flags
+            with open(src, "w", encoding="utf-8") as f:
+                f.write(gen_elif(5))
+            if subprocess.run(cmd, env=env, capture_output=True).returncode != 0:
+                failures.append(f"{name}: falla con un fuente válido")
+                continue
+            with open(out, "rb") as f:
+                good = f.read()
+            with open(src, "a", encoding="utf-8") as f:
+                f.write("if x ==\n")
+            subprocess.run(cmd, env=env, capture_output=True)
+            with open(out, "rb") as f:
+                now = f.read()
+            if now != good:
+                failures.append(f"{name}: un error de sintaxis cambió la salida "
+                                f"({len(now)} bytes en lugar de {len(good)})")
+    return failures
+
+
+SPLIT_SOURCE = ("def area(r):\n    return 3.14 * r * r\n\n"
+                "def perimetro(r):\n    return 2 * 3.14 * r\n\n"
+                "class Circulo:\n    def __init__(self, r):\n        self.r = r\n\n"
+                "print(area(2), perimetro(2))\n")
+
+
+def verify_split_catalog():
+    """
+    py2dot --split anota en el catálogo todos sus .dot, así que dot2pdf
+    --from-catalog encuentra los mismos grafos que listando la carpeta, y el
+    render de cada uno queda como un artefacto propio (pdf, pdf:<nombre>).
+    No hace falta Graphviz: los PDF se anotan sin generarlos. Devuelve [fallo].
+    """
+    import dot2pdf    # solo aquí: necesita PyPDF2
+    here = os.path.dirname(os.path.abspath(__file__))
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="bench-verify-") as tmp:
+        db = os.path.join(tmp, "catalog.sqlite")
+        src = os.path.join(tmp, "geometria.py")
+        with open(src, "w", encoding="utf-8") as f:
+            f.write(SPLIT_SOURCE)
+        cmd = [sys.executable, os.path.join(here, "py2dot.py"), src, "--split", "--catalog", db]
+        if subprocess.run(cmd, capture_output=True).returncode != 0:
+            return ["py2dot --split falla"]
+        cat = catalog.Catalog(db)
+        try:
+            on_disk = dot2pdf.list_dot_files(tmp)
+            listed = dot2pdf.list_dot_files(tmp, cat)
+            if listed != on_disk:
+                failures.append(f"--from-catalog ve {listed} en lugar de {on_disk}")
+            done = [(os.path.join(tmp, name), os.path.join(tmp, name[:-4] + ".pdf"), 0.0)
+                    for name in on_disk]
+            dot2pdf.record_pdfs(cat, done)
+            pdfs = cat.artifacts_in(tmp, "pdf")
+            want = sorted(pdf for _, pdf, _ in done)
+            if pdfs != want:
+                failures.append(f"PDF anotados {[os.path.basename(p) for p in pdfs]} "
+                                f"en lugar de {[os.path.basename(p) for p in want]}")
+        finally:
+            cat.close()
+    return failures
+
+
+VERIFY_CHECKS = {"dot-labels": verify_dot_labels, "linear-paths": verify_linear_paths,
+                 "flat-elif": verify_flat_elif, "keep-output": verify_keep_output,
+                 "split-catalog": verify_split_catalog}
+
+
+def run_verify():
+    failed = False
+    for name, check in VERIFY_CHECKS.items():
+        failures = check()
+        for msg in failures:
+            print(f"FALLO {name}: {msg}", file=sys.stderr)
+        print(f"{name:<14} {'FALLO' if failures else 'ok'}")
+        failed = failed or bool(failures)
+    return not failed
+
+
+# -------------------------
+# Histórico y referencia
+# -------------------------
+
+def load_json(path, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def make_run(results, repeat):
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "versions": {"py2dot": py2dot.__version__, "py2draw": py2draw.__version__,
+                     "py_to_dot": py_to_dot.__version__},
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def check_regressions(results, baseline, margin, min_time):
+    """
+    Compara con la referencia. Devuelve [(caso, fase, referencia, actual)] de
+    las fases más lentas que referencia * (1 + margin). Las fases por debajo
+    de min_time segundos se ignoran: son ruido de medida.
+    """
+    regressions = []
+    for case, entry in results.items():
+        base = baseline.get("results", {}).get(case)
+        if base is None:
+            continue
+        for phase, secs in entry["time"].items():
+            ref = base["time"].get(phase)
+            if ref is None or secs < min_time:
+                continue
+            if secs > ref * (1 + margin):
+                regressions.append((case, phase, ref, secs))
+    return regressions
+
+
+def print_case(case, entry):
+    t = entry["time"]
+    total = sum(t.values())
+    phases = "  ".join(f"{p}={s * 1000:.1f}ms" for p, s in t.items() if "." not in p)
+    tools = "  ".join(f"{tool}={(t[tool + '.serialize'] + t[tool + '.write']) * 1000:.1f}ms"
+                      for tool in TOOLS)
+    mem = ""
+    if "peak_mib" in entry:
+        mem = f"  pico={max(entry['peak_mib'].values()):.1f}MiB"
+    print(f"{case:<14} {entry['nodes']:>7} nodos  total={total:.3f}s  {phases}  {tools}{mem}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mide cómo escalan los generadores de diagramas con fuentes sintéticas.")
+    parser.add_argument("--axes", default=",".join(AXES),
+                        help=f"ejes a medir, separados por comas (por defecto: {','.join(AXES)})")
+    parser.add_argument("--quick", action="store_true",
+                        help="omitir el tamaño mayor de cada eje")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="ejecuciones por caso; se guarda el mínimo (por defecto: 3)")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="no medir el pico de memoria (ahorra una pasada con tracemalloc)")
+    parser.add_argument("--history", default=os.path.join(default_cache_dir(), "bench_history.json"),
+                        help="fichero JSON donde se acumulan las ejecuciones "
+                             "(por defecto: %(default)s)")
+    parser.add_argument("--baseline", default=os.path.join(default_cache_dir(), "bench_baseline.json"),
+                        help="fichero JSON con los resultados de referencia "
+                             "(por defecto: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="guardar esta ejecución como nueva referencia")
+    parser.add_argument("--check", action="store_true",
+                        help="fallar (código 1) si alguna fase empeora más de --margin")
+    parser.add_argument("--margin", type=float, default=0.25,
+                        help="empeoramiento tolerado, en tanto por uno (por defecto: 0.25)")
+    parser.add_argument("--min-time", type=float, default=0.005,
+                        help="no comprobar fases más rápidas que esto, en segundos (por defecto: 0.005)")
+    parser.add_argument("--verify", action="store_true",
+                        help="solo comprobar la salida en casos límite (código 1 si alguno falla)")
+    parser.add_argument("--graphviz", type=int, metavar="N",
+                        help="medir solo el render de N grafos: un proceso por grafo frente a lotes")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="con --graphviz, procesos de Graphviz a la vez (por defecto: nº de CPUs)")
+    parser.add_argument("--batch", type=int, default=32,
+                        help="con --graphviz, grafos por proceso (por defecto: 32)")
+    args = parser.parse_args()
+
+    if args.verify:
+        sys.exit(0 if run_verify() else 1)
+
+    if args.graphviz:
+        bench_graphviz(args.graphviz, max(1, args.jobs or 1), max(1, args.batch))
+        return
+
+    axes = [a.strip() for a in args.axes.split(",") if a.strip()]
+    unknown = [a for a in axes if a not in AXES]
+    if unknown:
+        parser.error(f"eje desconocido: {', '.join(unknown)} (válidos: {', '.join(AXES)})")
+
+    results = run_benchmarks(axes, args.quick, max(1, args.repeat), not args.no_memory)
+    run = make_run(results, args.repeat)
+
+    history = load_json(args.history, [])
+    history.append(run)
+    save_json(args.history, history)
+    print(f"Resultados añadidos a {args.history} ({len(history)} ejecuciones)")
+
+    if args.check:
+        baseline = load_json(args.baseline, None)
+        if baseline is None:
+            print(f"No hay referencia en {args.baseline}; usa --save-baseline.", file=sys.stderr)
+            sys.exit(2)
+        regressions = check_regressions(results, baseline, args.margin, args.min_time)
+        for case, phase, ref, secs in regressions:
+            print(f"REGRESIÓN {case} {phase}: {ref * 1000:.1f}ms -> {secs * 1000:.1f}ms "
+                  f"(+{(secs / ref - 1) * 100:.0f}%)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"Sin regresiones respecto a {args.baseline} (margen {args.margin:.0%})")
+
+    if args.save_baseline:
+        save_json(args.baseline, run)
+        print(f"Referencia guardada en {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
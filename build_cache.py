@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+build_cache.py
+Caché persistente en disco compartida por py2dot.py, py2draw.py y py_to_dot.py.
+
+- Las salidas (.dot / .drawio.xml) se guardan por contenido: la clave es un
+  sha256 de (herramienta, versión, código fuente).
+- Un índice por herramienta recuerda, para cada fuente, su mtime/tamaño y el
+  mtime de la salida escrita. Si nada ha cambiado basta un stat() por fichero:
+  ni se lee ni se parsea el .py.
+- El almacén tiene un tamaño máximo; al superarlo se borran las entradas usadas
+  hace más tiempo (LRU por mtime, que se actualiza en cada acierto).
+
+Configuración por entorno:
+  PY2FLOW_CACHE_DIR  carpeta de la caché (por defecto ~/.cache/py2flow)
+  PY2FLOW_CACHE_MAX  tamaño máximo en bytes (por defecto 64 MiB)
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+import profiling
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def default_cache_dir():
+    env = os.environ.get("PY2FLOW_CACHE_DIR")
+    if env:
+        return env
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "py2flow")
+
+
+def _atomic_write(path, data):
+    # Escribir en temporal + os.replace: lectores concurrentes nunca ven medio fichero
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def open_output(path):
+    """
+    Abre path para escribir texto sin tocar el fichero actual: se escribe en
+    path + ".tmp", que solo sustituye a path (os.replace) si el bloque termina
+    sin error. Un fuente con errores de sintaxis deja intacta la última salida.
+    """
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class BuildCache:
+    """Caché de salidas de un generador concreto (tool + version)."""
+
+    def __init__(self, tool, version, root=None, max_bytes=None):
+        self.tool = tool
+        self.version = str(version)
+        self.root = root or default_cache_dir()
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("PY2FLOW_CACHE_MAX", DEFAULT_MAX_BYTES))
+        self.max_bytes = max_bytes
+        self.objects = os.path.join(self.root, "objects")
+        self.index_path = os.path.join(self.root, f"index-{tool}.json")
+        self._index = None
+        self._dirty = False
+        self._stored = 0
+        os.makedirs(self.objects, exist_ok=True)
+
+    # ---------- índice (ruta -> stat del fuente y de la salida) ----------
+
+    @property
+    def index(self):
+        if self._index is None:
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                ok = data.get("version") == self.version
+                self._index = data.get("entries", {}) if ok else {}
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def is_fresh(self, infile, outfile):
+        """True si fuente y salida no han cambiado desde la última generación (solo stat)."""
+        entry = self.index.get(os.path.abspath(infile))
+        if not entry:
+            return False
+        try:
+            st = os.stat(infile)
+            out_st = os.stat(outfile)
+        except OSError:
+            return False
+        return (entry[0] == st.st_mtime_ns and entry[1] == st.st_size
+                and entry[3] == out_st.st_mtime_ns)
+
+    def record(self, infile, entry):
+        """Guarda en el índice la entrada devuelta por build()."""
+        if entry is not None:
+            self.index[os.path.abspath(infile)] = entry
+            self._dirty = True
+
+    # ---------- almacén por contenido ----------
+
+    def key_for(self, src):
+        h = hashlib.sha256()
+        h.update(f"{self.tool}\0{self.version}\0".encode("utf-8"))
+        h.update(src.encode("utf-8"))
+        return h.hexdigest()
+
+    def _object_path(self, key):
+        return os.path.join(self.objects, key[:2], key)
+
+    def get(self, key):
+        path = self._object_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # marca de uso reciente para el LRU
+        except OSError:
+            pass
+        return text
+
+    def put(self, key, text):
+        path = self._object_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = text.encode("utf-8")
+        _atomic_write(path, data)
+        self._stored += len(data)
+
+    def put_file(self, key, src_path):
+        """Como put(), pero copiando un fichero ya escrito (sin cargarlo en memoria)."""
+        path = self._object_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        os.close(fd)
+        try:
+            shutil.copyfile(src_path, tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._stored += os.path.getsize(path)
+
+    def copy_to(self, key, dst_path):
+        """Copia la entrada `key` a dst_path. Devuelve False si no está en la caché."""
+        path = self._object_path(key)
+        try:
+            shutil.copyfile(path, dst_path)
+        except FileNotFoundError:
+            return False
+        try:
+            os.utime(path)  # marca de uso reciente para el LRU
+        except OSError:
+            pass
+        return True
+
+    # ---------- generación ----------
+
+    def build(self, infile, outfile, write):
+        """
+        Genera outfile a partir de infile usando la caché.
+        write(src_text, f) escribe la salida en el fichero abierto f; solo se
+        llama en caso de fallo de caché. Las salidas se copian fichero a
+        fichero, nunca se cargan enteras en memoria.
+        Devuelve (hit, entry) donde entry se pasa a record().
+        """
+        with profiling.phase("read"):
+            st = os.stat(infile)
+            with open(infile, "r", encoding="utf-8") as f:
+                src = f.read()
+        with profiling.phase("cache/lookup"):
+            key = self.key_for(src)
+            hit = self.copy_to(key, outfile)
+        if not hit:
+            with open_output(outfile) as f:
+                write(src, profiling.writer(f))
+            with profiling.phase("cache/store"):
+                self.put_file(key, outfile)
+        out_st = os.stat(outfile)
+        return hit, [st.st_mtime_ns, st.st_size, key, out_st.st_mtime_ns]
+
+    # ---------- persistencia y expulsión ----------
+
+    def evict(self):
+        """Borra las entradas menos usadas hasta quedar por debajo de max_bytes."""
+        entries = []
+        total = 0
+        for sub in os.scandir(self.objects):
+            if not sub.is_dir():
+                continue
+            for e in os.scandir(sub.path):
+                st = e.stat()
+                entries.append((st.st_mtime_ns, st.st_size, e.path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def close(self):
+        # Las entradas nuevas del índice pueden venir de objetos escritos por
+        # procesos hijos (modo lote), así que también cuentan para expulsar
+        changed = self._dirty or self._stored
+        if self._dirty:
+            data = json.dumps({"version": self.version, "entries": self._index})
+            _atomic_write(self.index_path, data.encode("utf-8"))
+            self._dirty = False
+        if changed:
+            self.evict()
+            self._stored = 0
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+catalog.py
+Catálogo SQLite de los fuentes .py y de lo que se genera a partir de ellos
+(.dot, .drawio.xml, .pdf, .svg), compartido por todas las herramientas.
+
+Por fuente se guarda su hash, tamaño y mtime, y el número de nodos y aristas
+de su último FlowGraph con lo que tardó en construirse. Por artefacto, su
+ruta y tamaño, la herramienta (y versión) que lo generó, cuánto tardó y el
+hash del fuente del que sale. Con py2dot --split, la vista general es el
+artefacto "dot" y cada grafo de función o clase, "dot:<nombre>"; sus renders
+son "pdf:<nombre>", "svg:<nombre>"... Con eso:
+ - los comandos por lotes planifican sin recorrer carpetas ni comparar
+   salidas: un artefacto está al día si lo generó la misma herramienta a
+   partir del mismo contenido (py2flow, dot2pdf --from-catalog);
+ - se puede consultar sin tocar el árbol de ficheros:
+     catalog.py largest               grafos más grandes
+     catalog.py slowest --kind pdf    renders más lentos
+     catalog.py missing --kind pdf    fuentes sin ese artefacto
+     catalog.py summary               totales por tipo de artefacto
+     catalog.py prune                 olvida los ficheros que ya no existen
+
+Configuración: --catalog RUTA o PY2FLOW_CATALOG (por defecto
+catalog.sqlite en la carpeta de la caché, ver build_cache.py); --no-catalog
+o PY2FLOW_CATALOG=off desactivan el registro.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+import functools
+
+from build_cache import default_cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    path      TEXT PRIMARY KEY,     -- ruta absoluta
+    sha256    TEXT NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    size      INTEGER NOT NULL,
+    nodes     INTEGER,              -- del último FlowGraph construido
+    edges     INTEGER,
+    seconds   REAL,                 -- lo que tardó esa construcción
+    updated   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    source    TEXT NOT NULL,        -- sources.path
+    kind      TEXT NOT NULL,        -- dot, drawio, pdf, svg; dot:<nombre>... (py2dot --split)
+    path      TEXT NOT NULL,
+    tool      TEXT NOT NULL,        -- "py2dot 2.2", "py2draw 2.2 compact"...
+    source_sha256 TEXT,             -- contenido del fuente del que se generó
+    bytes     INTEGER,
+    seconds   REAL,
+    built     REAL NOT NULL,
+    PRIMARY KEY (source, kind)
+);
+CREATE INDEX IF NOT EXISTS artifacts_path ON artifacts (path);
+"""
+
+DISABLED = ("", "0", "off", "no", "false")
+
+# Tipo sin el nombre del grafo de --split ("pdf:area" -> "pdf"), en SQL
+BASE_KIND = "CASE WHEN instr(kind, ':') > 0 THEN substr(kind, 1, instr(kind, ':') - 1) ELSE kind END"
+
+
+def default_path():
+    env = os.environ.get("PY2FLOW_CATALOG")
+    if env is not None:
+        return None if env.strip().lower() in DISABLED else env
+    return os.path.join(default_cache_dir(), "catalog.sqlite")
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _best_effort(method):
+    """
+    Escrituras de las herramientas de generación. Con best_effort, un error
+    de SQLite (base bloqueada, corrupta, disco lleno) se avisa una vez y el
+    catálogo deja de escribirse, y un OSError (un fichero que ya no está) solo
+    se salta ese registro: la generación, que ya ha ido bien, sigue.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.failed:
+            return None
+        try:
+            return method(self, *args, **kwargs)
+        except (OSError, sqlite3.Error) as e:
+            if not self.best_effort:
+                raise
+            if isinstance(e, sqlite3.Error):
+                self.failed = True
+                print(f"Aviso: el catálogo ({self.path}) deja de actualizarse: {e}",
+                      file=sys.stderr)
+            else:
+                print(f"Aviso: no se anota en el catálogo: {e}", file=sys.stderr)
+            return None
+    return wrapper
+
+
+class Catalog:
+    def __init__(self, path, best_effort=False):
+        self.path = path
+        self.best_effort = best_effort
+        self.failed = False
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        # Varias herramientas pueden escribir a la vez: WAL + espera con timeout
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    # ---------- registro ----------
+
+    def source_state(self, path):
+        """
+        (stat, sha256) actuales de un fuente. Si mtime y tamaño coinciden con
+        el catálogo no se lee el fichero.
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        row = self.db.execute("SELECT mtime_ns, size, sha256 FROM sources WHERE path = ?",
+                              (path,)).fetchone()
+        if row is not None and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+            return st, row[2]
+        return st, file_sha256(path)
+
+    @_best_effort
+    def record_source(self, path, nodes=None, edges=None, seconds=None):
+        """Registra (o actualiza) un fuente. Devuelve su sha256. Los None conservan lo anterior."""
+        path = os.path.abspath(path)
+        st, digest = self.source_state(path)
+        self.db.execute(
+            """INSERT INTO sources (path, sha256, mtime_ns, size, nodes, edges, seconds, updated)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (path) DO UPDATE SET
+                 sha256 = excluded.sha256, mtime_ns = excluded.mtime_ns, size = excluded.size,
+                 nodes = COALESCE(excluded.nodes, nodes), edges = COALESCE(excluded.edges, edges),
+                 seconds = COALESCE(excluded.seconds, seconds), updated = excluded.updated""",
+            (path, digest, st.st_mtime_ns, st.st_size, nodes, edges, seconds, time.time()))
+        return digest
+
+    @_best_effort
+    def record_artifact(self, source, kind, path, tool, seconds=None, source_sha=None):
+        """Registra un artefacto de `source` (si el fuente no está registrado, se registra)."""
+        source = os.path.abspath(source)
+        if source_sha is None:
+            row = self.db.execute("SELECT sha256 FROM sources WHERE path = ?", (source,)).fetchone()
+            source_sha = row[0] if row is not None else self.record_source(source)
+            if source_sha is None:
+                return      # best_effort y el fuente no se pudo registrar
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        # Un acierto de caché no trae tiempo: si es el mismo artefacto se
+        # conserva el de la generación anterior
+        self.db.execute(
+            """INSERT INTO artifacts (source, kind, path, tool, source_sha256, bytes, seconds, built)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (source, kind) DO UPDATE SET
+                 seconds = CASE WHEN excluded.seconds IS NULL AND tool = excluded.tool
+                                 AND source_sha256 = excluded.source_sha256
+                                THEN seconds ELSE excluded.seconds END,
+                 path = excluded.path, tool = excluded.tool,
+                 source_sha256 = excluded.source_sha256, bytes = excluded.bytes,
+                 built = excluded.built""",
+            (source, kind, os.path.abspath(path), tool, source_sha, size, seconds, time.time()))
+
+    @_best_effort
+    def record(self, source, artifacts, tool, nodes=None, edges=None, seconds=None):
+        """
+        Atajo para una generación completa: registra el fuente y cada
+        artefacto de artifacts ({tipo: ruta}) hecho con `tool` en `seconds`.
+        Solo si se conoce el grafo (nodes) cuenta también como su tiempo de
+        construcción.
+        """
+        digest = self.record_source(source, nodes, edges, seconds if nodes is not None else None)
+        if digest is None:
+            return      # best_effort y el fuente no se pudo registrar
+        for kind, path in artifacts.items():
+            self.record_artifact(source, kind, path, tool, seconds, digest)
+
+    # ---------- planificación ----------
+
+    def stale(self, sources, wanted):
+        """
+        De la lista sources, los que tienen algún artefacto de wanted
+        ({tipo: herramienta}) por regenerar: no registrado, generado con otra
+        herramienta, a partir de otro contenido o borrado desde entonces.
+        Solo hace un stat() por fuente y artefacto (y lee los fuentes que
+        cambiaron de mtime o tamaño).
+        """
+        kinds = list(wanted)
+        built = {}
+        marks = ",".join("?" * len(kinds))
+        for source, kind, tool, sha, out in self.db.execute(
+                f"""SELECT source, kind, tool, source_sha256, path FROM artifacts
+                    WHERE kind IN ({marks})""", kinds):
+            built[source, kind] = (tool, sha, out)
+
+        def fresh(source, digest, kind, tool):
+            row = built.get((source, kind))
+            return row is not None and row[:2] == (tool, digest) and os.path.exists(row[2])
+
+        pending = []
+        for s in sources:
+            try:
+                _, digest = self.source_state(s)
+            except OSError:
+                pending.append(s)
+                continue
+            path = os.path.abspath(s)
+            if not all(fresh(path, digest, kind, tool) for kind, tool in wanted.items()):
+                pending.append(s)
+        return pending
+
+    def artifacts_in(self, folder, kind):
+        """
+        Rutas de los artefactos de ese tipo (y de sus grafos de --split,
+        kind:<nombre>) que están directamente en folder, ordenadas.
+        """
+        folder = os.path.abspath(folder)
+        rows = self.db.execute("SELECT path FROM artifacts WHERE kind = ? OR kind LIKE ?",
+                               (kind, kind + ":%"))
+        return sorted(p for (p,) in rows if os.path.dirname(p) == folder)
+
+    @_best_effort
+    def origin_of(self, artifact_path):
+        """(fuente, tipo) del artefacto con esa ruta, o None si no está en el catálogo."""
+        row = self.db.execute("SELECT source, kind FROM artifacts WHERE path = ? LIMIT 1",
+                              (os.path.abspath(artifact_path),)).fetchone()
+        return tuple(row) if row is not None else None
+
+    # ---------- consultas ----------
+
+    def largest(self, limit=10):
+        return self.db.execute(
+            """SELECT path, nodes, edges, seconds FROM sources WHERE nodes IS NOT NULL
+               ORDER BY nodes DESC, edges DESC LIMIT ?""", (limit,)).fetchall()
+
+    def slowest(self, kind=None, limit=10):
+        where, params = ("WHERE seconds IS NOT NULL", [])
+        if kind:
+            where += " AND (kind = ? OR kind LIKE ?)"
+            params += [kind, kind + ":%"]
+        return self.db.execute(
+            f"""SELECT path, kind, seconds, tool FROM artifacts {where}
+                ORDER BY seconds DESC LIMIT ?""", params + [limit]).fetchall()
+
+    def missing(self, kind):
+        return self.db.execute(
+            """SELECT path FROM sources s WHERE NOT EXISTS
+               (SELECT 1 FROM artifacts a WHERE a.source = s.path AND a.kind = ?)
+               ORDER BY path""", (kind,)).fetchall()
+
+    def summary(self):
+        sources = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(nodes), 0), COALESCE(SUM(edges), 0) FROM sources").fetchone()
+        kinds = self.db.execute(
+            f"""SELECT {BASE_KIND} AS base, COUNT(*), COALESCE(SUM(bytes), 0),
+                      COALESCE(SUM(seconds), 0)
+                FROM artifacts GROUP BY base ORDER BY base""").fetchall()
+        return sources, kinds
+
+    def prune(self):
+        """Olvida fuentes y artefactos cuyos ficheros ya no existen. Devuelve cuántas filas borró."""
+        gone = [p for (p,) in self.db.execute("SELECT path FROM sources") if not os.path.exists(p)]
+        removed = 0
+        for p in gone:
+            removed += self.db.execute("DELETE FROM artifacts WHERE source = ?", (p,)).rowcount
+            removed += self.db.execute("DELETE FROM sources WHERE path = ?", (p,)).rowcount
+        for (p,) in self.db.execute("SELECT path FROM artifacts").fetchall():
+            if not os.path.exists(p):
+                removed += self.db.execute("DELETE FROM artifacts WHERE path = ?", (p,)).rowcount
+        return removed
+
+    @_best_effort
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        try:
+            self.commit()
+        finally:
+            self.db.close()
+
+
+# -------------------------
+# Uso desde las herramientas
+# -------------------------
+
+def add_arguments(parser):
+    group = parser.add_argument_group("catálogo")
+    group.add_argument("--catalog", metavar="RUTA",
+                       help="base SQLite del catálogo (por defecto PY2FLOW_CATALOG o la de la caché)")
+    group.add_argument("--no-catalog", action="store_true",
+                       help="no registrar fuentes ni artefactos en el catálogo")
+
+
+def from_args(args):
+    """
+    Abre el catálogo pedido en la línea de órdenes, o None si está
+    desactivado. Si no se puede abrir se avisa y se sigue sin él, y se abre
+    con best_effort: el catálogo nunca hace fallar una generación.
+    """
+    if getattr(args, "no_catalog", False):
+        return None
+    path = getattr(args, "catalog", None) or default_path()
+    if path is None:
+        return None
+    try:
+        return Catalog(path, best_effort=True)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Aviso: catálogo no disponible ({path}): {e}", file=sys.stderr)
+        return None
+
+
+# -------------------------
+# Consultas desde la línea de órdenes
+# -------------------------
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Consulta el catálogo de fuentes y diagramas generados.")
+    parser.add_argument("--catalog", metavar="RUTA", help="base SQLite del catálogo")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("largest", help="fuentes con los grafos más grandes")
+    p.add_argument("-n", type=int, default=10, help="número de filas (por defecto: 10)")
+    p = sub.add_parser("slowest", help="artefactos que más tardaron en generarse")
+    p.add_argument("--kind", help="solo este tipo: dot, drawio, pdf, svg")
+    p.add_argument("-n", type=int, default=10, help="número de filas (por defecto: 10)")
+    p = sub.add_parser("missing", help="fuentes sin un tipo de artefacto")
+    p.add_argument("--kind", required=True, help="dot, drawio, pdf o svg")
+    sub.add_parser("summary", help="totales por tipo de artefacto")
+    sub.add_parser("prune", help="olvidar los ficheros que ya no existen")
+    args = parser.parse_args()
+
+    path = args.catalog or default_path()
+    if path is None or not os.path.exists(path):
+        print("No hay catálogo todavía: se crea al generar diagramas.", file=sys.stderr)
+        sys.exit(1)
+    catalog = Catalog(path)
+    try:
+        if args.command == "largest":
+            for src, nodes, edges, secs in catalog.largest(args.n):
+                build = f"{secs * 1000:9.1f} ms" if secs is not None else " " * 12
+                print(f"{nodes:8} nodos {edges:8} aristas {build}  {src}")
+        elif args.command == "slowest":
+            for out, kind, secs, tool in catalog.slowest(args.kind, args.n):
+                print(f"{secs * 1000:10.1f} ms  {kind:<6} {tool:<18} {out}")
+        elif args.command == "missing":
+            for (src,) in catalog.missing(args.kind):
+                print(src)
+        elif args.command == "summary":
+            (count, nodes, edges), kinds = catalog.summary()
+            print(f"{count} fuentes, {nodes} nodos, {edges} aristas")
+            for kind, n, size, secs in kinds:
+                print(f"  {kind:<6} {n:6} ficheros {size / 1024:10.1f} KiB {secs:9.3f} s")
+        elif args.command == "prune":
+            print(f"{catalog.prune()} entradas eliminadas")
+    finally:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,723 @@
+import io
 import os
+import re
 import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
 import subprocess
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from PyPDF2 import PdfMerger
 
-def unify_dot_to_pdf(folder_path, output_pdf="unificado.pdf"):
-    # 1. Buscar todos los .dot en la carpeta
-    dot_files = [f for f in os.listdir(folder_path) if f.endswith(".dot")]
+import catalog
+import profiling
+from build_cache import BuildCache
+from pdfstream import StreamingPdfMerger, peak_rss_mib
+
+def render_dot(dot_path, pdf_path):
+    """Convierte un .dot a .pdf con Graphviz. Devuelve None o el mensaje de error."""
+    try:
+        proc = subprocess.run(["dot", "-Tpdf", dot_path, "-o", pdf_path],
+                              capture_output=True, text=True)
+    except OSError as e:
+        return str(e)
+    if proc.returncode != 0:
+        return proc.stderr.strip() or f"dot terminó con código {proc.returncode}"
+    return None
+
+def timed_render(dot_path, pdf_path):
+    """render_dot() que además devuelve los segundos que tardó Graphviz."""
+    t0 = time.perf_counter()
+    err = render_dot(dot_path, pdf_path)
+    return err, time.perf_counter() - t0
+
+BATCH_SIZE = 32
+FORMATS = ("pdf", "svg", "png")
+# Sube si cambia lo que se guarda como layout (opciones de dot -Txdot)
+LAYOUT_VERSION = "1"
+
+def output_for(pdf_path, fmt):
+    """Ruta de la salida en otro formato del mismo grafo: a.pdf -> a.svg"""
+    return os.path.splitext(pdf_path)[0] + "." + fmt
+
+def open_layout_cache():
+    """Layouts (salida de `dot -Txdot`, con posiciones) por hash del texto DOT."""
+    return BuildCache("dot2pdf-layout", LAYOUT_VERSION)
+
+def time_left(cmd, deadline):
+    """Segundos hasta deadline (time.perf_counter) o None sin límite; agotado, TimeoutExpired."""
+    if deadline is None:
+        return None
+    left = deadline - time.perf_counter()
+    if left <= 0:
+        raise subprocess.TimeoutExpired(cmd, 0)
+    return left
+
+def run_auto_named(cmd, inputs, formats, deadline=None):
+    """
+    `cmd -T<fmt>... -O entrada...`: Graphviz escribe <entrada>.<fmt> junto a
+    cada entrada, así que cada salida sigue ligada a su fichero. Devuelve
+    (segundos, CompletedProcess) o lanza OSError si no se pudo lanzar.
+    Con deadline, el proceso que llega a esa hora se mata y salta TimeoutExpired.
+    """
+    timeout = time_left(cmd, deadline)
+    for path in inputs:
+        for fmt in formats:
+            try:
+                os.remove(f"{path}.{fmt}")  # un resto de otra ejecución no debe contar como salida
+            except FileNotFoundError:
+                pass
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd + [f"-T{fmt}" for fmt in formats] + ["-O"] + list(inputs),
+                          capture_output=True, text=True, timeout=timeout)
+    return time.perf_counter() - t0, proc
+
+def collect_outputs(produced_from, pdf_path, formats):
+    """Mueve <entrada>.<fmt> a la ruta final de cada formato. False si falta alguno."""
+    outs = [f"{produced_from}.{fmt}" for fmt in formats]
+    if not all(os.path.exists(o) for o in outs):
+        return False
+    for out, fmt in zip(outs, formats):
+        os.replace(out, output_for(pdf_path, fmt))
+    return True
+
+def render_one(dot_path, pdf_path, formats, flags=(), deadline=None):
+    """Un .dot sin caché de layout, para tener su propio mensaje de error. Devuelve (error, segundos)."""
+    try:
+        secs, proc = run_auto_named(["dot", *flags], [dot_path], formats, deadline)
+    except OSError as e:
+        return str(e), 0.0
+    if proc.returncode != 0 or not collect_outputs(dot_path, pdf_path, formats):
+        return proc.stderr.strip() or f"dot terminó con código {proc.returncode}", secs
+    return None, secs
+
+def render_batch(pairs, formats=("pdf",), layouts=None, flags=(), timeout=None):
+    """
+    Renderiza varios .dot con un único proceso de Graphviz por paso.
+    pairs: [(ruta_dot, ruta_pdf)]; cada formato extra se escribe junto al pdf.
+    Devuelve [(error, segundos)] en el mismo orden; el tiempo de cada proceso
+    se reparte a partes iguales entre sus grafos.
+
+    `dot -T<fmt>... -O`: un layout por grafo para todos los formatos. Con
+    layouts (una BuildCache), el mismo proceso escribe también el -Txdot (el
+    grafo con posiciones) y se guarda; los grafos cuyo texto ya está en la
+    caché no pasan por dot: se dibujan con `neato -n2`, que usa las
+    posiciones guardadas sin volver a calcularlas. Cada grafo sigue costando
+    un solo proceso de Graphviz, esté o no en la caché.
+    Graphviz deja de leer en el primer .dot con errores: los que se quedan
+    sin salida se renderizan uno a uno, para tener su propio mensaje.
+    flags son opciones extra de dot (los ajustes de LEVELS) y timeout el
+    límite de todo el lote: cada proceso tiene solo lo que les dejen los
+    anteriores y, si se pasa, TimeoutExpired sale de aquí.
+    """
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    results = [None] * len(pairs)
+    try:
+        if layouts is None:
+            secs, _ = run_auto_named(["dot", *flags], [d for d, _ in pairs], formats, deadline)
+            share = secs / len(pairs)
+            for i, (dot_path, pdf_path) in enumerate(pairs):
+                if collect_outputs(dot_path, pdf_path, formats):
+                    results[i] = (None, share)
+        else:
+            _render_with_layouts(pairs, formats, layouts, results, flags, deadline)
+    except OSError as e:
+        return [(str(e), 0.0)] * len(pairs)
+    for i, (dot_path, pdf_path) in enumerate(pairs):
+        if results[i] is None:
+            results[i] = render_one(dot_path, pdf_path, formats, flags, deadline)
+    return results
+
+def layout_key(layouts, text, flags=()):
+    # Un layout hecho con ajustes rebajados no vale para el grafo sin rebajar
+    return layouts.key_for(text if not flags else text + "\0" + " ".join(flags))
+
+def _render_with_layouts(pairs, formats, layouts, results, flags, deadline):
+    # <ruta_dot>.xdot es a la vez la salida de `dot -Txdot -O` y la entrada de neato
+    keys, missing, cached = {}, [], []
+    try:
+        for i, (dot_path, _) in enumerate(pairs):
+            with open(dot_path, "r", encoding="utf-8") as f:
+                keys[dot_path] = layout_key(layouts, f.read(), flags)
+            if layouts.copy_to(keys[dot_path], dot_path + ".xdot"):
+                cached.append(i)
+            else:
+                missing.append(i)
+        profiling.count("layout/hits", len(cached))
+        profiling.count("layout/misses", len(missing))
+        if missing:
+            # Sin layout guardado: dot maqueta una vez y escribe los formatos y el xdot
+            secs, _ = run_auto_named(["dot", *flags], [pairs[i][0] for i in missing],
+                                     ["xdot", *formats], deadline)
+            profiling.add("render/layout", secs, len(missing))
+            share = secs / len(missing)
+            for i in missing:
+                dot_path, pdf_path = pairs[i]
+                if collect_outputs(dot_path, pdf_path, formats):
+                    if os.path.exists(dot_path + ".xdot"):
+                        layouts.put_file(keys[dot_path], dot_path + ".xdot")
+                    results[i] = (None, share)
+        if cached:
+            secs, _ = run_auto_named(["neato", "-n2"], [pairs[i][0] + ".xdot" for i in cached],
+                                     formats, deadline)
+            profiling.add("render/draw", secs, len(cached))
+            share = secs / len(cached)
+            for i in cached:
+                dot_path, pdf_path = pairs[i]
+                if collect_outputs(dot_path + ".xdot", pdf_path, formats):
+                    results[i] = (None, share)
+    finally:
+        for dot_path, _ in pairs:
+            try:
+                os.remove(dot_path + ".xdot")
+            except FileNotFoundError:
+                pass
+
+def render_all(pairs, jobs, batch=BATCH_SIZE, formats=("pdf",), layouts=None):
+    """
+    Renderiza [(ruta_dot, ruta_pdf)] con hasta `jobs` procesos de Graphviz a la
+    vez y como mucho `batch` grafos por proceso. Devuelve [(error, segundos)].
+    """
+    if not pairs:
+        return []
+    # Lotes del mismo tamaño y no más grandes de lo necesario para ocupar los jobs
+    size = max(1, min(batch, -(-len(pairs) // jobs)))
+    chunks = [pairs[i:i + size] for i in range(0, len(pairs), size)]
+    work = partial(render_batch, formats=formats, layouts=layouts)
+    # Son subprocesos, así que basta con hilos para tenerlos en paralelo
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return [r for chunk in pool.map(work, chunks) for r in chunk]
+
+# Ajustes de dot para --budget, del layout normal al más barato. factor es la
+# fracción del coste normal que se espera de cada nivel (estimada, no medida).
+# nslimit/nslimit1 acotan las iteraciones de network simplex (rangos y
+# coordenadas), mclimit y remincross las de reducción de cruces, y
+# splines=line se ahorra el trazado de curvas.
+Level = namedtuple("Level", "name flags factor")
+LEVELS = (
+    Level("normal", (), 1.0),
+    Level("reducido", ("-Gnslimit=2", "-Gnslimit1=2", "-Gmclimit=0.3"), 0.35),
+    Level("mínimo", ("-Gnslimit=0.2", "-Gnslimit1=0.2", "-Gmclimit=0.05",
+                     "-Gremincross=false", "-Gsearchsize=5", "-Gsplines=line"), 0.1),
+)
+# Segundos de layout estimados = COST_BASE + COST_SCALE * (nodos + aristas) ** 1.5:
+# el cruce de aristas y network simplex crecen más que linealmente con el grafo
+COST_BASE = 0.02
+COST_SCALE = 2e-5
+# Por debajo de esta fracción del presupuesto un grafo va en lote, sin vigilarlo uno a uno
+LIGHT_FRACTION = 0.1
+
+_DOT_TOKEN = re.compile(r'/\*.*?\*/|//[^\n]*|"(?:[^"\\]|\\.)*"|<[^<>]*>|-[->]|[\w.]+|[\[\]{};=,]',
+                        re.S)
+_DOT_KEYWORDS = {"strict", "graph", "digraph", "subgraph", "node", "edge"}
+
+def dot_size(text):
+    """(nodos, aristas) de un texto DOT, aproximados y sin Graphviz."""
+    tokens = [t for t in _DOT_TOKEN.findall(text) if not t.startswith(("/*", "//"))]
+    nodes, edges, depth = set(), 0, 0
+    for i, tok in enumerate(tokens):
+        if tok == "[":
+            depth += 1
+        elif tok == "]":
+            depth -= 1
+        elif depth or tok in "{};=,":
+            continue        # dentro de [atributos] o puntuación
+        elif tok in ("->", "--"):
+            edges += 1
+        elif tok.lower() not in _DOT_KEYWORDS:
+            prev = tokens[i - 1].lower() if i else ""
+            nxt = tokens[i + 1] if i + 1 < len(tokens) else ""
+            # Ni nombre de (sub)grafo ni atributo suelto como rankdir=TB
+            if prev not in _DOT_KEYWORDS and prev != "=" and nxt != "=":
+                nodes.add(tok)
+    return len(nodes), edges
+
+def estimate_layout(nodes, edges):
+    """Segundos de layout de dot estimados para un grafo de ese tamaño."""
+    return COST_BASE + COST_SCALE * (nodes + edges) ** 1.5
+
+def pick_level(estimate, budget):
+    """Índice del primer nivel de LEVELS que se espera que quepa en budget."""
+    for k, level in enumerate(LEVELS):
+        if estimate * level.factor <= budget:
+            return k
+    return len(LEVELS) - 1
+
+def render_budgeted(pair, formats, layouts, budget, start):
+    """
+    Renderiza un .dot con los ajustes LEVELS[start]; si sus procesos de
+    Graphviz (maquetar y dibujar, o el reintento de uno a uno) pasan de
+    budget segundos entre todos, se mata el que esté en marcha y se reintenta
+    con el nivel siguiente. Devuelve (error, segundos, nivel usado).
+    """
+    spent = 0.0
+    for k in range(start, len(LEVELS)):
+        t0 = time.perf_counter()
+        try:
+            (err, secs), = render_batch([pair], formats, layouts, LEVELS[k].flags, budget)
+            return err, spent + secs, k
+        except subprocess.TimeoutExpired:
+            spent += time.perf_counter() - t0
+            profiling.count("budget/killed")
+    return (f"no cabe en {budget:g} s ni con los ajustes '{LEVELS[-1].name}' "
+            f"(py2dot --split lo parte por funciones)"), spent, len(LEVELS) - 1
+
+def render_within_budget(pairs, jobs, batch, formats, layouts, budget):
+    """
+    render_all() con un presupuesto de segundos por grafo. El coste de cada
+    .dot se estima por su número de nodos y aristas: los ligeros van en lotes
+    como siempre y el resto de uno en uno, los más caros primero, con los
+    ajustes que se espera que quepan en el presupuesto, matando y
+    reintentando más barato el render que se pase.
+    Devuelve [(error, segundos, nivel, segundos estimados)].
+    """
+    estimates = []
+    for dot_path, _ in pairs:
+        with open(dot_path, "r", encoding="utf-8") as f:
+            estimates.append(estimate_layout(*dot_size(f.read())))
+    light = [i for i, est in enumerate(estimates) if est < budget * LIGHT_FRACTION]
+    heavy = sorted(set(range(len(pairs))) - set(light), key=lambda i: -estimates[i])
+    size = max(1, min(batch, -(-len(light) // jobs))) if light else 1
+    results = [None] * len(pairs)
+
+    def run_light(chunk):
+        # El lote entero tiene de margen el presupuesto más lo estimado para
+        # todos sus grafos; si aun así se pasa, cada uno se repite por su cuenta
+        try:
+            out = render_batch([pairs[i] for i in chunk], formats, layouts,
+                               timeout=budget + sum(estimates[i] for i in chunk))
+            return [(err, secs, 0) for err, secs in out]
+        except subprocess.TimeoutExpired:
+            profiling.count("budget/killed")
+            return [render_budgeted(pairs[i], formats, layouts, budget, 0) for i in chunk]
+
+    def run_heavy(i):
+        return [render_budgeted(pairs[i], formats, layouts, budget,
+                                pick_level(estimates[i], budget))]
+
+    units = [(run_heavy, i, [i]) for i in heavy]
+    units += [(run_light, light[k:k + size], light[k:k + size])
+              for k in range(0, len(light), size)]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [(pool.submit(func, arg), idx) for func, arg, idx in units]
+        for future, idx in futures:
+            for i, (err, secs, level) in zip(idx, future.result()):
+                results[i] = (err, secs, level, estimates[i])
+    return results
+
+async def pipe_render(dot, limit, fmt="pdf"):
+    """
+    DOT (bytes) -> (salida, error, segundos) con `dot -T<fmt>` leyendo de stdin
+    y escribiendo en stdout: ningún fichero intermedio. `limit` es el
+    semáforo que acota los Graphviz simultáneos.
+    """
+    async with limit:
+        t0 = time.perf_counter()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "dot", f"-T{fmt}", stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            return None, str(e), 0.0
+        out, err = await proc.communicate(dot)
+        secs = time.perf_counter() - t0
+    if proc.returncode != 0:
+        msg = err.decode("utf-8", "replace").strip()
+        return None, msg or f"dot terminó con código {proc.returncode}", secs
+    return out, None, secs
+
+async def render_in_order(items, jobs):
+    """
+    Para cada (título, carga, ruta_pdf) de items, carga() -> DOT en bytes (en
+    un hilo: puede ser trabajo de CPU) y lo renderiza a PDF en memoria.
+    Entrega (título, ruta_pdf, pdf, error, segundos) en el orden de items;
+    como mucho 2 x jobs grafos en curso o esperando turno, así la memoria no
+    crece con el lote.
+    """
+    limit = asyncio.Semaphore(jobs)
+
+    async def one(load):
+        try:
+            dot = await asyncio.to_thread(load)
+        except (OSError, SyntaxError, ValueError) as e:
+            return None, f"{e.__class__.__name__}: {e}", 0.0
+        return await pipe_render(dot, limit)
+
+    pending = deque()
+    for title, load, pdf_path in items:
+        pending.append((title, pdf_path, asyncio.ensure_future(one(load))))
+        if len(pending) >= 2 * jobs:
+            title, pdf_path, task = pending.popleft()
+            yield (title, pdf_path, *await task)
+    while pending:
+        title, pdf_path, task = pending.popleft()
+        yield (title, pdf_path, *await task)
+
+def unify_in_memory(items, output_path, jobs=None, stream=False):
+    """
+    Renderiza y une sin tocar el disco más que para el PDF final.
+    items: [(título, carga, ruta_pdf)], con carga() -> DOT en bytes; si
+    ruta_pdf no es None el PDF del grafo también se guarda ahí.
+    Devuelve (páginas, [(título, error)], [(título, ruta_pdf, segundos)]).
+    """
+    jobs = jobs or os.cpu_count() or 1
+    failures, done = [], []
+    merger = StreamingPdfMerger(output_path) if stream else PdfMerger()
+    pages = 0
+
+    async def run():
+        nonlocal pages
+        async for title, pdf_path, pdf, err, secs in render_in_order(items, jobs):
+            profiling.add("render/graphviz", secs)
+            if err is not None:
+                failures.append((title, err))
+                continue
+            if pdf_path is not None:
+                with open(pdf_path, "wb") as f:
+                    f.write(pdf)
+                done.append((title, pdf_path, secs))
+            # Los bytes de Graphviz van directos al documento final
+            with profiling.phase("merge"):
+                if stream:
+                    merger.append(io.BytesIO(pdf), title)
+                else:
+                    merger.append(io.BytesIO(pdf), outline_item=title)
+            pages += 1
+
+    try:
+        with profiling.phase("render+merge"):
+            asyncio.run(run())
+    finally:
+        if stream:
+            merger.close()
+        else:
+            if pages:
+                merger.write(output_path)
+            merger.close()
+    if not pages and stream:
+        os.remove(output_path)
+    return pages, failures, done
+
+MANIFEST_NAME = ".dot2pdf-manifest.json"
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_manifest(folder_path):
+    """Manifiesto: nombre .dot -> {mtime_ns, size, sha256, pdf} del último render correcto."""
+    try:
+        with open(os.path.join(folder_path, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(folder_path, manifest):
+    path = os.path.join(folder_path, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def needs_render(entry, dot_path, pdf_path, formats=("pdf",)):
+    """
+    Decide si hay que volver a renderizar. Devuelve (bool, stat, hash).
+    Si mtime y tamaño coinciden no se lee el fichero; si solo cambió el mtime
+    se compara el hash del contenido. Falta alguna salida de formats: se renderiza.
+    """
+    st = os.stat(dot_path)
+    if entry is None or not all(os.path.exists(output_for(pdf_path, f)) for f in formats):
+        return True, st, None
+    if entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+        return False, st, entry["sha256"]
+    digest = file_sha256(dot_path)
+    return digest != entry["sha256"], st, digest
+
+def remove_outputs(folder_path, names):
+    """Borra las salidas indicadas (nombres dentro de la carpeta). Devuelve las rutas borradas."""
+    removed = []
+    for name in names:
+        path = os.path.join(folder_path, name)
+        try:
+            os.remove(path)
+            removed.append(path)
+        except FileNotFoundError:
+            pass
+    return removed
+
+def prune_stale(folder_path, manifest, dot_files):
+    """Borra los PDF (y demás formatos) generados a partir de .dot que ya no existen."""
+    removed = []
+    for name in sorted(set(manifest) - set(dot_files)):
+        entry = manifest.pop(name)
+        removed += remove_outputs(folder_path, [entry["pdf"]] + entry.get("extra", []))
+    return removed
+
+def merge_pdfs(pdf_files, output_path, titles, stream=False):
+    """Une los PDF en output_path con una entrada de índice por fichero."""
+    if stream:
+        # Un documento abierto cada vez: la memoria no crece con el total
+        merger = StreamingPdfMerger(output_path)
+        for pdf, title in zip(pdf_files, titles):
+            merger.append(pdf, title)
+        merger.close()
+        return
+
+    merger = PdfMerger()
+    for pdf, title in zip(pdf_files, titles):
+        merger.append(pdf, outline_item=title)
+    merger.write(output_path)
+    merger.close()
+
+def list_dot_files(folder_path, cat=None):
+    """
+    Nombres de los .dot de la carpeta, ordenados (el orden del PDF final es
+    estable). Con cat se toman del catálogo en vez de listar la carpeta
+    (incluidos los grafos por función de py2dot --split): solo se comprueba
+    que cada uno sigue existiendo.
+    """
+    if cat is None:
+        return sorted(f for f in os.listdir(folder_path) if f.endswith(".dot"))
+    return [os.path.basename(p) for p in cat.artifacts_in(folder_path, "dot") if os.path.isfile(p)]
+
+def record_pdfs(cat, done, formats=("pdf",)):
+    """
+    Anota en el catálogo los renders: [(ruta_dot, ruta_pdf, segundos)], en
+    cada formato. El catálogo se abre con best_effort (catalog.from_args):
+    si la base falla se avisa y el render, que ya está hecho, no se pierde.
+    """
+    for dot_path, pdf_path, secs in done:
+        origin = cat.origin_of(dot_path)
+        if origin is None:
+            continue    # un .dot que no generó ninguna herramienta no tiene fuente que anotar
+        source, kind = origin
+        # El render de un grafo de --split ("dot:area") es "pdf:area"
+        graph = kind[len("dot"):] if kind.startswith("dot") else ""
+        for fmt in formats:
+            cat.record_artifact(source, fmt + graph, output_for(pdf_path, fmt), "dot2pdf", secs)
+    cat.commit()
+
+def unify_dot_to_pdf(folder_path, output_pdf="unificado.pdf", jobs=None, force=False,
+                     stream=False, cat=None, from_catalog=False, in_memory=False,
+                     keep_pdfs=False, batch=BATCH_SIZE, formats=("pdf",), layout_cache=True,
+                     budget=None):
+    # 1. Buscar todos los .dot en la carpeta, o en el catálogo con from_catalog
+    with profiling.phase("list"):
+        dot_files = list_dot_files(folder_path, cat if from_catalog else None)
     if not dot_files:
         print("No se encontraron archivos .dot en la carpeta.")
-        return
-    
-    pdf_files = []
-    
+        return []
+
+    profiling.count("dot_files", len(dot_files))
+
+    if in_memory:
+        # Sin manifiesto ni PDF por grafo (salvo keep_pdfs): cada .dot va por
+        # stdin a Graphviz y el PDF vuelve por stdout directo a la unión
+        return unify_dot_in_memory(folder_path, dot_files, output_pdf, jobs, stream, cat,
+                                   keep_pdfs)
+
+    # 2. Consultar el manifiesto: solo se renderizan los .dot nuevos o modificados
+    with profiling.phase("manifest"):
+        # Con force se renderiza todo, pero el manifiesto sigue diciendo qué
+        # salidas hay en la carpeta para podar las que sobren
+        manifest = load_manifest(folder_path)
+        existing = dot_files
+        if from_catalog:
+            # Un .dot que no está en el catálogo (p. ej. los .fn.*.dot de --split)
+            # no es obsoleto: su PDF solo sobra si el .dot ya no existe
+            existing = set(dot_files) | {n for n in manifest
+                                         if os.path.exists(os.path.join(folder_path, n))}
+        for pdf_path in prune_stale(folder_path, manifest, existing):
+            print(f"Eliminada salida obsoleta: {pdf_path}")
+
+        all_pdfs = []
+        tasks = []
+        for dot_file in dot_files:
+            dot_path = os.path.join(folder_path, dot_file)
+            pdf_name = os.path.splitext(dot_file)[0] + ".pdf"
+            pdf_path = os.path.join(folder_path, pdf_name)
+            all_pdfs.append(pdf_path)
+            stale, st, digest = needs_render(None if force else manifest.get(dot_file),
+                                             dot_path, pdf_path, formats)
+            if stale:
+                tasks.append((dot_file, dot_path, pdf_path, st))
+            else:
+                manifest[dot_file].update(mtime_ns=st.st_mtime_ns, size=st.st_size, sha256=digest)
+
+    # 3. Convertir .dot a .pdf usando Graphviz, varios procesos a la vez y
+    #    varios grafos por proceso (el arranque de dot pesa más que un grafo pequeño).
+    #    Con la caché de layouts, un grafo ya maquetado solo se dibuja. Con un
+    #    presupuesto, los grafos grandes se maquetan con ajustes más baratos.
+    jobs = jobs or os.cpu_count() or 1
+    layouts = open_layout_cache() if layout_cache and tasks else None
+    pairs = [(t[1], t[2]) for t in tasks]
+    try:
+        with profiling.phase("render"):
+            if budget is None:
+                rendered = [r + (0, None) for r in
+                            render_all(pairs, jobs, batch, formats, layouts)]
+            else:
+                rendered = render_within_budget(pairs, jobs, batch, formats, layouts, budget)
+    finally:
+        if layouts is not None:
+            layouts.close()
+    # Tiempo de cada subproceso dot sumado (con -j > 1 supera al de la fase render)
+    profiling.add("render/graphviz", sum(r[1] for r in rendered), len(rendered))
+    profiling.count("rendered", len(rendered))
+
+    failed = set()
+    failures = []
+    done = []
+    for (dot_file, dot_path, pdf_path, st), (err, secs, level, estimate) in zip(tasks, rendered):
+        if err is None:
+            done.append((dot_path, pdf_path, secs))
+            extra = [os.path.basename(output_for(pdf_path, f)) for f in formats if f != "pdf"]
+            # Formatos de un render anterior que ya no se piden: sin entrada, nadie los podaría
+            old = manifest.get(dot_file, {}).get("extra", [])
+            for path in remove_outputs(folder_path, [e for e in old if e not in extra]):
+                print(f"Eliminada salida obsoleta: {path}")
+            manifest[dot_file] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size,
+                                  "sha256": file_sha256(dot_path),
+                                  "pdf": os.path.basename(pdf_path),
+                                  "extra": extra}
+            if level:
+                # Se guarda para que el aviso siga mientras se reutilice ese PDF
+                manifest[dot_file]["degraded"] = {"level": LEVELS[level].name,
+                                                  "estimate": round(estimate, 3),
+                                                  "budget": budget}
+        else:
+            manifest.pop(dot_file, None)
+            failed.add(pdf_path)
+            failures.append((dot_path, err))
+    with profiling.phase("manifest/save"):
+        save_manifest(folder_path, manifest)
+    if cat is not None:
+        with profiling.phase("catalog"):
+            record_pdfs(cat, done, formats)
+    pdf_files = [p for p in all_pdfs if p not in failed]
+
+    for dot_path, err in failures:
+        print(f"Error al renderizar {dot_path}: {err}", file=sys.stderr)
+
+    if not pdf_files:
+        print("No se pudo renderizar ningún .dot.")
+        return failures
+
+    # 4. Unir todos los PDFs en uno solo, con una entrada de índice por .dot
+    output_path = os.path.join(folder_path, output_pdf)
+    titles = [os.path.splitext(os.path.basename(p))[0] + ".dot" for p in pdf_files]
+    degraded = [(t, manifest[t]["degraded"]) for t in titles
+                if "degraded" in manifest.get(t, {})]
+    marks = dict(degraded)
+    # En el índice del PDF también se ve qué página no tiene el layout completo
+    titles = [f"{t} [{marks[t]['level']}]" if t in marks else t for t in titles]
+    with profiling.phase("merge"):
+        merge_pdfs(pdf_files, output_path, titles, stream)
+    profiling.count("merged", len(pdf_files))
+
+    print(f"PDF unificado generado en: {output_path} "
+          f"({len(pdf_files)} grafos, {len(tasks)} renderizados, {len(failures)} con errores, "
+          f"pico de memoria {peak_rss_mib():.1f} MiB)")
+    if degraded:
+        profiling.count("degraded", len(degraded))
+        print(f"{len(degraded)} grafos con layout rebajado para caber en el presupuesto:")
+        for title, info in degraded:
+            print(f"  {title}: ajustes '{info['level']}' (estimado {info['estimate']:.1f} s, "
+                  f"presupuesto {info['budget']:g} s)")
+    return failures
+
+def unify_dot_in_memory(folder_path, dot_files, output_pdf, jobs, stream, cat, keep_pdfs):
+    def reader(path):
+        def load():
+            with open(path, "rb") as f:
+                return f.read()
+        return load
+
+    items = []
     for dot_file in dot_files:
         dot_path = os.path.join(folder_path, dot_file)
-        pdf_path = os.path.join(folder_path, os.path.splitext(dot_file)[0] + ".pdf")
-        # 2. Convertir .dot a .pdf usando Graphviz
-        subprocess.run(["dot", "-Tpdf", dot_path, "-o", pdf_path], check=True)
-        pdf_files.append(pdf_path)
-    
-    # 3. Unir todos los PDFs en uno solo
-    merger = PdfMerger()
-    for pdf in pdf_files:
-        merger.append(pdf)
-    
+        pdf_path = os.path.splitext(dot_path)[0] + ".pdf" if keep_pdfs else None
+        items.append((dot_file, reader(dot_path), pdf_path))
     output_path = os.path.join(folder_path, output_pdf)
-    merger.write(output_path)
-    merger.close()
-    
-    print(f"PDF unificado generado en: {output_path}")
+    pages, failures, done = unify_in_memory(items, output_path, jobs, stream)
+    profiling.count("merged", pages)
+    if cat is not None and done:
+        record_pdfs(cat, [(os.path.join(folder_path, t), p, secs) for t, p, secs in done])
+
+    for dot_file, err in failures:
+        print(f"Error al renderizar {os.path.join(folder_path, dot_file)}: {err}", file=sys.stderr)
+    if not pages:
+        print("No se pudo renderizar ningún .dot.")
+        return failures
+    print(f"PDF unificado generado en: {output_path} "
+          f"({pages} grafos en memoria, {len(failures)} con errores, "
+          f"pico de memoria {peak_rss_mib():.1f} MiB)")
+    return failures
+
+def parse_formats(text):
+    formats = [f.strip().lower() for f in text.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"formato desconocido: {', '.join(unknown)} (válidos: {', '.join(FORMATS)})")
+    # El pdf va siempre y primero: es el que se une
+    return ["pdf"] + [f for f in dict.fromkeys(formats) if f != "pdf"]
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Uso: python unify_dot.py <ruta_carpeta_con_dot>")
-        sys.exit(1)
-    
-    folder = sys.argv[1]
-    unify_dot_to_pdf(folder)
+    parser = argparse.ArgumentParser(description="Renderiza los .dot de una carpeta y los une en un PDF.")
+    parser.add_argument("carpeta", help="ruta de la carpeta con los .dot")
+    parser.add_argument("-o", "--output", default="unificado.pdf",
+                        help="nombre del PDF unificado (dentro de la carpeta)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="renders de Graphviz simultáneos (por defecto: nº de CPUs)")
+    parser.add_argument("--force", action="store_true",
+                        help="ignorar el manifiesto y renderizar todos los .dot")
+    parser.add_argument("--stream", action="store_true",
+                        help="unir en streaming con memoria acotada (para miles de PDFs)")
+    parser.add_argument("--from-catalog", action="store_true",
+                        help="tomar la lista de .dot del catálogo en lugar de listar la carpeta")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="pasar cada .dot a Graphviz por stdin y unir el PDF que devuelve "
+                             "por stdout, sin escribir un .pdf por grafo (ni usar el manifiesto)")
+    parser.add_argument("--keep-pdfs", action="store_true",
+                        help="con --in-memory, guardar también el .pdf de cada grafo")
+    parser.add_argument("--formats", type=parse_formats, default=["pdf"],
+                        help="formatos de cada grafo, separados por comas, de: "
+                             f"{', '.join(FORMATS)} (el pdf siempre, para unirlo)")
+    parser.add_argument("--no-layout-cache", action="store_true",
+                        help="maquetar cada grafo cada vez, sin guardar ni reutilizar layouts")
+    parser.add_argument("--budget", type=float, default=None, metavar="SEGUNDOS",
+                        help="tiempo máximo de Graphviz por grafo: los grafos grandes se "
+                             "maquetan con ajustes más baratos y el render que se pasa se "
+                             "mata y se repite más barato (los PDF rebajados se reutilizan "
+                             "hasta que cambie su .dot o con --force)")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE,
+                        help="grafos por proceso de Graphviz; 1 = un proceso por .dot "
+                             f"(por defecto: {BATCH_SIZE})")
+    profiling.add_arguments(parser)
+    catalog.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.start_from_args(args, "dot2pdf")
+    cat = catalog.from_args(args)
+    if args.from_catalog and cat is None:
+        parser.error("--from-catalog necesita el catálogo")
+    if args.budget is not None and (args.budget <= 0 or args.in_memory):
+        parser.error("--budget necesita un número de segundos positivo y no va con --in-memory")
+
+    try:
+        failures = unify_dot_to_pdf(args.carpeta, args.output, args.jobs, args.force,
+                                    args.stream, cat, args.from_catalog, args.in_memory,
+                                    args.keep_pdfs, max(1, args.batch), args.formats,
+                                    not args.no_layout_cache, args.budget)
+    finally:
+        if cat is not None:
+            cat.close()
+    if failures:
+        sys.exit(2)
@@ -0,0 +1,881 @@
+#!/usr/bin/env python3
+"""
+flowir.py
+Representación intermedia (IR) del diagrama de flujo de un fichero Python,
+compartida por py2dot.py (DOT), py2draw.py (draw.io) y py_to_dot.py (cadena lineal).
+
+El árbol se recorre una sola vez por fichero; cada generador es después un
+serializador sobre el FlowGraph resultante.
+
+Representación:
+ - Nodos en arrays paralelos (tipo, flags, profundidad, span) + lista de etiquetas.
+   El índice del nodo es su identificador y sigue el orden del código fuente.
+ - Aristas en tres arrays (origen, destino, tipo); las etiquetas libres de arista
+   (poco frecuentes) van en un dict aparte.
+ - Grupos: rangos contiguos de nodos [inicio, fin) con el cuerpo de un bucle,
+   función o clase (los serializadores los usan como clusters).
+ - Las cadenas if/elif sobre el mismo sujeto (x == 1, x == 2, ...) y los match
+   se representan con un único nodo de decisión múltiple: una arista CASE
+   etiquetada por rama y una sola unión al final (multiway=False mantiene
+   las cadenas if/elif como diamantes anidados, con su condición completa).
+Limitaciones:
+ - No es un CFG completo: las excepciones salen siempre de la cabecera del try.
+ - Los import se ignoran.
+ - Las definiciones (def/class) cuelgan su cuerpo de la cabecera; el flujo del
+   módulo continúa desde la cabecera, no desde el final del cuerpo.
+"""
+
+import io
+import re
+import ast
+import hashlib
+import tokenize
+from array import array
+from collections import OrderedDict
+
+import profiling
+
+# Tipos de nodo
+START, END, STMT, DECISION, LOOP, JOIN, HEADER = range(7)
+KIND_NAMES = ("start", "end", "stmt", "decision", "loop", "join", "header")
+
+# Flags de nodo
+F_IO = 1
+
+# Tipos de arista
+NEXT, TRUE, FALSE, BACK, DONE, EXCEPT, CASE = range(7)
+
+# Tipos de grupo
+G_WHILE, G_FOR, G_FUNCTION, G_CLASS = range(4)
+
+# Longitud máxima de una etiqueta (en caracteres, tras colapsar espacios)
+LABEL_LIMIT = 200
+
+# Número mínimo de condiciones de una cadena if/elif para usar decisión múltiple
+MULTIWAY_MIN = 3
+
+
+class FlowGraph:
+    """Grafo de flujo compacto: arrays paralelos en lugar de un objeto por nodo."""
+
+    __slots__ = ("kinds", "flags", "depths", "spans", "labels",
+                 "esrc", "edst", "ekinds", "elabels", "groups")
+
+    def __init__(self):
+        self.kinds = array("B")
+        self.flags = array("B")
+        self.depths = array("I")
+        self.spans = array("i")    # 4 por nodo: lineno, col, end_lineno, end_col
+        self.labels = []
+        self.esrc = array("i")
+        self.edst = array("i")
+        self.ekinds = array("B")
+        self.elabels = {}          # índice de arista -> texto
+        self.groups = []           # (tipo, primer_nodo, fin_exclusivo, etiqueta)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @property
+    def num_edges(self):
+        return len(self.esrc)
+
+    def add_node(self, kind, label, span=(0, 0, 0, 0), depth=0, io=False):
+        self.kinds.append(kind)
+        self.flags.append(F_IO if io else 0)
+        self.depths.append(depth)
+        self.spans.extend(span)
+        self.labels.append(label)
+        return len(self.kinds) - 1
+
+    def add_edge(self, src, dst, kind=NEXT, label=None):
+        self.esrc.append(src)
+        self.edst.append(dst)
+        self.ekinds.append(kind)
+        if label is not None:
+            self.elabels[len(self.esrc) - 1] = label
+
+    def is_io(self, i):
+        return bool(self.flags[i] & F_IO)
+
+    def span(self, i):
+        return tuple(self.spans[4 * i:4 * i + 4])
+
+    def edges(self):
+        """Itera (origen, destino, tipo, etiqueta) en orden de creación."""
+        labels = self.elabels
+        for i, (s, d, k) in enumerate(zip(self.esrc, self.edst, self.ekinds)):
+            yield s, d, k, labels.get(i)
+
+
+# -------------------------
+# AST helpers
+# -------------------------
+
+def is_io_call(node):
+    """True si la sentencia contiene input(), print() o *.write()."""
+    for child in ast.walk(node):
+        if isinstance(child, ast.Call):
+            f = child.func
+            if isinstance(f, ast.Name) and f.id in ("input", "print"):
+                return True
+            if isinstance(f, ast.Attribute) and getattr(f, "attr", "").lower() == "write":
+                return True
+    return False
+
+
+def clip(text, start=0, stop=None, limit=LABEL_LIMIT):
+    """
+    text[start:stop] en una sola línea (espacios colapsados) y truncado a limit.
+    Se trocea antes de unir: solo se procesa lo necesario para llenar la
+    etiqueta, no el tramo entero (que en un if puede ser todo su cuerpo).
+    """
+    stop = len(text) if stop is None else stop
+    chunk = max(2 * limit, 64)
+    while True:
+        end = min(stop, start + chunk)
+        s = " ".join(text[start:end].split())
+        if end >= stop or len(s) > limit:
+            break
+        chunk *= 2
+    if len(s) > limit:
+        s = s[:limit - 3] + "..."
+    return s
+
+
+class SourceIndex:
+    """Índice de inicios de línea: convierte (línea, columna) del AST en offsets del texto."""
+
+    __slots__ = ("text", "starts")
+
+    def __init__(self, text):
+        self.text = text
+        starts = array("q", [0])
+        find = text.find
+        pos = find("\n")
+        while pos != -1:
+            starts.append(pos + 1)
+            pos = find("\n", pos + 1)
+        self.starts = starts
+
+    def offset(self, lineno, col):
+        start = self.starts[lineno - 1]
+        if col == 0:
+            return start
+        # col_offset va en bytes UTF-8; solo hay que convertir si la línea no es ASCII
+        head = self.text[start:start + col]
+        if head.isascii():
+            return start + col
+        end = self.text.find("\n", start)
+        line = self.text[start:end if end != -1 else len(self.text)]
+        return start + len(line.encode("utf-8")[:col].decode("utf-8", "ignore"))
+
+    def segment(self, node, limit=LABEL_LIMIT):
+        """Texto fuente de node, recortado a una etiqueta de como mucho limit caracteres."""
+        a = self.offset(node.lineno, node.col_offset)
+        b = self.offset(node.end_lineno, node.end_col_offset)
+        return clip(self.text, a, b, limit)
+
+
+def span_of(node):
+    return (getattr(node, "lineno", 0) or 0, getattr(node, "col_offset", 0) or 0,
+            getattr(node, "end_lineno", 0) or 0, getattr(node, "end_col_offset", 0) or 0)
+
+
+# -------------------------
+# Builder
+# -------------------------
+
+class FlowBuilder(ast.NodeVisitor):
+    is_io_call = staticmethod(is_io_call)
+
+    def __init__(self, src_text=None, multiway=True):
+        self.g = FlowGraph()
+        self.src = src_text
+        self.multiway = multiway
+        self.index = SourceIndex(src_text) if src_text else None
+        self.depth = 0
+        # "tails": (nodo, tipo de arista) donde se engancha la siguiente sentencia
+        self.tails = []
+        # bucles abiertos: [nodo_condición, tails de los break]
+        self.loops = []
+        if profiling.enabled():
+            # Con --profile se miden aparte etiquetas, ast.unparse y detección de E/S
+            self.text_of = profiling.timed(self.text_of, "build/labels")
+            self.code_of = profiling.timed(self.code_of, "build/unparse")
+            self.is_io_call = profiling.timed(is_io_call, "build/io")
+
+    def code_of(self, node):
+        # Use ast.unparse if available (py3.9+)
+        try:
+            s = ast.unparse(node)
+        except Exception:
+            # Fallback naive: try to get source segment
+            try:
+                s = ast.get_source_segment(self.src, node) or node.__class__.__name__
+            except Exception:
+                s = node.__class__.__name__
+        return s
+
+    def text_of(self, node):
+        """Etiqueta de node sacada del fuente: coste proporcional a la etiqueta, no al nodo."""
+        if self.index is not None and getattr(node, "end_lineno", None) is not None:
+            return self.index.segment(node)
+        return clip(self.code_of(node))
+
+    def new_node(self, kind, label, node=None, io=False):
+        span = span_of(node) if node is not None else (0, 0, 0, 0)
+        return self.g.add_node(kind, label, span, self.depth, io)
+
+    def attach(self, n):
+        """Conecta los tails actuales con n y deja n como único tail."""
+        for tail, kind in self.tails:
+            self.g.add_edge(tail, n, kind)
+        self.tails = [(n, NEXT)]
+
+    def build(self, node):
+        start = self.new_node(START, "INICIO")
+        self.tails = [(start, NEXT)]
+        if isinstance(node, ast.Module):
+            self.run(self.process_block(node.body))
+        else:
+            self.run(self.visit(node))
+        end = self.new_node(END, "FIN")
+        self.attach(end)
+        return self.g
+
+    # Recorrido sin recursión: las sentencias compuestas son generadores que
+    # hacen `yield` del bloque anidado que hay que procesar antes de seguir.
+    # run() los apila en una lista, así que la profundidad de anidamiento solo
+    # está limitada por la memoria (no por la pila de Python ni la de C).
+    def run(self, work):
+        if work is None:
+            return
+        stack = [work]
+        while stack:
+            try:
+                sub = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+            stack.append(sub)
+
+    def process_block(self, stmts):
+        for stmt in stmts:
+            sub = self.visit(stmt)
+            if sub is not None:
+                yield sub
+
+    def nested_block(self, stmts):
+        self.depth += 1
+        yield self.process_block(stmts)
+        self.depth -= 1
+
+    def join(self, tails):
+        """Nodo de unión para varias ramas; sin ramas vivas el flujo se corta."""
+        self.tails = tails
+        if tails:
+            self.attach(self.new_node(JOIN, ""))
+
+    # Sentencias simples
+    def generic_simple_stmt(self, node, label=None):
+        lab = label if label is not None else self.text_of(node)
+        self.attach(self.new_node(STMT, lab, node, io=self.is_io_call(node)))
+
+    def visit_Import(self, node):
+        # No hacemos nada, se ignora
+        pass
+
+    def visit_ImportFrom(self, node):
+        # No hacemos nada, se ignora
+        pass
+
+    def visit_Return(self, node):
+        self.generic_simple_stmt(node)
+        # return ends the flow: no tails continue through
+        self.tails = []
+
+    visit_Raise = visit_Return
+
+    def visit_Break(self, node):
+        self.generic_simple_stmt(node)
+        if self.loops:
+            self.loops[-1][1].extend(self.tails)
+        self.tails = []
+
+    def visit_Continue(self, node):
+        self.generic_simple_stmt(node)
+        if self.loops:
+            for tail, _ in self.tails:
+                self.g.add_edge(tail, self.loops[-1][0], BACK)
+        self.tails = []
+
+    # Estructuras de control
+    def visit_If(self, node):
+        ladder = self.if_ladder(node) if self.multiway else None
+        if ladder is not None:
+            subject, branches, orelse = ladder
+            if orelse:
+                branches.append(("else", orelse))
+            return self._multiway(node, self.text_of(subject), branches, bool(orelse))
+        return self._if(node)
+
+    def _if(self, node):
+        cond_n = self.new_node(DECISION, self.text_of(node.test), node)
+        self.attach(cond_n)
+
+        self.tails = [(cond_n, TRUE)]
+        yield self.nested_block(node.body)
+        true_tails = self.tails
+
+        self.tails = [(cond_n, FALSE)]
+        yield self.nested_block(node.orelse)
+        false_tails = self.tails
+
+        self.join(true_tails + false_tails)
+
+    def if_ladder(self, node):
+        """
+        Si node empieza una cadena if/elif de al menos MULTIWAY_MIN
+        comparaciones con el mismo lado izquierdo (nota >= 9, nota >= 7, ...),
+        devuelve (sujeto, [(etiqueta, cuerpo)], cuerpo_del_else). Si no, None.
+        Si la cadena sigue con otra condición (elif z == 1:, elif flag:), el
+        else es ese resto, un If que se visita aparte: cada elif se examina
+        una sola vez y las cadenas largas se construyen en tiempo lineal.
+        """
+        subject = key = None
+        branches = []
+        n = node
+        while True:
+            test = n.test
+            if not isinstance(test, ast.Compare) or isinstance(test.left, ast.Constant):
+                orelse = [n]
+                break
+            k = ast.dump(test.left)
+            if key is None:
+                subject, key = test.left, k
+            elif k != key:
+                orelse = [n]
+                break
+            branches.append((self.rest_of(test, test.left), n.body))
+            if len(n.orelse) == 1 and isinstance(n.orelse[0], ast.If):
+                n = n.orelse[0]
+                continue
+            orelse = n.orelse
+            break
+        if len(branches) < MULTIWAY_MIN:
+            return None
+        return subject, branches, orelse
+
+    def rest_of(self, test, left):
+        """Texto de la comparación test sin su lado izquierdo ("== 1", ">= 9")."""
+        if self.index is not None and getattr(test, "end_lineno", None) is not None:
+            a = self.index.offset(left.end_lineno, left.end_col_offset)
+            b = self.index.offset(test.end_lineno, test.end_col_offset)
+            return clip(self.index.text, a, b)
+        return clip(self.code_of(test)[len(self.code_of(left)):])
+
+    def _multiway(self, node, label, branches, exhaustive):
+        """
+        Decisión múltiple: una arista CASE etiquetada por rama y una sola unión.
+        Si las ramas no cubren todos los casos (exhaustive=False), una arista
+        "else" va directa a la unión.
+        """
+        sw = self.new_node(DECISION, label, node)
+        self.attach(sw)
+        tails = []
+        empty = []   # ramas sin nodos propios (solo imports): van directas a la unión
+        for case_label, body in branches:
+            first_edge = self.g.num_edges
+            self.tails = [(sw, CASE)]
+            yield self.nested_block(body)
+            if self.g.num_edges > first_edge:
+                # La primera arista creada en el cuerpo es siempre la que sale de sw
+                self.g.elabels[first_edge] = case_label
+                tails.extend(self.tails)
+            else:
+                empty.append(case_label)
+        if not exhaustive:
+            empty.append("else")
+        self.tails = tails
+        if tails or empty:
+            join_n = self.new_node(JOIN, "")
+            self.attach(join_n)
+            for case_label in empty:
+                self.g.add_edge(sw, join_n, CASE, case_label)
+
+    def visit_Match(self, node):
+        branches = []
+        exhaustive = False
+        for case in node.cases:
+            label = self.text_of(case.pattern)
+            if case.guard is not None:
+                label = clip(f"{label} if {self.text_of(case.guard)}")
+            branches.append((label, case.body))
+            # `case _:` o `case x:` sin guarda lo captura todo
+            if (case.guard is None and isinstance(case.pattern, ast.MatchAs)
+                    and case.pattern.pattern is None):
+                exhaustive = True
+                break   # los case siguientes no se alcanzan nunca
+        label = clip("match " + self.text_of(node.subject))
+        return self._multiway(node, label, branches, exhaustive)
+
+    def _loop(self, node, label, group_kind, exit_kind):
+        cond_n = self.new_node(LOOP, label, node)
+        self.attach(cond_n)
+
+        first = len(self.g)
+        self.loops.append([cond_n, []])
+        self.tails = [(cond_n, TRUE)]
+        yield self.nested_block(node.body)
+        for tail, kind in self.tails:
+            self.g.add_edge(tail, cond_n, BACK if kind == NEXT else kind)
+        self.g.groups.append((group_kind, first, len(self.g), label))
+        breaks = self.loops.pop()[1]
+
+        # else del bucle: solo al salir sin break
+        self.tails = [(cond_n, exit_kind)]
+        yield self.nested_block(node.orelse)
+        self.join(self.tails + breaks)
+
+    def visit_While(self, node):
+        return self._loop(node, self.text_of(node.test), G_WHILE, FALSE)
+
+    def visit_For(self, node):
+        label = clip(f"for {self.text_of(node.target)} in {self.text_of(node.iter)}")
+        return self._loop(node, label, G_FOR, DONE)
+
+    visit_AsyncFor = visit_For
+
+    def visit_Try(self, node):
+        try_n = self.new_node(HEADER, "try", node)
+        self.attach(try_n)
+
+        yield self.nested_block(node.body)
+        yield self.nested_block(node.orelse)
+        tails = self.tails
+
+        for handler in node.handlers:
+            label = "except"
+            if handler.type is not None:
+                label += " " + self.text_of(handler.type)
+            if handler.name:
+                label += f" as {handler.name}"
+            self.tails = [(try_n, EXCEPT)]
+            self.attach(self.new_node(HEADER, label, handler))
+            yield self.nested_block(handler.body)
+            tails = tails + self.tails
+
+        self.tails = tails
+        if node.finalbody:
+            self.attach(self.new_node(HEADER, "finally"))
+            yield self.nested_block(node.finalbody)
+        self.join(self.tails)
+
+    visit_TryStar = visit_Try
+
+    def visit_With(self, node):
+        items = []
+        for item in node.items:
+            text = self.text_of(item.context_expr)
+            if item.optional_vars is not None:
+                text += " as " + self.text_of(item.optional_vars)
+            items.append(text)
+        label = clip("with " + ", ".join(items))
+        self.attach(self.new_node(HEADER, label, node))
+        yield self.nested_block(node.body)
+
+    visit_AsyncWith = visit_With
+
+    def _definition(self, node, label, group_kind):
+        head = self.new_node(HEADER, label, node)
+        self.attach(head)
+        saved_loops = self.loops
+        self.loops = []
+        first = len(self.g)
+        yield self.nested_block(node.body)
+        self.g.groups.append((group_kind, first, len(self.g), label))
+        self.loops = saved_loops
+        # El cuerpo no se ejecuta al definirlo: el flujo sigue desde la cabecera
+        self.tails = [(head, NEXT)]
+
+    def visit_FunctionDef(self, node):
+        prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+        # ast.arguments no tiene posición: se usa unparse, que solo cubre la cabecera
+        label = clip(f"{prefix} {node.name}({self.code_of(node.args)})")
+        return self._definition(node, label, G_FUNCTION)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        bases = [self.text_of(b) for b in node.bases + node.keywords]
+        label = clip(f"class {node.name}({', '.join(bases)})" if bases else f"class {node.name}")
+        return self._definition(node, label, G_CLASS)
+
+    # fallback
+    def generic_visit(self, node):
+        # For any other node types, try to create a simple node with its code
+        if isinstance(node, ast.stmt):
+            self.generic_simple_stmt(node)
+            return None
+        return self.process_block([c for c in ast.iter_child_nodes(node)
+                                   if isinstance(c, ast.stmt)])
+
+
+# -------------------------
+# Parsing
+# -------------------------
+
+def _parse_flat_elif(src, filename):
+    """
+    ast.parse() para cadenas if/elif muy largas.
+    El parser de CPython anida un If por cada elif y con unos pocos miles se
+    queda sin pila (RecursionError / MemoryError). Aquí cada `elif` se reescribe
+    como `if  ` (mismo ancho: las columnas no cambian), con lo que la cadena se
+    parsea como ifs hermanos, y después se vuelve a encadenar cada uno en el
+    orelse del anterior, de forma iterativa.
+    """
+    lines = src.splitlines(keepends=True)
+    elifs = set()
+    for tok in tokenize.generate_tokens(io.StringIO(src).readline):
+        if tok.type == tokenize.NAME and tok.string == "elif":
+            row, col = tok.start
+            line = lines[row - 1]
+            lines[row - 1] = line[:col] + "if  " + line[col + 4:]
+            # col_offset del AST va en bytes UTF-8
+            elifs.add((row, len(line[:col].encode("utf-8"))))
+    tree = ast.parse("".join(lines), filename=filename)
+
+    # Primero se recogen las listas de sentencias (el árbol aún es plano) y
+    # luego se reencadenan; hacerlo durante el walk visitaría cada if varias veces
+    blocks = []
+    for node in ast.walk(tree):
+        for field in ("body", "orelse", "finalbody"):
+            stmts = getattr(node, field, None)
+            if isinstance(stmts, list) and len(stmts) > 1:
+                blocks.append(stmts)
+    for stmts in blocks:
+        out = []
+        prev_if = None
+        for stmt in stmts:
+            is_if = isinstance(stmt, ast.If)
+            if is_if and prev_if is not None and (stmt.lineno, stmt.col_offset) in elifs:
+                prev_if.orelse = [stmt]
+            else:
+                out.append(stmt)
+            prev_if = stmt if is_if else None
+        stmts[:] = out
+    return tree
+
+
+def parse_source(src, filename="<string>"):
+    try:
+        return ast.parse(src, filename=filename)
+    except (RecursionError, MemoryError):
+        return _parse_flat_elif(src, filename)
+
+
+def build_flow(src, filename="<string>", multiway=True):
+    """Texto fuente -> FlowGraph."""
+    with profiling.phase("parse"):
+        tree = parse_source(src, filename)
+    with profiling.phase("build"):
+        g = FlowBuilder(src, multiway).build(tree)
+    profiling.count("nodes", len(g))
+    profiling.count("edges", g.num_edges)
+    return g
+
+
+# -------------------------
+# Compactación en bloques básicos
+# -------------------------
+
+def compact_blocks(g, keep_io=True):
+    """
+    Devuelve un FlowGraph nuevo con:
+     - las uniones (JOIN) de un solo predecesor eliminadas: la arista que
+       entraba pasa a apuntar al sucesor;
+     - cada tramo lineal máximo de sentencias simples fusionado en un único
+       nodo STMT (bloque básico) con una línea por sentencia.
+    Un tramo no cruza el inicio/fin de un grupo (cuerpo de bucle, def, class)
+    ni cambia de profundidad. Con keep_io=True un bloque nunca mezcla E/S con
+    cálculo (las E/S consecutivas forman su propio bloque), así que se sigue
+    pudiendo dibujar como paralelogramo.
+    """
+    with profiling.phase("compact"):
+        return _compact_blocks(g, keep_io)
+
+
+def _compact_blocks(g, keep_io):
+    n = len(g)
+    kinds, esrc, edst, ekinds = g.kinds, g.esrc, g.edst, g.ekinds
+    indeg = array("i", [0]) * n
+    outdeg = array("i", [0]) * n
+    out_edge = array("i", [-1]) * n   # única arista de salida (si outdeg == 1)
+    for e in range(len(esrc)):
+        outdeg[esrc[e]] += 1
+        indeg[edst[e]] += 1
+        out_edge[esrc[e]] = e
+
+    # 1. Uniones que sobran: un predecesor y un sucesor. Se conserva la que
+    #    uniría dos aristas con tipo propio (p. ej. False que entra y vuelta atrás)
+    dropped = bytearray(n)
+    for j in range(n):
+        if kinds[j] == JOIN and indeg[j] == 1 and outdeg[j] == 1:
+            if g.elabels.get(out_edge[j]) is None and ekinds[out_edge[j]] == NEXT:
+                dropped[j] = 1
+
+    def resolve(e):
+        """(destino, tipo, etiqueta) de la arista e saltando uniones eliminadas."""
+        d, k, label = edst[e], ekinds[e], g.elabels.get(e)
+        while dropped[d]:
+            d = edst[out_edge[d]]
+        return d, k, label
+
+    # 2. Fusión de tramos: j se une a j-1 si es su único sucesor y j no tiene
+    #    más predecesores
+    bounds = set()
+    for _, first, stop, _ in g.groups:
+        bounds.add(first)
+        bounds.add(stop)
+    merged = bytearray(n)
+    merge_edge = bytearray(len(esrc))
+    for j in range(1, n):
+        i = j - 1
+        if (kinds[i] == STMT and kinds[j] == STMT and j not in bounds
+                and outdeg[i] == 1 and indeg[j] == 1 and g.depths[i] == g.depths[j]
+                and not (keep_io and g.is_io(i) != g.is_io(j))):
+            e = out_edge[i]
+            if edst[e] == j and ekinds[e] == NEXT and e not in g.elabels:
+                merged[j] = 1
+                merge_edge[e] = 1
+
+    out = FlowGraph()
+    new_index = array("i", [-1]) * n
+    start_of = array("i", [0]) * (n + 1)   # nodos nuevos creados antes de i
+    for i in range(n):
+        start_of[i] = len(out)
+        if dropped[i]:
+            continue
+        if merged[i]:
+            last = len(out) - 1
+            new_index[i] = last
+            out.labels[last] += "\n" + g.labels[i]
+            out.flags[last] |= g.flags[i]
+            out.spans[4 * last + 2] = g.spans[4 * i + 2]
+            out.spans[4 * last + 3] = g.spans[4 * i + 3]
+            continue
+        new_index[i] = out.add_node(kinds[i], g.labels[i], g.span(i), g.depths[i], g.is_io(i))
+    start_of[n] = len(out)
+
+    for e in range(len(esrc)):
+        s = esrc[e]
+        if dropped[s] or merge_edge[e]:
+            continue
+        d, k, label = resolve(e)
+        out.add_edge(new_index[s], new_index[d], k, label)
+    for kind, first, stop, label in g.groups:
+        out.groups.append((kind, start_of[first], start_of[stop], label))
+    return out
+
+
+# -------------------------
+# Reconstrucción incremental por regiones
+# -------------------------
+#
+# El módulo se trocea en regiones de primer nivel: cada def/class (con sus
+# decoradores) es una región y cada tramo de sentencias sueltas entre ellas es
+# otra. Cada región se identifica por el hash de su texto y su fragmento de IR
+# (parseado y construido por separado) se guarda en una caché; al editar una
+# función solo se reconstruye esa región y el resto se empalma tal cual.
+# El grafo resultante es idéntico al de build_flow().
+
+_CONTINUATION = re.compile(r"(else|elif|except|finally)\b|[)\]}]")
+_DEFINITION = re.compile(r"(async\s+def|def|class)\b")
+# Lo que importa al seguir una línea: comillas triples, cadenas simples
+# (se saltan enteras), comentarios y paréntesis
+_LINE_TOKENS = re.compile(r'''"""|\'\'\'|"[^"\\\n]*(?:\\.[^"\\\n]*)*"|'[^'\\\n]*(?:\\.[^'\\\n]*)*'|#|[()\[\]{}]''')
+
+
+def _line_state(line, depth, quote):
+    """
+    Estado aproximado al final de la línea: (profundidad de paréntesis,
+    comilla triple abierta o None). Si se equivoca, las regiones salen más
+    grandes (inofensivo) o alguna no parsea sola y se hace un parse completo.
+    """
+    pos = 0
+    while True:
+        if quote:
+            end = line.find(quote, pos)
+            if end == -1:
+                return depth, quote
+            pos = end + 3
+            quote = None
+        m = _LINE_TOKENS.search(line, pos)
+        if m is None:
+            return max(depth, 0), None
+        tok = m.group()
+        if tok == '"""' or tok == "'''":
+            quote = tok
+        elif tok == "#":
+            return max(depth, 0), None
+        elif tok in "([{":
+            depth += 1
+        elif tok in ")]}":
+            depth -= 1
+        pos = m.end()
+
+
+def split_regions(src):
+    """
+    Trocea el fuente en regiones de primer nivel sin parsearlo.
+    Devuelve [(primera_línea, texto, es_definición)] cuya concatenación es src.
+    """
+    lines = src.splitlines(keepends=True)
+    starts = []    # (índice de línea, es_definición)
+    depth, quote = 0, None
+    decorated = False
+    for i, line in enumerate(lines):
+        first = line[:1]
+        new_stmt = (depth == 0 and quote is None and first not in ("", " ", "\t", "#", "\n", "\r", "\f")
+                    and not _CONTINUATION.match(line))
+        if new_stmt:
+            is_def = bool(_DEFINITION.match(line))
+            if decorated:
+                decorated = first == "@"  # el def/class sigue en la región del decorador
+            else:
+                decorated = first == "@"
+                starts.append((i, is_def or decorated))
+        depth, quote = _line_state(line, depth, quote)
+
+    regions = []
+    if not starts or starts[0][0] != 0:
+        starts.insert(0, (0, False))  # comentarios/líneas en blanco iniciales
+    # Tramos de sentencias sueltas consecutivas forman una sola región
+    merged = []
+    for idx, is_def in starts:
+        if merged and not is_def and not merged[-1][1]:
+            continue
+        merged.append((idx, is_def))
+    for k, (idx, is_def) in enumerate(merged):
+        stop = merged[k + 1][0] if k + 1 < len(merged) else len(lines)
+        regions.append((idx + 1, "".join(lines[idx:stop]), is_def))
+    return regions
+
+
+class Fragment:
+    """IR de una región: el nodo 0 es una entrada ficticia donde engancha el flujo anterior."""
+
+    __slots__ = ("graph", "tails", "entry_edges")
+
+    def __init__(self, graph, tails):
+        self.graph = graph
+        self.tails = tails
+        # Posiciones de las aristas que salen de la entrada (normalmente una)
+        self.entry_edges = [i for i, s in enumerate(graph.esrc) if s == 0]
+
+
+def build_fragment(text, filename="<string>"):
+    tree = parse_source(text, filename)
+    b = FlowBuilder(text)
+    entry = b.g.add_node(START, "")
+    b.tails = [(entry, NEXT)]
+    b.run(b.process_block(tree.body))
+    return Fragment(b.g, b.tails)
+
+
+def splice(g, frag, tails, line_offset):
+    """Añade frag a g enganchado a tails. Devuelve los tails de salida."""
+    fg = frag.graph
+    base = len(g) - 1   # nodo i del fragmento (i >= 1) -> base + i
+    g.kinds.extend(fg.kinds[1:])
+    g.flags.extend(fg.flags[1:])
+    g.depths.extend(fg.depths[1:])
+    g.labels.extend(fg.labels[1:])
+    spans = fg.spans[4:]
+    if line_offset:
+        for j in range(0, len(spans), 2):
+            if spans[j]:
+                spans[j] += line_offset
+    g.spans.extend(spans)
+
+    # Aristas por tramos: las internas se copian desplazadas en bloque; cada
+    # arista desde la entrada sale, como en build_flow, de cada tail anterior
+    prev = 0
+    for pos in frag.entry_edges + [fg.num_edges]:
+        if prev < pos:
+            shift = g.num_edges - prev
+            g.esrc.extend([s + base for s in fg.esrc[prev:pos]])
+            g.edst.extend([d + base for d in fg.edst[prev:pos]])
+            g.ekinds.extend(fg.ekinds[prev:pos])
+            for i, label in fg.elabels.items():
+                if prev <= i < pos:
+                    g.elabels[i + shift] = label
+        if pos < fg.num_edges:
+            dst = base + fg.edst[pos]
+            for t, tk in tails:
+                g.add_edge(t, dst, tk)
+        prev = pos + 1
+
+    for kind, first, stop, label in fg.groups:
+        g.groups.append((kind, base + first, base + stop, label))
+    out = []
+    for t, k in frag.tails:
+        if t == 0:
+            out.extend(tails)  # región sin nodos (solo imports): el flujo la atraviesa
+        else:
+            out.append((base + t, k))
+    return out
+
+
+class IncrementalFlow:
+    """
+    build_flow() con memoria: guarda el fragmento de cada región (por hash de
+    su texto) y en la siguiente llamada solo reconstruye las regiones nuevas o
+    modificadas. Pensado para procesos de larga vida (py2flow --watch).
+    """
+
+    def __init__(self, max_fragments=4096):
+        self.fragments = OrderedDict()   # hash -> Fragment, en orden de uso (LRU)
+        self.max_fragments = max_fragments
+        self.reused = 0
+        self.rebuilt = 0
+
+    def _fragment(self, text, filename):
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        frag = self.fragments.get(key)
+        if frag is not None:
+            self.fragments.move_to_end(key)
+            self.reused += 1
+            return frag
+        frag = build_fragment(text, filename)
+        self.fragments[key] = frag
+        if len(self.fragments) > self.max_fragments:
+            self.fragments.popitem(last=False)
+        self.rebuilt += 1
+        return frag
+
+    def build(self, src, filename="<string>"):
+        """Texto fuente -> FlowGraph, idéntico al de build_flow()."""
+        self.reused = self.rebuilt = 0
+        regions = split_regions(src)
+        try:
+            with profiling.phase("build/regions"):
+                frags = [(line, self._fragment(text, filename)) for line, text, _ in regions]
+        except (SyntaxError, ValueError):
+            # O el fichero tiene un error de verdad (build_flow lo informa con
+            # la línea correcta) o el troceo falló: en ambos casos, sin regiones
+            return build_flow(src, filename)
+        g = FlowGraph()
+        start = g.add_node(START, "INICIO")
+        tails = [(start, NEXT)]
+        for line, frag in frags:
+            tails = splice(g, frag, tails, line - 1)
+        end = g.add_node(END, "FIN")
+        for t, k in tails:
+            g.add_edge(t, end, k)
+        profiling.count("regions_reused", self.reused)
+        profiling.count("regions_rebuilt", self.rebuilt)
+        profiling.count("nodes", len(g))
+        profiling.count("edges", g.num_edges)
+        return g
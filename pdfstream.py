@@ -0,0 +1,204 @@
+"""
+pdfstream.py
+Unión de PDFs en streaming, con memoria acotada.
+
+PdfMerger mantiene abiertos todos los documentos añadidos hasta write(), así que
+la memoria crece con la suma de todos los PDFs. StreamingPdfMerger copia cada
+documento de entrada directamente al fichero de salida, objeto a objeto, y lo
+suelta antes de abrir el siguiente. En memoria solo quedan los offsets de la
+tabla xref, la lista de ids de página y una entrada de índice (outline) por
+documento.
+
+Limitaciones:
+ - No admite PDFs de entrada cifrados.
+ - No conserva el outline de los documentos de entrada: genera uno nuevo con
+   una entrada por documento (el título que se pasa a append()).
+
+Cada página pasa a colgar del árbol de páginas plano de la salida, así que
+antes se le copian los atributos que heredaba de sus antepasados /Pages
+(INHERITABLE: recursos, tamaño, recorte y giro); sin eso, los PDF que no
+vienen de Graphviz podrían quedar con páginas en blanco o de otro tamaño.
+"""
+
+import sys
+import resource
+from array import array
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (ArrayObject, DictionaryObject, IndirectObject,
+                            NameObject, TextStringObject)
+
+# Objetos reservados: 1 catálogo, 2 árbol de páginas, 3 raíz del outline
+CATALOG_ID, PAGES_ID, OUTLINES_ID = 1, 2, 3
+
+# Atributos que una página hereda de sus nodos /Pages si no los tiene
+INHERITABLE = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+
+def inherit_attributes(page):
+    """
+    Copia en page los atributos INHERITABLE que no tiene, tomando el de su
+    antepasado /Pages más cercano. Los valores se copian tal cual (también
+    las referencias indirectas, que remap reescribe después).
+    """
+    missing = [k for k in INHERITABLE if k not in page]
+    node = page
+    seen = set()
+    while missing and "/Parent" in node:
+        node = node["/Parent"]
+        if id(node) in seen:
+            break   # árbol de páginas con ciclo: no seguir
+        seen.add(id(node))
+        for k in [k for k in missing if k in node]:
+            dict.__setitem__(page, NameObject(k), dict.__getitem__(node, k))
+            missing.remove(k)
+
+
+def peak_rss_mib():
+    """Pico de memoria residente del proceso, en MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KiB y macOS en bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class StreamingPdfMerger:
+    def __init__(self, path, flush_every=64):
+        self.f = open(path, "wb")
+        self.f.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        self.offsets = array("q", [0, 0, 0, 0])  # índice = número de objeto
+        self.page_ids = array("q")
+        self.outline = []  # (título, id de la primera página)
+        self.flush_every = flush_every
+        self._since_flush = 0
+
+    def _alloc(self):
+        self.offsets.append(0)
+        return len(self.offsets) - 1
+
+    def _write_object(self, oid, obj):
+        self.offsets[oid] = self.f.tell()
+        self.f.write(b"%d 0 obj\n" % oid)
+        obj.write_to_stream(self.f, None)
+        self.f.write(b"\nendobj\n")
+
+    def _write_raw(self, oid, data):
+        self.offsets[oid] = self.f.tell()
+        self.f.write(b"%d 0 obj\n" % oid)
+        self.f.write(data)
+        self.f.write(b"\nendobj\n")
+
+    def append(self, pdf_path, title=None):
+        """Copia todas las páginas de pdf_path a la salida y libera el documento."""
+        reader = PdfReader(pdf_path)
+        if reader.is_encrypted:
+            raise ValueError(f"{pdf_path}: PDF cifrado, no soportado en modo streaming")
+
+        mapping = {}   # (idnum, gen) original -> id nuevo
+        pending = []   # objetos referenciados aún por copiar
+
+        def ref(ind):
+            key = (ind.idnum, ind.generation)
+            nid = mapping.get(key)
+            if nid is None:
+                nid = mapping[key] = self._alloc()
+                pending.append((nid, ind))
+            return IndirectObject(nid, 0, None)
+
+        def remap(obj):
+            # Reescribe in situ las referencias indirectas: el lector se descarta
+            # al terminar este documento, así que no hace falta copiar nada
+            stack = [obj]
+            while stack:
+                o = stack.pop()
+                if isinstance(o, DictionaryObject):
+                    items = dict.items(o)
+                elif isinstance(o, ArrayObject):
+                    items = enumerate(list.__iter__(o))
+                else:
+                    continue
+                for k, v in list(items):
+                    if isinstance(v, IndirectObject):
+                        if v.pdf is None:
+                            continue  # ya reescrita (objeto compartido entre páginas)
+                        if isinstance(o, DictionaryObject):
+                            dict.__setitem__(o, k, ref(v))
+                        else:
+                            list.__setitem__(o, k, ref(v))
+                    elif isinstance(v, (DictionaryObject, ArrayObject)):
+                        stack.append(v)
+
+        pages = list(reader.pages)
+        # Las páginas se registran antes de copiar nada: anotaciones y destinos
+        # internos que apunten a otra página del documento se resuelven bien
+        page_ids = []
+        for page in pages:
+            pid = self._alloc()
+            if page.indirect_reference is not None:
+                ind = page.indirect_reference
+                mapping[(ind.idnum, ind.generation)] = pid
+            page_ids.append(pid)
+
+        for pid, page in zip(page_ids, pages):
+            inherit_attributes(page)
+            page[NameObject("/Parent")] = IndirectObject(PAGES_ID, 0, None)
+            remap(page)
+            self._write_object(pid, page)
+            while pending:
+                nid, ind = pending.pop()
+                obj = ind.get_object()
+                remap(obj)
+                self._write_object(nid, obj)
+            self.page_ids.append(pid)
+            self._since_flush += 1
+            if self._since_flush >= self.flush_every:
+                self.f.flush()
+                self._since_flush = 0
+
+        if page_ids and title is not None:
+            self.outline.append((title, page_ids[0]))
+        # Soltar el documento antes de pasar al siguiente
+        del reader, pages, mapping
+        return len(page_ids)
+
+    def _write_outline(self):
+        n = len(self.outline)
+        item_ids = [self._alloc() for _ in range(n)]
+        for i, (title, page_id) in enumerate(self.outline):
+            item = DictionaryObject()
+            item[NameObject("/Title")] = TextStringObject(title)
+            item[NameObject("/Parent")] = IndirectObject(OUTLINES_ID, 0, None)
+            item[NameObject("/Dest")] = ArrayObject([IndirectObject(page_id, 0, None),
+                                                     NameObject("/Fit")])
+            if i > 0:
+                item[NameObject("/Prev")] = IndirectObject(item_ids[i - 1], 0, None)
+            if i < n - 1:
+                item[NameObject("/Next")] = IndirectObject(item_ids[i + 1], 0, None)
+            self._write_object(item_ids[i], item)
+        if n:
+            root = b"<< /Type /Outlines /First %d 0 R /Last %d 0 R /Count %d >>" % (
+                item_ids[0], item_ids[-1], n)
+        else:
+            root = b"<< /Type /Outlines /Count 0 >>"
+        self._write_raw(OUTLINES_ID, root)
+
+    def close(self):
+        self._write_outline()
+
+        # Árbol de páginas plano; la lista de hijos se escribe por trozos
+        self.offsets[PAGES_ID] = self.f.tell()
+        self.f.write(b"%d 0 obj\n<< /Type /Pages /Count %d /Kids [" % (PAGES_ID, len(self.page_ids)))
+        for i in range(0, len(self.page_ids), 1024):
+            self.f.write(b" ".join(b"%d 0 R" % p for p in self.page_ids[i:i + 1024]) + b"\n")
+        self.f.write(b"] >>\nendobj\n")
+
+        self._write_raw(CATALOG_ID, b"<< /Type /Catalog /Pages %d 0 R /Outlines %d 0 R "
+                                    b"/PageMode /UseOutlines >>" % (PAGES_ID, OUTLINES_ID))
+
+        xref = self.f.tell()
+        size = len(self.offsets)
+        self.f.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for off in self.offsets[1:]:
+            self.f.write(b"%010d 00000 n \n" % off)
+        self.f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                     % (size, CATALOG_ID, xref))
+        self.f.close()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+pipeline.py
+Cadena completa .py -> .dot -> .pdf -> PDF unificado con las tres etapas
+solapadas, en lugar de py2dot.py sobre todo el árbol y después dot2pdf.py.
+
+  generar  (un hilo)     py2dot.convert_file, con su caché; cada .dot pasa a
+                         la cola de render en cuanto está escrito
+  render   (-j hilos)    `dot -Tpdf` por fichero, según van llegando
+  unir     (hilo ppal.)  StreamingPdfMerger: añade cada PDF al documento
+                         final en el orden de los fuentes, en cuanto está
+                         listo él y todos los anteriores
+
+Las colas están acotadas: si Graphviz va por detrás, la generación espera
+(--queue), y como mucho --window grafos pueden estar generados pero sin unir,
+así que un render lento no hace crecer sin límite lo pendiente de unir. Con
+las etapas solapadas el tiempo total tiende al de la etapa más lenta en lugar
+de a la suma de las tres; --sequential las ejecuta una detrás de otra, para
+comparar.
+Un .dot que sale de la caché y cuyo .pdf es posterior no se vuelve a
+renderizar (--force renderiza todo).
+Con --in-memory no se escribe ningún fichero por grafo: el DOT que devuelve
+py2dot.render (DotBuilder.dump()) entra a Graphviz por stdin y el PDF sale
+por stdout directo a la unión (dot2pdf.unify_in_memory). No hay caché ni
+renders que reutilizar, así que se renderiza todo cada vez.
+Uso:
+  pipeline.py ud-03-estructuras-control/ -o ud03.pdf -j 4
+  pipeline.py 'examen-ud03/**/*.py' -o examen.pdf --compact
+"""
+
+import os
+import sys
+import time
+import queue
+import argparse
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import catalog
+import profiling
+import py2dot
+from dot2pdf import timed_render, unify_in_memory
+from pdfstream import StreamingPdfMerger, peak_rss_mib
+
+Item = namedtuple("Item", "index infile dot_path pdf_path nodes edges gen_secs cached entry error")
+Done = namedtuple("Done", "item render_secs error")
+
+STOP = None
+
+
+def pdf_path_for(dot_path):
+    return os.path.splitext(dot_path)[0] + ".pdf"
+
+
+def pdf_is_current(dot_path, pdf_path):
+    try:
+        return os.stat(pdf_path).st_mtime_ns >= os.stat(dot_path).st_mtime_ns
+    except OSError:
+        return False
+
+
+def generate(index, infile, cache, compact):
+    """Etapa 1 para un fuente: escribe su .dot. Devuelve un Item."""
+    t0 = time.perf_counter()
+    try:
+        dot_path = py2dot.output_path(infile)
+        if cache is not None and cache.is_fresh(infile, dot_path):
+            return Item(index, infile, dot_path, pdf_path_for(dot_path), None, None, 0.0,
+                        True, None, None)
+        dot_path, _, hit, entry, size = py2dot.convert_file(infile, cache is not None, compact)
+        nodes, edges = size or (None, None)
+        return Item(index, infile, dot_path, pdf_path_for(dot_path), nodes, edges,
+                    time.perf_counter() - t0, hit, entry, None)
+    except Exception as e:
+        # Un fuente que falla no detiene la cadena: se informa y se salta su página
+        return Item(index, infile, None, None, None, None, time.perf_counter() - t0,
+                    False, None, f"{e.__class__.__name__}: {e}")
+
+
+def needs_render(item, force):
+    return force or not (item.cached and pdf_is_current(item.dot_path, item.pdf_path))
+
+
+def render(item):
+    """Etapa 2 para un .dot ya escrito. Devuelve un Done."""
+    err, secs = timed_render(item.dot_path, item.pdf_path)
+    return Done(item, secs, err)
+
+
+class Merger:
+    """
+    Etapa 3: recibe los Done en cualquier orden y añade cada PDF al documento
+    final en el orden de los fuentes. Lleva las estadísticas de la cadena y
+    anota en el catálogo cada grafo unido.
+    """
+
+    def __init__(self, output_pdf, root, cat=None, compact=False, on_consumed=None):
+        self.output_pdf = output_pdf
+        self.root = root
+        self.cat = cat
+        self.tool = py2dot.tool_id(compact)
+        self.on_consumed = on_consumed   # se llama una vez por grafo ya unido o descartado
+        self.merger = None
+        self.waiting = {}   # índice -> Done que llegó antes que alguno anterior
+        self.next = 0
+        self.pages = 0
+        self.failures = []
+        self.cache_entries = []  # (fuente, entrada) para BuildCache.record
+        self.busy = {"generate": 0.0, "render": 0.0, "merge": 0.0}
+
+    def add(self, done):
+        self.waiting[done.item.index] = done
+        while self.next in self.waiting:
+            self._consume(self.waiting.pop(self.next))
+            self.next += 1
+
+    def _consume(self, done):
+        item = done.item
+        self.cache_entries.append((item.infile, item.entry))
+        self.busy["generate"] += item.gen_secs
+        self.busy["render"] += done.render_secs
+        error = item.error or done.error
+        if error is not None:
+            self.failures.append((item.infile, error))
+        else:
+            t0 = time.perf_counter()
+            if self.merger is None:
+                self.merger = StreamingPdfMerger(self.output_pdf)
+            title = os.path.relpath(item.dot_path, self.root)
+            self.merger.append(item.pdf_path, title)
+            self.pages += 1
+            self.busy["merge"] += time.perf_counter() - t0
+            self._record(item, done)
+        if self.on_consumed is not None:
+            self.on_consumed()
+
+    def _record(self, item, done):
+        if self.cat is None:
+            return
+        self.cat.record(item.infile, {"dot": item.dot_path}, self.tool, item.nodes, item.edges,
+                        None if item.cached else item.gen_secs)
+        if done.render_secs:
+            self.cat.record_artifact(item.infile, "pdf", item.pdf_path, "dot2pdf",
+                                     done.render_secs)
+
+    def close(self):
+        if self.merger is not None:
+            self.merger.close()
+        if self.cat is not None:
+            self.cat.commit()
+
+
+def run_pipeline(sources, merger, cache, jobs, compact, force, queue_size, window):
+    """Las tres etapas a la vez, unidas por colas acotadas."""
+    to_render = queue.Queue(maxsize=queue_size)
+    results = queue.Queue()
+    slots = threading.Semaphore(window)
+    merger.on_consumed = slots.release
+    rendered = 0
+
+    def producer():
+        for i, infile in enumerate(sources):
+            slots.acquire()     # no adelantarse más de `window` grafos a la unión
+            item = generate(i, infile, cache, compact)
+            if item.error is None and needs_render(item, force):
+                to_render.put(item)
+            else:
+                results.put(Done(item, 0.0, None))
+        for _ in range(jobs):
+            to_render.put(STOP)
+
+    def worker():
+        while True:
+            item = to_render.get()
+            if item is STOP:
+                return
+            results.put(render(item))
+
+    threads = [threading.Thread(target=producer, name="generar", daemon=True)]
+    threads += [threading.Thread(target=worker, name=f"render-{k}", daemon=True)
+                for k in range(jobs)]
+    for t in threads:
+        t.start()
+    for _ in range(len(sources)):
+        done = results.get()
+        if done.render_secs:
+            rendered += 1
+        merger.add(done)
+    for t in threads:
+        t.join()
+    return rendered
+
+
+def run_sequential(sources, merger, cache, jobs, compact, force):
+    """Las mismas etapas una detrás de otra, como py2dot.py + dot2pdf.py."""
+    items = [generate(i, infile, cache, compact) for i, infile in enumerate(sources)]
+    todo = [it for it in items if it.error is None and needs_render(it, force)]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        done = {d.item.index: d for d in pool.map(render, todo)}
+    for it in items:
+        merger.add(done.get(it.index, Done(it, 0.0, None)))
+    return len(todo)
+
+
+def dot_loader(infile, compact):
+    """carga() para dot2pdf.unify_in_memory: fuente -> DOT en bytes, sin escribir nada."""
+    def load():
+        with open(infile, "r", encoding="utf-8") as f:
+            src = f.read()
+        return py2dot.render(src, infile, compact).encode("utf-8")
+    return load
+
+
+def run_in_memory(sources, output_pdf, root, jobs, compact):
+    items = [(os.path.relpath(py2dot.output_path(s), root), dot_loader(s, compact), None)
+             for s in sources]
+    t0 = time.perf_counter()
+    pages, failures, _ = unify_in_memory(items, output_pdf, jobs, stream=True)
+    wall = time.perf_counter() - t0
+    for title, err in failures:
+        print(f"ERROR {os.path.join(root, title)}: {err}", file=sys.stderr)
+    if not pages:
+        print("No se pudo generar ningún grafo.")
+        sys.exit(2)
+    print(f"PDF unificado generado en: {output_pdf} ({pages} grafos en memoria, "
+          f"{len(failures)} con errores) en {wall:.3f} s; "
+          f"pico de memoria {peak_rss_mib():.1f} MiB")
+    if failures:
+        sys.exit(2)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Genera los .dot, los renderiza y los une en un PDF, con las etapas solapadas.")
+    parser.add_argument("inputs", nargs="+",
+                        help="ficheros .py, carpetas (recursivo) o patrones glob")
+    parser.add_argument("-o", "--output", default="unificado.pdf",
+                        help="PDF unificado (por defecto: unificado.pdf)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="renders de Graphviz simultáneos (por defecto: nº de CPUs)")
+    parser.add_argument("--queue", type=int, default=None,
+                        help=".dot generados esperando render como máximo (por defecto: 2 x -j)")
+    parser.add_argument("--window", type=int, default=256,
+                        help="grafos generados y aún sin unir como máximo (por defecto: 256)")
+    parser.add_argument("--compact", action="store_true",
+                        help="fundir cada secuencia lineal de sentencias en un solo nodo")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="regenerar todos los .dot, sin consultar ni actualizar la caché")
+    parser.add_argument("--force", action="store_true",
+                        help="renderizar todos los .dot aunque su .pdf esté al día")
+    parser.add_argument("--sequential", action="store_true",
+                        help="ejecutar las etapas una detrás de otra (para comparar)")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="sin .dot ni .pdf por grafo: DOT a Graphviz por stdin y PDF "
+                             "por stdout directo a la unión")
+    profiling.add_arguments(parser)
+    catalog.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.start_from_args(args, "pipeline")
+
+    sources = list(py2dot.iter_sources(args.inputs))
+    if not sources:
+        print("No se encontraron archivos .py en las rutas indicadas.")
+        sys.exit(1)
+    profiling.count("files", len(sources))
+    jobs = max(1, args.jobs or 1)
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(s)) for s in sources])
+    if args.in_memory:
+        run_in_memory(sources, args.output, root, jobs, args.compact)
+        return
+
+    cache = None if args.no_cache else py2dot.open_cache(args.compact)
+    if cache is not None:
+        cache.index     # cargado antes de repartirlo entre hilos
+    cat = catalog.from_args(args)
+    merger = Merger(args.output, root, cat, args.compact)
+
+    t0 = time.perf_counter()
+    try:
+        with profiling.phase("pipeline"):
+            if args.sequential:
+                rendered = run_sequential(sources, merger, cache, jobs, args.compact, args.force)
+            else:
+                rendered = run_pipeline(sources, merger, cache, jobs, args.compact, args.force,
+                                        args.queue or 2 * jobs, max(1, args.window))
+        merger.close()
+    finally:
+        if cache is not None:
+            # El índice de la caché solo se toca desde este hilo
+            for infile, entry in merger.cache_entries:
+                cache.record(infile, entry)
+            cache.close()
+        if cat is not None:
+            cat.close()
+    wall = time.perf_counter() - t0
+
+    for infile, err in merger.failures:
+        print(f"ERROR {infile}: {err}", file=sys.stderr)
+    if not merger.pages:
+        print("No se pudo generar ningún grafo.")
+        sys.exit(2)
+    busy = merger.busy
+    print(f"PDF unificado generado en: {args.output} ({merger.pages} grafos, {rendered} "
+          f"renderizados, {len(merger.failures)} con errores) en {wall:.3f} s; trabajo por "
+          f"etapa: generar {busy['generate']:.3f} s, render {busy['render']:.3f} s "
+          f"(suma de {jobs} procesos), unir {busy['merge']:.3f} s; "
+          f"pico de memoria {peak_rss_mib():.1f} MiB")
+    if merger.failures:
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
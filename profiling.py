@@ -0,0 +1,288 @@
+"""
+profiling.py
+Instrumentación por fases común a todas las herramientas (--profile).
+
+El código marca sus fases con `with profiling.phase("parse"):` y las funciones
+calientes que interesa medir por separado se envuelven con
+profiling.timed(func, "nombre"). Mientras no haya un perfilador activo,
+phase() devuelve un contexto vacío compartido y timed() devuelve la propia
+función, así que el coste con --profile desactivado es una llamada y una
+comparación por fase (no por nodo).
+
+Con --profile el informe (JSON) recoge por fase:
+  seconds       tiempo de reloj acumulado, incluidas las subfases
+  self_seconds  el mismo tiempo sin las subfases anidadas
+  calls         veces que se entró en la fase
+  peak_mib      pico de memoria de Python (tracemalloc) sobre lo ya asignado al
+                entrar; solo fases marcadas con phase(), no las timed()
+además de contadores (ficheros, nodos, aristas...) y, con --cprofile, un
+volcado de cProfile legible con pstats / snakeviz.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+MIB = 1024 * 1024
+
+# Perfilador activo en este proceso (None = desactivado)
+active = None
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class Profiler:
+    def __init__(self, tool, memory=True, cprofile_path=None):
+        self.tool = tool
+        self.memory = memory
+        self.cprofile_path = cprofile_path
+        # nombre -> [segundos, segundos_propios, llamadas, pico_bytes]
+        self.stats = {}
+        self.counts = {}
+        # fases abiertas: [nombre, t0, segundos_hijas, memoria_base, pico_visto]
+        self._stack = []
+        self._peak = 0  # pico global, que reset_peak() también borra
+        self._t0 = time.perf_counter()
+        self._cprofile = None
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.cprofile_path:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        return self
+
+    # ---------- medición ----------
+
+    def _enter(self, name, memory):
+        frame = [name, 0.0, 0.0, None, 0]
+        if memory and self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # reset_peak() borra el pico de las fases exteriores: se lo guardamos
+            for f in self._stack:
+                if f[3] is not None and peak > f[4]:
+                    f[4] = peak
+            self._peak = max(self._peak, peak)
+            tracemalloc.reset_peak()
+            frame[3] = current
+        self._stack.append(frame)
+        frame[1] = time.perf_counter()
+        return frame
+
+    def _exit(self, frame):
+        elapsed = time.perf_counter() - frame[1]
+        self._stack.pop()
+        st = self.stats.get(frame[0])
+        if st is None:
+            st = self.stats[frame[0]] = [0.0, 0.0, 0, 0]
+        st[0] += elapsed
+        st[1] += elapsed - frame[2]
+        st[2] += 1
+        if self._stack:
+            self._stack[-1][2] += elapsed
+        if frame[3] is not None:
+            peak = max(tracemalloc.get_traced_memory()[1], frame[4])
+            st[3] = max(st[3], peak - frame[3])
+
+    @contextmanager
+    def phase(self, name):
+        frame = self._enter(name, True)
+        try:
+            yield
+        finally:
+            self._exit(frame)
+
+    def timed(self, func, name):
+        """Envuelve func para acumular su tiempo en la fase `name` (sin memoria)."""
+        def wrapper(*args, **kwargs):
+            frame = self._enter(name, False)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._exit(frame)
+        return wrapper
+
+    def add(self, name, seconds, calls=1):
+        """Suma a la fase `name` tiempo medido fuera de phase() (p. ej. en otro hilo)."""
+        st = self.stats.get(name)
+        if st is None:
+            st = self.stats[name] = [0.0, 0.0, 0, 0]
+        st[0] += seconds
+        st[1] += seconds
+        st[2] += calls
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    # ---------- procesos hijos ----------
+
+    def take(self):
+        """Devuelve lo medido hasta ahora y lo reinicia (para enviarlo al padre)."""
+        data = {"stats": self.stats, "counts": self.counts}
+        self.stats = {}
+        self.counts = {}
+        return data
+
+    def merge(self, data):
+        """Suma lo medido en otro proceso (ver take())."""
+        if not data:
+            return
+        for name, (secs, own, calls, peak) in data["stats"].items():
+            st = self.stats.setdefault(name, [0.0, 0.0, 0, 0])
+            st[0] += secs
+            st[1] += own
+            st[2] += calls
+            st[3] = max(st[3], peak)
+        for name, n in data["counts"].items():
+            self.count(name, n)
+
+    # ---------- informe ----------
+
+    def stop(self):
+        """Para la medición y devuelve el informe (dict serializable a JSON)."""
+        report = {
+            "tool": self.tool,
+            "pid": os.getpid(),
+            "wall_seconds": round(time.perf_counter() - self._t0, 6),
+            "phases": {},
+            "counts": dict(sorted(self.counts.items())),
+        }
+        for name, (secs, own, calls, peak) in sorted(self.stats.items()):
+            entry = {"seconds": round(secs, 6), "self_seconds": round(own, 6), "calls": calls}
+            if self.memory and peak:
+                entry["peak_mib"] = round(peak / MIB, 3)
+            report["phases"][name] = entry
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_path)
+            report["cprofile"] = self.cprofile_path
+            self._cprofile = None
+        if self.memory and tracemalloc.is_tracing():
+            peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            report["tracemalloc_peak_mib"] = round(peak / MIB, 3)
+            tracemalloc.stop()
+        return report
+
+
+# -------------------------
+# API del módulo (lo que usa el resto del código)
+# -------------------------
+
+def enabled():
+    return active is not None
+
+
+def phase(name):
+    if active is None:
+        return _NULL_PHASE
+    return active.phase(name)
+
+
+def timed(func, name):
+    if active is None:
+        return func
+    return active.timed(func, name)
+
+
+def add(name, seconds, calls=1):
+    if active is not None:
+        active.add(name, seconds, calls)
+
+
+def count(name, n=1):
+    if active is not None:
+        active.count(name, n)
+
+
+class _TimedWriter:
+    """Proxy de un fichero de texto que cuenta sus write() en una fase."""
+
+    def __init__(self, f, name):
+        self._f = f
+        self.write = active.timed(f.write, name)
+
+    def __getattr__(self, attr):
+        return getattr(self._f, attr)
+
+
+def writer(f, name="write"):
+    """Devuelve f, o un proxy que mide sus escrituras si hay perfilador activo."""
+    if active is None:
+        return f
+    return _TimedWriter(f, name)
+
+
+def install(tool, memory=True, cprofile_path=None):
+    """Activa un perfilador en este proceso (también vale como initializer de un pool)."""
+    global active
+    active = Profiler(tool, memory, cprofile_path).start()
+    return active
+
+
+def take():
+    return active.take() if active is not None else None
+
+
+def merge(data):
+    if active is not None:
+        active.merge(data)
+
+
+# -------------------------
+# Línea de órdenes
+# -------------------------
+
+def add_arguments(parser):
+    group = parser.add_argument_group("perfilado")
+    group.add_argument("--profile", action="store_true",
+                       help="medir tiempo, memoria y tamaño por fase y emitir un informe JSON")
+    group.add_argument("--profile-out", metavar="FICHERO",
+                       help="escribir el informe en FICHERO en lugar de en stderr (implica --profile)")
+    group.add_argument("--profile-no-memory", action="store_true",
+                       help="no usar tracemalloc (medición de tiempos más fiel)")
+    group.add_argument("--cprofile", metavar="FICHERO",
+                       help="volcar además un perfil de cProfile (implica --profile; "
+                            "solo el proceso principal)")
+
+
+def start_from_args(args, tool):
+    """
+    Activa el perfilado si la línea de órdenes lo pide. El informe se emite
+    al salir del programa, también si termina con sys.exit().
+    """
+    if not (args.profile or args.profile_out or args.cprofile):
+        return None
+    prof = install(tool, not args.profile_no_memory, args.cprofile)
+    atexit.register(_finish, args.profile_out)
+    return prof
+
+
+def _finish(path):
+    global active
+    if active is None:
+        return
+    report = active.stop()
+    active = None
+    text = json.dumps(report, indent=1)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text, file=sys.stderr)
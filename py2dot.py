@@ -3,270 +3,542 @@
 py2flow.py
 Genera un archivo .dot (Graphviz) que representa un diagrama de flujo
 simplificado de un archivo fuente Python.
+El recorrido del código se hace en flowir.py (IR compartido con py2draw.py y
+py_to_dot.py); este módulo solo serializa el FlowGraph a DOT.
 Limitaciones:
  - No construye un verdadero CFG con análisis de alcance/alcance de variables.
- - Trata sentencias como cajas con el código (usando ast.unparse).
- - Soporta estructuras: sequential, if/elif/else, while, for, try/except.
+ - Trata sentencias como cajas con su código fuente (en una línea, máx. 200 caracteres).
+ - Soporta estructuras: sequential, if/elif/else, match, while, for, try/except, with, def/class.
+ - Las cadenas if/elif sobre una misma variable y los match se dibujan como un solo
+   diamante con una arista etiquetada por caso.
  - No representa expresiones lambda internamente, ni comprehensions complejas.
  - Los nodos de decisión (if/while) se dibujan como diamantes mediante attribute shape=diamond.
+Uso:
+  py2dot.py archivo.py                  -> archivo.dot junto al fuente
+  py2dot.py carpeta/ 'otra/**/*.py' -j 8 -> modo lote en paralelo con resumen de tiempos
+  py2dot.py archivo.py --split          -> archivo.dot (vista general) + archivo.fn.<nombre>.dot
+                                           por función/clase, para maquetarlos por separado
+  py2dot.py archivo.py --compact        -> las secuencias de sentencias se funden en un
+                                           único nodo (bloque básico)
 """
 
 import os
-import ast
+import re
 import sys
+import glob
+import time
+import argparse
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from itertools import count
 
+import profiling
+import catalog
+from build_cache import BuildCache, open_output
+from flowir import (build_flow, compact_blocks, START, END, DECISION, LOOP, JOIN,
+                    TRUE, FALSE, DONE, EXCEPT, G_WHILE, G_FUNCTION, G_CLASS)
+
+__version__ = "2.4"
+TOOL_NAME = "py2dot"
+
+BatchResult = namedtuple("BatchResult",
+                         "infile outfile elapsed cached entry error profile nodes edges graphs",
+                         defaults=(None, None, None))
+
+
+def escape_text(text):
+    """Escapa barras invertidas y comillas para una cadena DOT entre comillas."""
+    return text.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def escape_label(label):
+    """Escapa una etiqueta para DOT, alineada a la izquierda (\\l) línea a línea."""
+    return escape_text(label).replace('\n', '\\l') + '\\l'
+
+
 class DotBuilder:
-    def __init__(self):
-        self.lines = []
+    def __init__(self, out=None):
+        # Sin `out` las líneas se acumulan y dump() devuelve el texto.
+        # Con `out` (un fichero abierto) cada línea se escribe al generarse,
+        # así la memoria no depende del tamaño del grafo.
+        self.out = out
+        self.lines = [] if out is None else None
+        self._sep = ""
+        self.escape = profiling.timed(escape_label, "serialize/escape")
         self.node_id = count(1)
         self.add_header()
 
+    def emit(self, line):
+        if self.out is None:
+            self.lines.append(line)
+        else:
+            self.out.write(self._sep + line)
+            self._sep = "\n"
+
     def add_header(self):
-        self.lines.append('digraph flow {')
-        self.lines.append('  rankdir=TB;')
-        self.lines.append('  node [shape=rectangle, fontname="Consolas"];')
-        self.lines.append('')
+        self.emit('digraph flow {')
+        self.emit('  rankdir=TB;')
+        self.emit('  node [shape=rectangle, fontname="Consolas"];')
+        self.emit('')
 
-    def new_node(self, label, shape=None, style=None):
+    def new_node(self, label, shape=None, style=None, url=None):
         nid = f"n{next(self.node_id)}"
-        label_esc = label.replace('"', '\\"').replace('\n', '\\l') + '\\l'
+        label_esc = self.escape(label)
         attr = []
         attr.append(f'label="{label_esc}"')
         if shape:
             attr.append(f'shape={shape}')
         if style:
             attr.append(f'style="{style}"')
-        self.lines.append(f'  {nid} [{", ".join(attr)}];')
+        if url:
+            attr.append(f'URL="{url}"')
+        self.emit(f'  {nid} [{", ".join(attr)}];')
         return nid
 
-    def add_edge(self, a, b, label=None):
+    def add_edge(self, a, b, label=None, style=None):
+        attr = []
         if label:
-            self.lines.append(f'  {a} -> {b} [label="{label}"];')
+            # Las de CASE son texto del fuente (case "salir", == "+"): comillas incluidas
+            attr.append(f'label="{escape_text(label)}"')
+        if style:
+            attr.append(f'style="{style}"')
+        if attr:
+            self.emit(f'  {a} -> {b} [{", ".join(attr)}];')
         else:
-            self.lines.append(f'  {a} -> {b};')
+            self.emit(f'  {a} -> {b};')
 
     def add_footer(self):
-        self.lines.append('}')
+        self.emit('}')
 
     def dump(self):
+        """Cierra el grafo. Devuelve el texto DOT, o None si se escribió en `out`."""
         self.add_footer()
-        return "\n".join(self.lines)
-
-
-class FlowBuilder(ast.NodeVisitor):
-    def __init__(self, src_text):
-        self.dot = DotBuilder()
-        self.src = src_text
-        self.last_nodes = []  # current "tails" where next statements should attach
-
-    def code_of(self, node):
-        # Use ast.unparse if available (py3.9+)
-        try:
-            s = ast.unparse(node)
-        except Exception:
-            # Fallback naive: try to get source segment
-            try:
-                s = ast.get_source_segment(self.src, node) or node.__class__.__name__
-            except Exception:
-                s = node.__class__.__name__
-        return s
-
-    def build(self, node):
-        # start node
-        start = self.dot.new_node("INICIO", shape="ellipse")
-        self.last_nodes = [start]
-        if isinstance(node, ast.Module):
-            self.process_block(node.body)
+        if self.out is None:
+            return "\n".join(self.lines)
+        return None
+
+
+# Etiquetas de las aristas tipadas del IR
+EDGE_LABELS = {TRUE: "True", FALSE: "False", DONE: "Done"}
+
+
+def graph_to_dot(g, out=None):
+    """Serializa un FlowGraph a DOT: devuelve el texto o, con `out`, lo escribe ahí."""
+    with profiling.phase("serialize"):
+        return _graph_to_dot(g, DotBuilder(out))
+
+
+def _graph_to_dot(g, dot, scope=None):
+    """
+    Escribe en dot el grafo entero o, con `scope` (ver split_scopes), solo los
+    nodos y aristas de ese ámbito.
+    """
+    if scope is None:
+        nodes = range(len(g))
+        node_id = None
+    else:
+        nodes = scope.nodes
+        members = set(nodes)
+        node_id = {}
+    # Clusters para el cuerpo de los while (rangos contiguos y anidados de nodos)
+    clusters = sorted((first, -stop) for kind, first, stop, _ in g.groups
+                      if kind == G_WHILE and stop > first
+                      and (scope is None or first in members))
+    ci = 0
+    open_stops = []
+    for i in nodes:
+        while open_stops and open_stops[-1] <= i:
+            open_stops.pop()
+            dot.emit('  }')  # cerrar subgraph
+        while ci < len(clusters) and clusters[ci][0] <= i:
+            dot.emit(f'  subgraph cluster_{ci + 1} {{')
+            dot.emit('    style=dashed;')  # opcional: borde punteado
+            dot.emit('    label="While Body";')
+            open_stops.append(-clusters[ci][1])
+            ci += 1
+        kind = g.kinds[i]
+        if scope is not None and i in scope.links:
+            # Definición con grafo propio: nodo enlazado a su fichero
+            nid = dot.new_node(g.labels[i], shape="component", url=scope.links[i])
+        elif kind in (START, END, JOIN):
+            nid = dot.new_node(g.labels[i], shape="ellipse")
+        elif kind in (DECISION, LOOP):
+            nid = dot.new_node(g.labels[i], shape="diamond")
+        else:
+            nid = dot.new_node(g.labels[i])
+        if node_id is not None:
+            node_id[i] = nid
+    for _ in open_stops:
+        dot.emit('  }')
+
+    edges = g.edges()
+    if scope is not None:
+        wanted = set(scope.edges)
+        edges = (e for k, e in enumerate(edges) if k in wanted)
+    for src, dst, kind, label in edges:
+        style = "dashed" if kind == EXCEPT else None
+        if node_id is None:
+            a, b = f"n{src + 1}", f"n{dst + 1}"
         else:
-            self.visit(node)
-        end = self.dot.new_node("FIN", shape="ellipse")
-        for tail in self.last_nodes:
-            self.dot.add_edge(tail, end)
-        return self.dot.dump()
-
-    def process_block(self, stmts):
-        for stmt in stmts:
-            self.visit(stmt)
-        # after block, last_nodes updated
-
-    # Generic: attach a single statement node representing simple stmts
-    def generic_simple_stmt(self, node, label=None):
-        lab = label if label is not None else self.code_of(node)
-        n = self.dot.new_node(lab)
-        for tail in self.last_nodes:
-            self.dot.add_edge(tail, n)
-        self.last_nodes = [n]
-
-    def visit_Expr(self, node):
-        self.generic_simple_stmt(node)
-
-    def visit_Assign(self, node):
-        self.generic_simple_stmt(node)
-
-    def visit_AugAssign(self, node):
-        self.generic_simple_stmt(node)
-
-    def visit_AnnAssign(self, node):
-        self.generic_simple_stmt(node)
-
-    def visit_Import(self, node):
-    # No hacemos nada, se ignora
-        pass
-
-    def visit_ImportFrom(self, node):
-    # No hacemos nada, se ignora
-        pass
-
-    def visit_Return(self, node):
-        s = self.code_of(node)
-        n = self.dot.new_node(s)
-        for tail in self.last_nodes:
-            self.dot.add_edge(tail, n)
-        # return ends the flow: no tails continue through
-        self.last_nodes = []
-
-    def visit_Break(self, node):
-        self.generic_simple_stmt(node)
-        # conservatively clear tails; analysis of loop targets is non-trivial
-        self.last_nodes = []
-
-    def visit_Continue(self, node):
-        self.generic_simple_stmt(node)
-        self.last_nodes = []
-
-    def visit_If(self, node: ast.If):
-        cond_label = self.code_of(node.test)
-        cond_n = self.dot.new_node(cond_label, shape='diamond')
-        # conectar condición desde los tails actuales
-        for tail in self.last_nodes:
-            self.dot.add_edge(tail, cond_n)
-        
-        # Guardamos prev_tails para join
-        prev_tails = self.last_nodes
-
-        # --- Rama True ---
-        self.last_nodes = [cond_n]
-        self.process_block(node.body)
-        true_tails = list(self.last_nodes)
-        # Conectar desde cond_n a cada nodo inicial de true branch con etiqueta "True"
-        for t in true_tails:
-            self.dot.add_edge(cond_n, t, label="True")
-
-        # --- Rama False ---
-        if node.orelse:
-            self.last_nodes = [cond_n]
-            self.process_block(node.orelse)
-            false_tails = list(self.last_nodes)
-            for f in false_tails:
-                self.dot.add_edge(cond_n, f, label="False")
+            a, b = node_id[src], node_id[dst]
+        dot.add_edge(a, b, label or EDGE_LABELS.get(kind), style)
+    return dot.dump()
+
+
+# -------------------------
+# Modo --split: un grafo por función/clase
+# -------------------------
+
+# nodes: índices en orden; edges: índices de arista; links: cabecera -> URL
+Scope = namedtuple("Scope", "name header nodes edges links")
+
+_DEF_NAME = re.compile(r"(?:async def|def|class) (\w+)")
+
+
+def split_scopes(g):
+    """
+    Reparte el grafo en ámbitos: el módulo (primero) y cada def/class, también
+    las anidadas. El cuerpo de una definición sale del grafo de su padre, donde
+    queda solo la cabecera; en el grafo propio la cabecera es la entrada.
+    Devuelve [Scope]; en links, cabecera -> índice del ámbito hijo.
+    """
+    defs = sorted((first, -stop, label) for kind, first, stop, label in g.groups
+                  if kind in (G_FUNCTION, G_CLASS) and stop > first)
+    owner = array("i", [0]) * len(g)
+    scopes = [Scope(None, None, [], [], {})]
+    used = set()
+    stack = [(0, len(g))]   # (ámbito, fin exclusivo)
+    di = 0
+    for i in range(len(g)):
+        while stack[-1][1] <= i:
+            stack.pop()
+        while di < len(defs) and defs[di][0] == i:
+            first, neg_stop, label = defs[di]
+            parent = stack[-1][0]
+            m = _DEF_NAME.match(label)
+            name = m.group(1) if m else "anonimo"
+            if scopes[parent].name:
+                name = f"{scopes[parent].name}.{name}"
+            unique, n = name, 2
+            while unique in used:  # redefiniciones con el mismo nombre
+                unique, n = f"{name}-{n}", n + 1
+            used.add(unique)
+            header = first - 1   # la cabecera se crea justo antes del cuerpo
+            scopes[parent].links[header] = len(scopes)
+            stack.append((len(scopes), -neg_stop))
+            scopes.append(Scope(unique, header, [header], [], {}))
+            di += 1
+        owner[i] = stack[-1][0]
+        scopes[owner[i]].nodes.append(i)
+    for k, (s, d) in enumerate(zip(g.esrc, g.edst)):
+        so, do = owner[s], owner[d]
+        if so == do:
+            scopes[so].edges.append(k)
+        elif scopes[do].header == s:
+            scopes[do].edges.append(k)   # cabecera -> primera sentencia del cuerpo
+    return scopes
+
+
+def write_split(g, outfile):
+    """
+    Escribe outfile con la vista general del módulo y un <base>.fn.<nombre>.dot
+    por cada función/clase; cada cabecera de la vista general enlaza (URL) al
+    PDF que dot2pdf genera para su grafo. Borra los .fn.*.dot de definiciones
+    que ya no existen. Devuelve la lista de ficheros escritos.
+    """
+    stem = os.path.splitext(outfile)[0]
+    scopes = split_scopes(g)
+    paths = [outfile] + [f"{stem}.fn.{sc.name}.dot" for sc in scopes[1:]]
+    for sc, path in zip(scopes, paths):
+        links = {h: os.path.splitext(os.path.basename(paths[child]))[0] + ".pdf"
+                 for h, child in sc.links.items()}
+        with open(path, "w", encoding="utf-8") as f:
+            with profiling.phase("serialize"):
+                _graph_to_dot(g, DotBuilder(profiling.writer(f)), sc._replace(links=links))
+    for old in glob.glob(glob.escape(stem) + ".fn.*.dot"):
+        if old not in paths:
+            os.remove(old)
+    return paths
+
+
+def output_path(infile):
+    # Generar el nombre del archivo de salida en la misma carpeta
+    base, _ = os.path.splitext(os.path.basename(infile))
+    dir_name = os.path.dirname(os.path.abspath(infile))
+    return os.path.join(dir_name, base + ".dot")
+
+
+def make_graph(src, filename="<string>", compact=False):
+    """Texto fuente -> FlowGraph; con compact, en bloques básicos."""
+    g = build_flow(src, filename)
+    if compact:
+        # py2dot no distingue la E/S, así que se funde todo el tramo lineal
+        g = compact_blocks(g, keep_io=False)
+    return g
+
+
+def open_cache(compact=False):
+    # Las salidas compactadas son otras: van con su propio nombre de herramienta
+    return BuildCache(TOOL_NAME + "-compact" if compact else TOOL_NAME, __version__)
+
+
+def render(src, filename="<string>", compact=False):
+    """Texto fuente -> texto DOT."""
+    return graph_to_dot(make_graph(src, filename, compact))
+
+
+def write_dot(src, out, filename="<string>", compact=False):
+    """Texto fuente -> DOT escrito directamente en el fichero abierto `out`. Devuelve el grafo."""
+    g = make_graph(src, filename, compact)
+    graph_to_dot(g, out)
+    return g
+
+
+def tool_id(compact=False, split=False):
+    """Cómo se registra en el catálogo la herramienta que generó un .dot."""
+    return " ".join([TOOL_NAME, __version__] + ["compact"] * compact + ["split"] * split)
+
+
+def convert_split(infile, compact=False, sizes=None):
+    """
+    Modo --split para un .py (sin caché). Devuelve la lista de .dot escritos;
+    si se pasa la lista sizes, le añade (nodos, aristas) del grafo.
+    """
+    with profiling.phase("read"):
+        with open(infile, 'r', encoding='utf-8') as f:
+            src = f.read()
+    g = make_graph(src, infile, compact)
+    if sizes is not None:
+        sizes.append((len(g), g.num_edges))
+    return write_split(g, output_path(infile))
+
+
+def convert_file(infile, use_cache=True, compact=False):
+    """
+    Convierte un único .py en su .dot.
+    Devuelve (outfile, segundos, acierto_de_cache, entrada_de_indice, tamaño),
+    con tamaño = (nodos, aristas) del grafo, o None si salió de la caché.
+    """
+    t0 = time.perf_counter()
+    outfile = output_path(infile)
+    sizes = []
+
+    def write(src, f):
+        g = write_dot(src, f, infile, compact)
+        sizes.append((len(g), g.num_edges))
+
+    if use_cache:
+        cache = open_cache(compact)
+        hit, entry = cache.build(infile, outfile, write)
+        return outfile, time.perf_counter() - t0, hit, entry, (sizes or [None])[0]
+
+    with profiling.phase("read"):
+        with open(infile, 'r', encoding='utf-8') as f:
+            src = f.read()
+
+    with open_output(outfile) as f:
+        write(src, profiling.writer(f))
+
+    return outfile, time.perf_counter() - t0, False, None, sizes[0]
+
+
+def iter_sources(paths):
+    """Expande ficheros, carpetas (recursivo) y patrones glob a una lista de .py."""
+    seen = set()
+    for p in paths:
+        if os.path.isdir(p):
+            found = []
+            for root, dirs, files in os.walk(p):
+                dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '__')))
+                found.extend(os.path.join(root, f) for f in sorted(files) if f.endswith('.py'))
+        elif os.path.isfile(p):
+            found = [p]
         else:
-            # no else: false branch sigue desde cond_n al join
-            false_tails = [cond_n]
-
-        # --- Nodo de unión ---
-        join = self.dot.new_node("", shape="ellipse")
-        for t in true_tails + false_tails:
-            if t != cond_n:  # evitamos doble conexión desde cond_n si no hay else
-                self.dot.add_edge(t, join)
-        self.last_nodes = [join]
-
-    def visit_While(self, node: ast.While):
-        cond_label = self.code_of(node.test)
-        cond_n = self.dot.new_node(cond_label, shape='diamond')
-        
-        # Conectar los nodos previos al condicional
-        for tail in self.last_nodes:
-            self.dot.add_edge(tail, cond_n)
-        
-        # Nodo de unión al final del while
-        join = self.dot.new_node("", shape="ellipse")
-        
-        # --- Crear subgraph para el cuerpo del while ---
-        cluster_id = f"cluster_{next(self.dot.node_id)}"
-        self.dot.lines.append(f'  subgraph {cluster_id} {{')
-        self.dot.lines.append('    style=dashed;')  # opcional: borde punteado
-        self.dot.lines.append('    label="While Body";')
-        
-        # Procesar el nodo del condicional fuera del subgraph
-        self.last_nodes = [cond_n]
-        self.process_block(node.body)
-        
-        self.dot.lines.append('  }')  # cerrar subgraph
-        
-        # Conectar nodos finales del cuerpo al condicional (loop)
-        for t in self.last_nodes:
-            self.dot.add_edge(t, cond_n, label="True")
-        
-        # Rama False: salida al join
-        self.dot.add_edge(cond_n, join, label="False")
-        
-        # Actualizar last_nodes para continuar desde el join
-        self.last_nodes = [join]
-        
-        # Ignorar else por simplicidad
-        if node.orelse:
-            self.process_block(node.orelse)
-
-    def visit_For(self, node: ast.For):
-        # represent for similarly to while
-        it_label = f"for {self.code_of(node.target)} in {self.code_of(node.iter)}"
-        cond_n = self.dot.new_node(it_label, shape='diamond')
-        for tail in self.last_nodes:
-            self.dot.add_edge(tail, cond_n)
-        self.last_nodes = [cond_n]
-        self.process_block(node.body)
-        for t in self.last_nodes:
-            self.dot.add_edge(t, cond_n)
-        exit_n = self.dot.new_node("AfterFor")
-        self.dot.add_edge(cond_n, exit_n, label="Done")
-        self.last_nodes = [exit_n]
-        if node.orelse:
-            self.process_block(node.orelse)
-
-    def visit_Try(self, node: ast.Try):
-        # Crear nodo "try"
-        self.process_block(node.body)
-    
-        # Crear nodo de unión al final del try
-        join = self.dot.new_node("", shape="ellipse")
-        for tail in self.last_nodes:
-            self.dot.add_edge(tail, join)
-        
-        # Actualizar last_nodes para continuar desde el join
-        self.last_nodes = [join]
-
-    # fallback
-    def generic_visit(self, node):
-        # For any other node types, try to create a simple node with its code
-        if isinstance(node, ast.stmt):
-            self.generic_simple_stmt(node)
+            found = sorted(f for f in glob.glob(p, recursive=True) if f.endswith('.py'))
+        for f in found:
+            key = os.path.abspath(f)
+            if key not in seen:
+                seen.add(key)
+                yield f
+
+
+def _safe_convert(infile, use_cache=True, split=False, compact=False):
+    # En los procesos hijos no dejamos escapar excepciones: se informan por fichero
+    profiling.count("files")
+    try:
+        if split:
+            t0 = time.perf_counter()
+            sizes = []
+            graphs = convert_split(infile, compact, sizes)
+            outfile, hit, entry = graphs[0], False, None
+            elapsed, size = time.perf_counter() - t0, sizes[0]
         else:
-            super().generic_visit(node)
+            graphs = None
+            outfile, elapsed, hit, entry, size = convert_file(infile, use_cache, compact)
+        result = BatchResult(infile, outfile, elapsed, hit, entry, None, None,
+                             *(size or (None, None)), graphs)
+    except (OSError, SyntaxError, ValueError) as e:
+        result = BatchResult(infile, None, 0.0, False, None, f"{e.__class__.__name__}: {e}", None)
+    # Lo medido en un proceso hijo viaja al padre junto con el resultado
+    return result._replace(profile=profiling.take())
+
+
+def split_artifacts(paths):
+    """
+    Tipos de catálogo de los .dot de write_split: la vista general es "dot"
+    y cada <base>.fn.<nombre>.dot, "dot:<nombre>".
+    """
+    prefix = os.path.splitext(paths[0])[0] + ".fn."
+    kinds = {"dot": paths[0]}
+    for path in paths[1:]:
+        kinds["dot:" + path[len(prefix):-len(".dot")]] = path
+    return kinds
+
+
+def record_results(cat, results, compact=False, split=False):
+    """Anota en el catálogo los fuentes convertidos sin error y sus .dot."""
+    tool = tool_id(compact, split)
+    with profiling.phase("catalog"):
+        for r in results:
+            if r.error is None:
+                artifacts = split_artifacts(r.graphs) if r.graphs else {"dot": r.outfile}
+                cat.record(r.infile, artifacts, tool, r.nodes, r.edges,
+                           None if r.cached else r.elapsed)
+        cat.commit()
+
+
+def convert_batch(sources, jobs=None, use_cache=True, split=False, compact=False, cat=None):
+    """
+    Convierte muchos ficheros en paralelo con un pool de procesos. Con cat
+    (un catalog.Catalog) se registran los resultados.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    results = []
+    pending = sources
+    cache = open_cache(compact) if use_cache else None
+    if cache is not None:
+        # Camino rápido: si fuente y salida no han cambiado basta con stat()
+        pending = []
+        with profiling.phase("cache/check"):
+            for s in sources:
+                if cache.is_fresh(s, output_path(s)):
+                    results.append(BatchResult(s, output_path(s), 0.0, True, None, None, None))
+                else:
+                    pending.append(s)
+        profiling.count("files_fresh", len(sources) - len(pending))
+
+    work = partial(_safe_convert, use_cache=use_cache, split=split, compact=compact)
+    if jobs == 1 or len(pending) <= 1:
+        for s in pending:
+            r = work(s)
+            profiling.merge(r.profile)
+            results.append(r)
+    else:
+        # chunksize > 1 amortiza el coste de IPC con muchos ficheros pequeños
+        chunksize = max(1, len(pending) // (jobs * 4))
+        pool_args = {}
+        if profiling.enabled():
+            # Cada hijo mide con su propio perfilador (sin cProfile)
+            prof = profiling.active
+            pool_args = {"initializer": profiling.install,
+                         "initargs": (prof.tool, prof.memory, None)}
+        with ProcessPoolExecutor(max_workers=jobs, **pool_args) as pool:
+            for r in pool.map(work, pending, chunksize=chunksize):
+                profiling.merge(r.profile)
+                results.append(r)
+
+    if cache is not None:
+        for r in results:
+            cache.record(r.infile, r.entry)
+        cache.close()
+    if cat is not None:
+        record_results(cat, results, compact, split)
+    return results, time.perf_counter() - t0
+
+
+def print_summary(results, wall):
+    ok = [r for r in results if r.error is None]
+    failed = [r for r in results if r.error is not None]
+    for r in ok:
+        tag = " (caché)" if r.cached else ""
+        print(f"  {r.elapsed * 1000:8.2f} ms  {r.outfile}{tag}")
+    for r in failed:
+        print(f"  ERROR      {r.infile}: {r.error}", file=sys.stderr)
+    busy = sum(r.elapsed for r in ok)
+    cached = sum(1 for r in ok if r.cached)
+    rate = len(ok) / wall if wall > 0 else 0.0
+    print(f"Generados {len(ok)} .dot ({cached} desde caché, {len(failed)} errores) "
+          f"en {wall:.3f} s (trabajo acumulado {busy:.3f} s, {rate:.1f} ficheros/s)")
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Uso: py2flow.py archivo_entrada.py")
+    parser = argparse.ArgumentParser(
+        description="Genera diagramas de flujo .dot a partir de código Python.")
+    parser.add_argument("inputs", nargs="+",
+                        help="ficheros .py, carpetas (recursivo) o patrones glob")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="procesos en paralelo para el modo lote (por defecto: nº de CPUs)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="regenerar siempre, sin consultar ni actualizar la caché")
+    parser.add_argument("--split", action="store_true",
+                        help="un .dot por función/clase más una vista general del módulo "
+                             "(cada uno se maqueta por separado; no usa la caché)")
+    parser.add_argument("--compact", action="store_true",
+                        help="fundir cada secuencia lineal de sentencias en un solo nodo "
+                             "y quitar las uniones vacías innecesarias")
+    profiling.add_arguments(parser)
+    catalog.add_arguments(parser)
+    args = parser.parse_args()
+    use_cache = not args.no_cache and not args.split
+    profiling.start_from_args(args, TOOL_NAME)
+    cat = catalog.from_args(args)
+
+    # Un único fichero: comportamiento clásico, sin pool ni resumen
+    if len(args.inputs) == 1 and os.path.isfile(args.inputs[0]):
+        infile = args.inputs[0]
+        profiling.count("files")
+        if args.split:
+            t0 = time.perf_counter()
+            sizes = []
+            paths = convert_split(infile, args.compact, sizes)
+            if cat is not None:
+                record_results(cat, [BatchResult(infile, paths[0], time.perf_counter() - t0,
+                                                 False, None, None, None, *sizes[0], paths)],
+                               args.compact, split=True)
+                cat.close()
+            print(f"Generado {paths[0]} (+{len(paths) - 1} grafos de funciones/clases)")
+            return
+        cache = open_cache(args.compact) if use_cache else None
+        if cache is not None and cache.is_fresh(infile, output_path(infile)):
+            result = BatchResult(infile, output_path(infile), 0.0, True, None, None, None)
+        else:
+            outfile, elapsed, hit, entry, size = convert_file(infile, use_cache, args.compact)
+            result = BatchResult(infile, outfile, elapsed, hit, entry, None, None,
+                                 *(size or (None, None)))
+            if cache is not None:
+                cache.record(infile, entry)
+        if cache is not None:
+            cache.close()
+        if cat is not None:
+            record_results(cat, [result], args.compact)
+            cat.close()
+        print(f"Generado {result.outfile}" + (" (caché)" if result.cached else ""))
+        return
+
+    sources = list(iter_sources(args.inputs))
+    if not sources:
+        print("No se encontraron archivos .py en las rutas indicadas.")
         sys.exit(1)
-    
-    infile = sys.argv[1]
-    # Generar el nombre del archivo de salida en la misma carpeta
-    base, _ = os.path.splitext(os.path.basename(infile))
-    dir_name = os.path.dirname(os.path.abspath(infile))
-    outfile = os.path.join(dir_name, base + ".dot")
-
-    with open(infile, 'r', encoding='utf-8') as f:
-        src = f.read()
-    
-    tree = ast.parse(src, filename=infile)
-    fb = FlowBuilder(src)
-    dot_text = fb.build(tree)
-    
-    with open(outfile, 'w', encoding='utf-8') as f:
-        f.write(dot_text)
-    
-    print(f"Generado {outfile}")
+
+    results, wall = convert_batch(sources, args.jobs, use_cache, args.split, args.compact, cat)
+    if cat is not None:
+        cat.close()
+    print_summary(results, wall)
+    if any(r.error is not None for r in results):
+        sys.exit(2)
 
 if __name__ == "__main__":
-    main()
+    main()
\ No newline at end of file
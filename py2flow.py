@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+py2flow.py
+Exporta en una sola pasada los diagramas de flujo de uno o varios .py a
+varios formatos: .dot, .drawio.xml, .pdf y .svg.
+
+El fuente se parsea una vez y el FlowGraph (flowir.py) se construye una vez;
+después se reparte entre los serializadores pedidos. El DOT se escribe en
+streaming a la vez en el .dot y en la stdin de cada render de Graphviz
+(pdf/svg), sin llegar a tenerlo entero en memoria; los renders se solapan con
+la escritura del .drawio.xml (y con el siguiente fichero).
+Con --watch DIR el proceso se queda vigilando la carpeta (watch.py) y
+regenera los diagramas de cada .py en cuanto se guarda.
+Uso:
+  py2flow.py archivo.py --formats dot,drawio,pdf
+  py2flow.py carpeta/ --formats dot,svg -j 4
+  py2flow.py --watch ejercicios/ --formats dot,drawio,pdf
+  py2flow.py archivo.py --compact        (un nodo por bloque básico)
+Cada fuente y cada salida se anota en el catálogo (catalog.py); en modo lote
+y al arrancar --watch solo se regeneran los fuentes cuyas salidas no constan
+en él como hechas por esta versión a partir del contenido actual (--force
+regenera todo).
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import subprocess
+from collections import deque
+
+import catalog
+import profiling
+from flowir import build_flow, compact_blocks, IncrementalFlow
+from py2dot import graph_to_dot, iter_sources
+from py2draw import write_mxfile
+from watch import Watcher
+
+FORMATS = ("dot", "drawio", "pdf", "svg")
+RENDERED = ("pdf", "svg")
+EXTENSIONS = {"dot": ".dot", "drawio": ".drawio.xml", "pdf": ".pdf", "svg": ".svg"}
+
+__version__ = "2.4"
+TOOL_NAME = "py2flow"
+
+
+def tool_id(compact=False):
+    """Cómo se registra esta herramienta en el catálogo."""
+    return f"{TOOL_NAME} {__version__}" + (" compact" if compact else "")
+
+
+def parse_formats(text):
+    formats = [f.strip().lower() for f in text.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"formato desconocido: {', '.join(unknown)} (válidos: {', '.join(FORMATS)})")
+    return formats
+
+
+def start_render(fmt, out_path):
+    """Lanza `dot -T<fmt>` leyendo el DOT por stdin. No espera a que termine."""
+    return subprocess.Popen(["dot", f"-T{fmt}", "-o", out_path],
+                            stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+class Tee:
+    """
+    Reparte cada write() entre varios ficheros de texto abiertos.
+    Una tubería rota (dot terminó con error) se descarta sin cortar al resto;
+    el error se informa al esperar el proceso.
+    """
+
+    def __init__(self, files):
+        self.files = list(files)
+
+    def write(self, text):
+        for f in list(self.files):
+            try:
+                f.write(text)
+            except BrokenPipeError:
+                self.files.remove(f)
+
+    def close(self):
+        for f in self.files:
+            try:
+                f.close()
+            except BrokenPipeError:
+                pass
+        self.files = []
+
+
+def finish_render(proc):
+    """Espera a un render. Devuelve None o el mensaje de error."""
+    err = proc.stderr.read()
+    proc.stderr.close()
+    if proc.wait() != 0:
+        return err.decode("utf-8", "replace").strip() or f"dot terminó con código {proc.returncode}"
+    return None
+
+
+def export_file(infile, formats, running, flow=None, compact=False):
+    """
+    Genera todos los formatos pedidos para infile. Los renders de Graphviz se
+    añaden a `running` como (proc, ruta_salida, formato, fuente, inicio) y se
+    esperan fuera. Devuelve (ficheros_escritos, grafo, segundos_de_construcción).
+    Con `flow` (un flowir.IncrementalFlow) solo se reconstruyen las regiones
+    del fichero que cambiaron desde la última vez. Con compact el grafo se
+    funde en bloques básicos antes de serializarlo (flowir.compact_blocks).
+    """
+    base = os.path.splitext(infile)[0]
+    profiling.count("files")
+    with profiling.phase("read"):
+        with open(infile, "r", encoding="utf-8") as f:
+            src = f.read()
+    t0 = time.perf_counter()
+    graph = flow.build(src, infile) if flow is not None else build_flow(src, infile)
+    if compact:
+        graph = compact_blocks(graph, keep_io=True)
+    build_secs = time.perf_counter() - t0
+
+    written = []
+    sinks = []
+    # Primero los renders: Graphviz trabaja mientras escribimos el resto
+    for fmt in RENDERED:
+        if fmt in formats:
+            out_path = base + EXTENSIONS[fmt]
+            with profiling.phase("render/start"):
+                proc = start_render(fmt, out_path)
+            running.append((proc, out_path, fmt, infile, time.perf_counter()))
+            sinks.append(io.TextIOWrapper(proc.stdin, encoding="utf-8"))
+    if "dot" in formats:
+        sinks.append(open(base + EXTENSIONS["dot"], "w", encoding="utf-8"))
+        written.append(base + EXTENSIONS["dot"])
+
+    if sinks:
+        tee = Tee(sinks)
+        try:
+            graph_to_dot(graph, profiling.writer(tee))
+        finally:
+            tee.close()
+
+    if "drawio" in formats:
+        with open(base + EXTENSIONS["drawio"], "w", encoding="utf-8") as f:
+            write_mxfile(graph, profiling.writer(f))
+        written.append(base + EXTENSIONS["drawio"])
+    return written, graph, build_secs
+
+
+def up_to_date(infile, formats):
+    """True si todas las salidas pedidas existen y son posteriores al fuente."""
+    base = os.path.splitext(infile)[0]
+    try:
+        src_mtime = os.stat(infile).st_mtime_ns
+        return all(os.stat(base + EXTENSIONS[fmt]).st_mtime_ns >= src_mtime for fmt in formats)
+    except OSError:
+        return False
+
+
+def export_many(sources, formats, max_running, flow=None, compact=False, cat=None):
+    """
+    Exporta una lista de fuentes con como mucho max_running renders de
+    Graphviz a la vez. Con cat (un catalog.Catalog) se anota cada fuente y
+    cada salida. Devuelve (ficheros_generados, [(ruta, error)]).
+    """
+    running = deque()
+    errors = []
+    produced = 0
+    tool = tool_id(compact)
+
+    def reap(limit):
+        nonlocal produced
+        while len(running) > limit:
+            proc, out_path, fmt, infile, started = running.popleft()
+            with profiling.phase("render/wait"):
+                err = finish_render(proc)
+            if err is None:
+                produced += 1
+                print(f"Generado {out_path}")
+                if cat is not None:
+                    # Incluye el tiempo en que el render se solapó con otros trabajos
+                    cat.record_artifact(infile, fmt, out_path, tool, time.perf_counter() - started)
+            else:
+                errors.append((out_path, err))
+
+    for infile in sources:
+        try:
+            t0 = time.perf_counter()
+            written, graph, build_secs = export_file(infile, formats, running, flow, compact)
+            for path in written:
+                produced += 1
+                print(f"Generado {path}")
+            if cat is not None:
+                base = os.path.splitext(infile)[0]
+                cat.record_source(infile, len(graph), graph.num_edges, build_secs)
+                for fmt in formats:
+                    if fmt not in RENDERED:
+                        cat.record_artifact(infile, fmt, base + EXTENSIONS[fmt], tool,
+                                            time.perf_counter() - t0)
+        except (OSError, SyntaxError, ValueError) as e:
+            errors.append((infile, f"{e.__class__.__name__}: {e}"))
+        reap(max_running)
+    reap(0)
+    if cat is not None:
+        cat.commit()
+    return produced, errors
+
+
+def plan(sources, formats, cat, compact=False):
+    """Fuentes a regenerar: con catálogo, los que no tienen al día todas sus salidas."""
+    if cat is None:
+        return sources
+    with profiling.phase("catalog/plan"):
+        return cat.stale(sources, {fmt: tool_id(compact) for fmt in formats})
+
+
+def watch(dirs, formats, max_running, interval, debounce, compact=False, cat=None, force=False):
+    """
+    Modo --watch: regenera los diagramas de cada .py guardado, en este mismo
+    proceso (intérprete y módulos ya cargados). Los fragmentos de IR de cada
+    función se conservan entre guardados: al editar una función solo se
+    reconstruye esa parte del fichero. No termina hasta Ctrl+C.
+    """
+    watcher = Watcher(dirs, interval=interval, debounce=debounce)
+    flow = IncrementalFlow()
+    # Al arrancar, solo lo que esté desactualizado
+    if force:
+        stale = sorted(watcher.snapshot)
+    elif cat is not None:
+        stale = plan(sorted(watcher.snapshot), formats, cat, compact)
+    else:
+        stale = [p for p in sorted(watcher.snapshot) if not up_to_date(p, formats)]
+    if stale:
+        produced, errors = export_many(stale, formats, max_running, flow, compact, cat)
+        for path, err in errors:
+            print(f"ERROR {path}: {err}", file=sys.stderr)
+    print(f"Vigilando {len(watcher.snapshot)} ficheros .py en {', '.join(dirs)} "
+          f"(Ctrl+C para salir)", flush=True)
+    try:
+        for changed, removed in watcher.batches():
+            t0 = time.perf_counter()
+            for path in removed:
+                print(f"Eliminado {path} (sus diagramas se conservan)")
+            if not changed:
+                continue
+            produced, errors = export_many(changed, formats, max_running, flow, compact, cat)
+            for path, err in errors:
+                print(f"ERROR {path}: {err}", file=sys.stderr)
+            print(f"[{time.strftime('%H:%M:%S')}] {len(changed)} cambios, {produced} ficheros "
+                  f"en {time.perf_counter() - t0:.3f} s", flush=True)
+    except KeyboardInterrupt:
+        print("Fin de la vigilancia.")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Exporta diagramas de flujo de código Python a varios formatos en una pasada.")
+    parser.add_argument("inputs", nargs="*",
+                        help="ficheros .py, carpetas (recursivo) o patrones glob")
+    parser.add_argument("--formats", type=parse_formats, default=["dot", "drawio"],
+                        help="lista separada por comas de: dot, drawio, pdf, svg (por defecto: dot,drawio)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="renders de Graphviz simultáneos como máximo")
+    parser.add_argument("--watch", metavar="DIR", action="append",
+                        help="vigilar DIR (se puede repetir) y regenerar cada .py al guardarlo")
+    parser.add_argument("--interval", type=float, default=0.2,
+                        help="segundos entre sondeos en modo --watch (por defecto: 0.2)")
+    parser.add_argument("--debounce", type=float, default=0.1,
+                        help="silencio necesario, en segundos, para dar por terminada "
+                             "una ráfaga de guardados (por defecto: 0.1)")
+    parser.add_argument("--compact", action="store_true",
+                        help="fundir cada secuencia lineal de sentencias en un solo nodo")
+    parser.add_argument("--force", action="store_true",
+                        help="regenerar todos los fuentes aunque el catálogo los dé por al día")
+    profiling.add_arguments(parser)
+    catalog.add_arguments(parser)
+    args = parser.parse_args()
+    if not args.inputs and not args.watch:
+        parser.error("indica ficheros de entrada o --watch DIR")
+    profiling.start_from_args(args, TOOL_NAME)
+    max_running = max(1, args.jobs or 1)
+    cat = catalog.from_args(args)
+
+    if args.watch:
+        missing = [d for d in args.watch if not os.path.isdir(d)]
+        if missing:
+            parser.error(f"no es una carpeta: {', '.join(missing)}")
+        try:
+            watch(args.watch, args.formats, max_running, args.interval, args.debounce,
+                  args.compact, cat, args.force)
+        finally:
+            if cat is not None:
+                cat.close()
+        return
+
+    sources = list(iter_sources(args.inputs))
+    if not sources:
+        print("No se encontraron archivos .py en las rutas indicadas.")
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    pending = sources if args.force else plan(sources, args.formats, cat, args.compact)
+    try:
+        produced, errors = export_many(pending, args.formats, max_running,
+                                       compact=args.compact, cat=cat)
+    finally:
+        if cat is not None:
+            cat.close()
+
+    for path, err in errors:
+        print(f"ERROR {path}: {err}", file=sys.stderr)
+    skipped = len(sources) - len(pending)
+    print(f"{produced} ficheros generados a partir de {len(pending)} fuentes "
+          f"en {time.perf_counter() - t0:.3f} s ({len(errors)} errores"
+          + (f", {skipped} al día según el catálogo)" if skipped else ")"))
+    if errors:
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
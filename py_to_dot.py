@@ -1,80 +1,543 @@
-import sys
+"""
+py_to_dot.py
+Diagrama DOT lineal (una cadena de nodos, sin ramas) de un archivo .py.
+Normalmente se construye a partir del IR compartido (flowir.py). Con --stream,
+o para ficheros de más de STREAM_MIN_BYTES, se usa en cambio un recorrido de
+la salida de tokenize en memoria constante: los nodos se escriben en el .dot
+según aparecen, sin AST ni lista de nodos. Las dos vías dan el mismo
+resultado salvo en lo que exigiría mirar hacia delante sin límite:
+ - en un try con else, el cuerpo del else sale en el orden del texto (tras los
+   except) y no justo después del cuerpo del try.
+"""
+
+import os
 import re
+import sys
+import argparse
+import time
+import tokenize
 
-def get_block_type(line):
-    """Clasifica una línea según su tipo lógico"""
-    line = line.strip()
-    if line.startswith(("if ", "elif ", "else", "for ", "while ")):
-        return "decision"
-    elif re.match(r"print\s*\(.*\)", line) or re.match(r"input\s*\(.*\)", line):
-        return "io"
-    elif line.startswith("def ") or line.startswith("#") or line == "" or line.startswith("try") or line.startswith("except"):
-        return None
+import catalog
+import profiling
+from build_cache import BuildCache, open_output
+from flowir import build_flow, compact_blocks, clip, STMT, DECISION, LOOP, LABEL_LIMIT
+
+__version__ = "2.3"
+TOOL_NAME = "py_to_dot"
+
+# A partir de este tamaño se usa siempre el modo streaming
+STREAM_MIN_BYTES = 64 * 1024 * 1024
+
+NODE_STYLES = {
+    "decision": ("diamond", "gold"),
+    "io": ("parallelogram", "mediumpurple1"),
+    "process": ("box", "lightskyblue"),
+}
+
+def linear_nodes(graph):
+    """Recorre el IR (flowir.py) en orden de código y clasifica cada nodo"""
+    for i in range(len(graph)):
+        kind = graph.kinds[i]
+        if kind in (DECISION, LOOP):
+            yield graph.labels[i], "decision"
+        elif kind == STMT:
+            yield graph.labels[i], "io" if graph.is_io(i) else "process"
+        # inicio/fin, uniones y cabeceras (def, try, except...) no aparecen
+
+def dot_header():
+    yield 'digraph G {'
+    yield '  rankdir=TB;'
+    yield '  node [fontname="Arial", fontsize=12];'
+    yield ''
+    # Nodos de inicio y fin
+    yield '  start [shape=ellipse, style=filled, fillcolor=lightgreen, label="Inicio"];'
+    yield '  end [shape=ellipse, style=filled, fillcolor=lightcoral, label="Fin"];'
+    yield ''
+
+def escape_label(text):
+    return text.replace('"', '\\"').replace('\n', '\\n')
+
+def node_prefix(i, ntype):
+    """Comienzo de la línea DOT del nodo i, hasta la comilla que abre la etiqueta"""
+    shape, color = NODE_STYLES.get(ntype, NODE_STYLES["process"])
+    return f'  n{i} [shape={shape}, style=filled, fillcolor="{color}", label="'
+
+def dot_node(i, text, ntype):
+    """Línea DOT del nodo i"""
+    return node_prefix(i, ntype) + escape_label(text) + '"];'
+
+def dot_footer(count):
+    """Conexiones de la cadena de `count` nodos y cierre del grafo"""
+    yield ''
+    if count:
+        yield '  start -> n0;'
+        for i in range(count - 1):
+            yield f'  n{i} -> n{i+1};'
+        yield f'  n{count-1} -> end;'
     else:
-        return "process"
+        yield '  start -> end;'
+    yield '}'
 
 def generate_dot(nodes):
     """Genera el contenido DOT a partir de una lista de nodos"""
-    dot = []
-    dot.append('digraph G {')
-    dot.append('  rankdir=TB;')
-    dot.append('  node [fontname="Arial", fontsize=12];')
-    dot.append('')
+    dot = list(dot_header())
+    for i, (text, ntype) in enumerate(nodes):
+        dot.append(dot_node(i, text, ntype))
+    dot.extend(dot_footer(len(nodes)))
+    return "\n".join(dot)
 
-    # Nodos de inicio y fin
-    dot.append('  start [shape=ellipse, style=filled, fillcolor=lightgreen, label="Inicio"];')
-    dot.append('  end [shape=ellipse, style=filled, fillcolor=lightcoral, label="Fin"];')
-    dot.append('')
+def render(text, compact=False):
+    """Convierte el texto de un .py en el DOT lineal"""
+    # Sin decisión múltiple: la cadena lineal no tiene aristas donde poner la
+    # condición de cada elif, así que cada una queda como su propio nodo
+    graph = build_flow(text, multiway=False)
+    if compact:
+        # Bloques básicos: una caja por tramo lineal, sin mezclar E/S y cálculo
+        graph = compact_blocks(graph, keep_io=True)
+    with profiling.phase("serialize"):
+        return generate_dot(list(linear_nodes(graph)))
 
-    # Crear los nodos
-    for i, (text, ntype) in enumerate(nodes):
-        node_id = f"n{i}"
-        label = text.replace('"', '\\"')
-        if ntype == "decision":
-            shape = "diamond"
-            color = "gold"
-        elif ntype == "io":
-            shape = "parallelogram"
-            color = "mediumpurple1"
+# -------------------------
+# Modo streaming: sin AST, línea a línea
+# -------------------------
+
+_CONDITIONS = frozenset(("if", "elif", "while"))
+_HEADERS = frozenset(("else", "try", "finally", "with", "def", "class", "except"))
+_FLOW_END = frozenset(("return", "raise", "break", "continue"))
+_IO_NAMES = frozenset(("print", "input"))
+_IGNORED = frozenset((tokenize.NL, tokenize.ENCODING, tokenize.ENDMARKER))
+
+def _gap(prev, tok):
+    """Lo que separa dos tokens en el fuente, ya colapsado: "", " " o una barra de continuación"""
+    (r0, c0), (r1, c1) = prev.end, tok.start
+    if r0 == r1:
+        return " " if c1 > c0 else ""
+    # Cambio de línea: dentro de paréntesis o tras "\\" (que forma parte de la etiqueta)
+    tail = prev.line.rstrip("\r\n").rsplit("\n", 1)[-1][c0:]
+    if tail.rstrip().endswith("\\"):
+        return " \\ " if tail[:1].isspace() else "\\ "
+    return " "
+
+class _Statement:
+    """
+    Sentencia lógica en curso. Acumula su etiqueta ya colapsada (como
+    flowir.clip) y solo hasta poco más de LABEL_LIMIT caracteres, de modo que
+    una sentencia de millones de tokens no crece en memoria.
+    kind: "stmt", "cond" (if/elif/while), "for", "match" (posible match),
+    "header" (cabecera que no se dibuja) o "skip" (import, decoradores)
+    """
+    __slots__ = ("kind", "depth", "pieces", "size", "parens", "lambdas", "count", "lead",
+                 "closes", "io", "call", "last", "prev", "comments", "colon")
+
+    def __init__(self, kind, depth, tok):
+        self.kind = kind
+        self.depth = depth
+        self.pieces = []
+        self.size = 0
+        self.parens = 0
+        self.lambdas = 0
+        self.count = 0      # tokens tras la palabra clave
+        self.lead = 0       # paréntesis con los que empiezan esos tokens
+        self.closes = []    # posición donde se cierra cada uno de ellos
+        self.io = False
+        self.call = False
+        self.last = None
+        self.prev = tok
+        self.comments = []
+        self.colon = None   # ":" de un posible match pendiente de confirmar
+        if kind in ("stmt", "for", "match"):
+            self._push(tok.string)
+            self._note_io(tok)
+            if tok.type == tokenize.OP and tok.string in ("(", "[", "{"):
+                self.parens = 1
+
+    def _push(self, text):
+        if self.size > 2 * LABEL_LIMIT:
+            return
+        core = " ".join(text.split())
+        if core and text[:1].isspace():
+            core = " " + core
+        self.pieces.append(core)
+        self.size += len(core)
+
+    def _note_io(self, tok):
+        # input()/print() o *.write(): un nombre seguido de "("
+        s = tok.string
+        if self.call and s == "(":
+            self.io = True
+        self.call = (tok.type == tokenize.NAME
+                     and (s in _IO_NAMES and self.last != "." or self.last == "." and s.lower() == "write"))
+        self.last = s
+
+    def add(self, tok):
+        gap = _gap(self.prev, tok)
+        if self.kind == "for" and gap != " " and gap:
+            gap = " "   # flowir rehace la etiqueta a partir del destino y el iterable
+        self.prev = tok
+        if tok.type == tokenize.COMMENT:
+            # Un comentario solo es parte de la etiqueta si le sigue más código
+            self.comments.append(gap + tok.string)
+            return
+        for c in self.comments:
+            self._push(c)
+        self.comments.clear()
+        self._push(gap + tok.string)
+        if self.kind in ("stmt", "match") and not self.io:
+            self._note_io(tok)
+
+        # Paréntesis que envuelven toda la condición: el AST no los incluye
+        s = tok.string
+        if tok.type == tokenize.OP:
+            if s in "([{":
+                if s == "(" and self.count == self.lead and self.parens == self.lead:
+                    self.lead += 1
+                    self.closes.append(-1)
+                self.parens += 1
+            elif s in ")]}":
+                self.parens -= 1
+                if self.parens < self.lead and self.closes[self.parens] == -1:
+                    self.closes[self.parens] = self.count
+        elif s == "lambda" and self.parens == 0:
+            self.lambdas += 1
+        self.count += 1
+
+    def label(self, skip=0, strip_parens=False):
+        pieces = self.pieces[skip:]
+        if strip_parens:
+            k = 0
+            while k < self.lead and self.closes[k] == self.count - 1 - k:
+                k += 1
+            if k:
+                pieces = pieces[k:] if self.size > 2 * LABEL_LIMIT else pieces[k:-k]
+        text = "".join(pieces).strip()
+        if len(text) > LABEL_LIMIT:
+            text = text[:LABEL_LIMIT - 3] + "..."
+        return text
+
+    def finish(self):
+        """(texto, tipo, profundidad, corta_el_flujo) de una sentencia simple, o None"""
+        if self.kind == "stmt" or self.kind == "match":
+            ends = self.kind == "stmt" and self.pieces[0] in _FLOW_END
+            return self.label(), "io" if self.io else "process", self.depth, ends
+        return None
+
+def _tab_width(indent):
+    """Columna de una sangría, con las mismas reglas que tokenize (tabuladores de 8)"""
+    col = 0
+    for c in indent:
+        if c == " ":
+            col += 1
+        elif c == "\t":
+            col = (col // 8 + 1) * 8
+        else:   # \f
+            col = 0
+    return col
+
+# Lo que importa de una línea física para saber si se puede clasificar sin
+# tokenize: cadenas completas, comentario, paréntesis y lo que obliga a
+# tokenizar (comillas triples o sin cerrar, ";" y "\\")
+_LINE_SCAN = re.compile(r'''"""|\'\'\'|"[^"\\\n]*(?:\\.[^"\\\n]*)*"|'[^'\\\n]*(?:\\.[^'\\\n]*)*'|[#()\[\]{};\\"']''')
+_FIRST_WORD = re.compile(r"[^\W\d]\w*")
+_IO_CALL = re.compile(r"(?<![.\w])(?:print|input)\s*\(|\.\s*[wW][rR][iI][tT][eE]\s*\(")
+_SLOW = object()
+
+def _clip(text):
+    # flowir.clip para una línea ya aislada (el caso corto, sin trocear)
+    if len(text) <= LABEL_LIMIT:
+        return " ".join(text.split())
+    return clip(text)
+
+def _simple_line(line, depth, match_bodies):
+    """
+    Camino rápido: clasifica una línea lógica de una sola línea física
+    (sangría ya quitada) con expresiones regulares. Devuelve la tupla de
+    stream_nodes, None si no genera nodo o _SLOW si hace falta tokenize.
+    """
+    parens = 0
+    strings = False
+    end = len(line)
+    for m in _LINE_SCAN.finditer(line):
+        c = m.group()
+        if c == "#":
+            end = m.start()
+            break
+        if c in "([{":
+            parens += 1
+        elif c in ")]}":
+            parens -= 1
+            if parens < 0:
+                return _SLOW
+        elif len(c) > 1 and c != '"""' and c != "'''":
+            strings = True
         else:
-            shape = "box"
-            color = "lightskyblue"
-        dot.append(f'  {node_id} [shape={shape}, style=filled, fillcolor="{color}", label="{label}"];')
-
-    dot.append('')
-
-    # Conexiones
-    if nodes:
-        dot.append(f'  start -> n0;')
-        for i in range(len(nodes) - 1):
-            dot.append(f'  n{i} -> n{i+1};')
-        dot.append(f'  n{len(nodes)-1} -> end;')
-    else:
-        dot.append('  start -> end;')
+            return _SLOW
+    if parens:
+        return _SLOW
+    code = line[:end].rstrip()
+    m = _FIRST_WORD.match(code)
+    word = m.group() if m else ""
+    if word in ("import", "from") or code[:1] == "@":
+        return None
+    if word == "async":
+        return _SLOW
+    header = (word in _CONDITIONS or word == "for" or word in _HEADERS
+              or word == "case" and match_bodies and match_bodies[-1] == depth)
+    if header or (word == "match" and code.endswith(":")):
+        if not code.endswith(":"):
+            return _SLOW    # cuerpo en la misma línea
+        if word in _CONDITIONS or word == "match":
+            test = code[len(word):-1].strip()
+            if test[:1] == "(":
+                return _SLOW    # paréntesis que el AST no incluye en la etiqueta
+            if word == "match":
+                match_bodies.append(depth + 1)
+                return _clip("match " + test), "decision", depth, False
+            return _clip(test), "decision", depth, False
+        if word == "for":
+            return _clip(code[:-1]), "decision", depth, False
+        return None, None, depth, False
+    io = False
+    if _IO_CALL.search(code):
+        io = True
+        if strings:
+            # Que no sea texto dentro de una cadena: se mira sin ellas
+            bare = _LINE_SCAN.sub(lambda m: '""' if len(m.group()) > 1 else m.group(), code)
+            io = _IO_CALL.search(bare) is not None
+    return _clip(code), "io" if io else "process", depth, word in _FLOW_END
 
-    dot.append('}')
-    return "\n".join(dot)
+def _token_statements(first, readline, depth, match_bodies):
+    """
+    Camino lento: la línea lógica que empieza por `first` (sin sangría) se
+    lee con tokenize, que pide a readline las líneas físicas que le falten
+    (paréntesis abiertos, cadenas triples, "\\"). Los tokens no se guardan.
+    """
+    pending = [first]
 
-def main():
-    if len(sys.argv) < 2:
-        print("Uso: python py_to_dot.py archivo.py")
-        return
+    def lines():
+        return pending.pop() if pending else readline()
 
-    py_file = sys.argv[1]
-    with open(py_file, "r", encoding="utf-8") as f:
-        lines = f.readlines()
+    inline = 0          # 1 en el cuerpo escrito en la misma línea que su cabecera
+    st = None
+    is_async = False
+    for tok in tokenize.generate_tokens(lines):
+        t = tok.type
+        if t in _IGNORED or t == tokenize.INDENT or t == tokenize.DEDENT:
+            continue
+        if t == tokenize.NEWLINE:
+            if st is not None:
+                if st.colon is not None:
+                    # `match x:` al final de la línea: es un match de verdad
+                    match_bodies.append(st.depth + 1)
+                    yield "match " + st.label(1, strip_parens=True), "decision", st.depth, False
+                else:
+                    item = st.finish()
+                    if item is not None:
+                        yield item
+            return
 
-    nodes = []
-    for line in lines:
-        t = get_block_type(line)
-        if t:
-            nodes.append((line.strip(), t))
+        if st is None:
+            if t == tokenize.COMMENT:
+                continue
+            s = tok.string
+            d = depth + inline
+            if t == tokenize.NAME:
+                if s == "async":
+                    is_async = True
+                    continue
+                if s in ("import", "from"):
+                    kind = "skip"
+                elif s in _CONDITIONS:
+                    kind = "cond"
+                elif s == "for":
+                    kind = "for"
+                elif s in _HEADERS or (s == "case" and match_bodies and match_bodies[-1] == d):
+                    kind = "header"
+                elif s == "match" and not is_async:
+                    kind = "match"
+                else:
+                    kind = "stmt"
+            else:
+                kind = "skip" if s == "@" else "stmt"
+            is_async = False
+            st = _Statement(kind, d, tok)
+            continue
 
-    dot_content = generate_dot(nodes)
+        if st.colon is not None:
+            if t == tokenize.COMMENT:
+                continue
+            # Lo que sigue a los ":" no es el fin de línea: era una anotación (match: int = 1)
+            st.add(st.colon)
+            st.colon = None
+            st.kind = "stmt"
+        if t == tokenize.OP and st.parens == 0:
+            s = tok.string
+            if s == ";":
+                item = st.finish()
+                if item is not None:
+                    yield item
+                st = None
+                continue
+            if s == ":" and st.kind not in ("stmt", "skip"):
+                if st.lambdas:
+                    st.lambdas -= 1
+                elif st.kind == "match":
+                    st.colon = tok
+                    continue
+                else:
+                    if st.kind == "cond":
+                        yield st.label(strip_parens=True), "decision", st.depth, False
+                    elif st.kind == "for":
+                        yield st.label(), "decision", st.depth, False
+                    else:
+                        yield None, None, st.depth, False
+                    st = None
+                    inline = 1
+                    continue
+        # También en cabeceras e imports: hace falta seguir los paréntesis
+        st.add(tok)
 
+def stream_nodes(readline):
+    """
+    Clasifica las sentencias del fuente leyéndolo línea a línea. Genera
+    (texto, tipo, profundidad, corta_el_flujo) en orden de texto; tipo es
+    "decision", "io", "process" o None para las cabeceras (def, try, else...)
+    que no se dibujan pero separan bloques.
+    Las líneas corrientes se clasifican con expresiones regulares; solo las
+    sentencias de varias líneas físicas, con cadenas triples, ";" o cuerpo en
+    la misma línea pasan por tokenize.
+    """
+    indents = [0]
+    match_bodies = []   # profundidad de los case de cada match abierto
+    while True:
+        line = readline()
+        if not line:
+            return
+        code = line.lstrip(" \t\f")
+        if not code or code[0] in "#\r\n":
+            continue    # línea en blanco o solo comentario
+        col = _tab_width(line[:len(line) - len(code)])
+        if col > indents[-1]:
+            indents.append(col)
+        elif col < indents[-1]:
+            while col < indents[-1]:
+                indents.pop()
+            if col != indents[-1]:
+                raise IndentationError("unindent does not match any outer indentation level")
+        depth = len(indents) - 1
+        while match_bodies and match_bodies[-1] > depth:
+            match_bodies.pop()
+        item = _simple_line(code, depth, match_bodies)
+        if item is _SLOW:
+            yield from _token_statements(code, readline, depth, match_bodies)
+        elif item is not None:
+            yield item
+
+def write_stream(readline, out, compact=False):
+    """
+    Escribe en `out` el DOT lineal del fuente que se lee con readline; cada
+    nodo se escribe en cuanto se reconoce. Con compact, las sentencias
+    seguidas del mismo bloque (y del mismo tipo, E/S o cálculo) van en un
+    nodo, como flowir.compact_blocks. Devuelve el número de nodos.
+    """
+    for line in dot_header():
+        out.write(line + "\n")
+    count = 0
+    block = None    # (tipo, profundidad) del nodo compacto abierto
+    for text, ntype, depth, ends in stream_nodes(readline):
+        if block is not None:
+            if ntype == block[0] and depth == block[1]:
+                out.write("\\n" + escape_label(text))
+                if ends:
+                    out.write('"];\n')
+                    block = None
+                continue
+            out.write('"];\n')
+            block = None
+        if ntype is None:
+            continue
+        if compact and ntype != "decision" and not ends:
+            out.write(node_prefix(count, ntype) + escape_label(text))
+            block = (ntype, depth)
+        else:
+            out.write(dot_node(count, text, ntype) + "\n")
+        count += 1
+    if block is not None:
+        out.write('"];\n')
+    # Las aristas dependen solo del número de nodos: también se escriben de una en una
+    sep = ""
+    for line in dot_footer(count):
+        out.write(sep + line)
+        sep = "\n"
+    profiling.count("nodes", count)
+    return count
+
+def convert_stream(py_file, output_file, compact=False):
+    """Modo --stream: .py -> .dot sin cargar el fuente entero. Devuelve el nº de nodos."""
+    with open(py_file, "r", encoding="utf-8") as src, open_output(output_file) as out:
+        with profiling.phase("stream"):
+            return write_stream(src.readline, profiling.writer(out), compact)
+
+def main():
+    parser = argparse.ArgumentParser(description="Diagrama DOT lineal de un archivo .py")
+    parser.add_argument("archivo", help="archivo .py a convertir")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="regenerar siempre, sin usar la caché")
+    parser.add_argument("--compact", action="store_true",
+                        help="fundir las sentencias seguidas en un solo nodo (bloque básico)")
+    parser.add_argument("--stream", action="store_true",
+                        help="leer el fuente con tokenize y escribir los nodos según aparecen, "
+                             "en memoria constante (automático a partir de "
+                             f"{STREAM_MIN_BYTES // (1024 * 1024)} MiB; no usa la caché)")
+    profiling.add_arguments(parser)
+    catalog.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.start_from_args(args, TOOL_NAME)
+    profiling.count("files")
+    cat = catalog.from_args(args)
+
+    py_file = args.archivo
     output_file = py_file.replace(".py", ".dot")
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(dot_content)
+    tool = TOOL_NAME + "-compact" if args.compact else TOOL_NAME
+    stream = args.stream or (os.path.isfile(py_file)
+                             and os.path.getsize(py_file) >= STREAM_MIN_BYTES)
+    cache = None if args.no_cache or stream else BuildCache(tool, __version__)
+
+    # En el catálogo solo se anota el .dot: la cadena lineal no es el FlowGraph
+    # del fuente, así que sus nodos no cuentan como tamaño del grafo
+    tool_id = " ".join([TOOL_NAME, __version__] + ["compact"] * args.compact)
+
+    if cache is not None and cache.is_fresh(py_file, output_file):
+        if cat is not None:
+            cat.record(py_file, {"dot": output_file}, tool_id)
+            cat.close()
+        print(f"✅ Archivo DOT al día (caché): {output_file}")
+        return
+
+    t0 = time.perf_counter()
+    hit = False
+    try:
+        if stream:
+            convert_stream(py_file, output_file, args.compact)
+        elif cache is not None:
+            hit, entry = cache.build(py_file, output_file, lambda src, f: f.write(render(src, args.compact)))
+            cache.record(py_file, entry)
+            cache.close()
+        else:
+            with profiling.phase("read"):
+                with open(py_file, "r", encoding="utf-8") as f:
+                    text = f.read()
+            dot_content = render(text, args.compact)
+            with profiling.phase("write"):
+                with open(output_file, "w", encoding="utf-8") as f:
+                    f.write(dot_content)
+    except (SyntaxError, tokenize.TokenError) as e:
+        print("Error de sintaxis:", e, file=sys.stderr)
+        sys.exit(2)
+
+    if cat is not None:
+        cat.record(py_file, {"dot": output_file}, tool_id,
+                   seconds=None if hit else time.perf_counter() - t0)
+        cat.close()
 
     print(f"✅ Archivo DOT generado: {output_file}")
     print("Puedes renderizarlo con:")
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+serve.py
+Servidor local de diagramas: un proceso que se queda cargado (intérprete,
+módulos y caché en memoria) y convierte el código Python que le envían, para
+que los editores no paguen el arranque de Python en cada conversión.
+
+Protocolo HTTP/1.1 mínimo (con keep-alive), por TCP o por socket Unix:
+  POST /dot      cuerpo = fuente .py  -> DOT (py2dot)
+  POST /drawio   cuerpo = fuente .py  -> .drawio.xml (py2draw)
+  POST /svg      cuerpo = fuente .py  -> SVG renderizado con Graphviz
+  POST /pdf      cuerpo = fuente .py  -> PDF renderizado con Graphviz
+  GET  /stats                         -> contadores en JSON
+Con ?compact=1 el grafo se funde en bloques básicos (como --compact).
+La respuesta lleva X-Cache: hit|miss. Un error de sintaxis devuelve 400 con
+el mensaje; un fallo de Graphviz, 502.
+
+Los resultados se guardan en un LRU acotado en entradas y en bytes, con clave
+sha256(fuente) + formato + compact. Varias peticiones iguales a la vez se
+resuelven con una sola conversión. Los renders de Graphviz se limitan con un
+semáforo (-j): el resto de peticiones, incluidas las que salen de la caché,
+siguen atendiéndose mientras tanto.
+Uso:
+  serve.py                          escucha en 127.0.0.1:8765
+  serve.py --unix /tmp/py2flow.sock
+  serve.py --bench carpeta/ -c 16   generador de carga contra un servidor nuevo
+  curl --data-binary @ej.py 'http://127.0.0.1:8765/svg?compact=1' -o ej.svg
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+
+import py2dot
+import py2draw
+
+__version__ = "2.4"
+
+CONTENT_TYPES = {
+    "dot": "text/vnd.graphviz; charset=utf-8",
+    "drawio": "application/xml; charset=utf-8",
+    "svg": "image/svg+xml",
+    "pdf": "application/pdf",
+}
+RENDERED = ("svg", "pdf")
+MAX_BODY = 16 * 1024 * 1024
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error",
+           502: "Bad Gateway", 504: "Gateway Timeout"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ResultCache:
+    """LRU de resultados {clave: bytes}, acotado en número de entradas y en bytes."""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        data = self.entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return      # no cabe: se sirve pero no se guarda
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self.entries[key] = data
+        self.size += len(data)
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            _, dropped = self.entries.popitem(last=False)
+            self.size -= len(dropped)
+            self.evictions += 1
+
+
+class DiagramServer:
+    def __init__(self, jobs=None, cache_entries=256, cache_bytes=64 * 1024 * 1024,
+                 render_timeout=30.0):
+        self.cache = ResultCache(cache_entries, cache_bytes)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.graphviz = asyncio.Semaphore(self.jobs)
+        self.render_timeout = render_timeout
+        self.inflight = {}      # clave -> Future de la conversión en curso
+        self.requests = 0
+        self.renders = 0
+        self.started = time.time()
+
+    # ---------- conversión ----------
+
+    async def convert(self, fmt, src, compact):
+        """Devuelve (bytes, acierto_de_caché) del formato pedido para src."""
+        key = (hashlib.sha256(src).hexdigest(), fmt, compact)
+        data = self.cache.get(key)
+        if data is not None:
+            return data, True
+        pending = self.inflight.get(key)
+        if pending is not None:
+            # La misma conversión ya está en marcha: se espera a su resultado
+            return await asyncio.shield(pending), True
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            data = await self._produce(fmt, src, compact)
+            self.cache.put(key, data)
+            future.set_result(data)
+            return data, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()     # marcada como recogida aunque nadie más espere
+            raise
+        finally:
+            del self.inflight[key]
+
+    async def _produce(self, fmt, src, compact):
+        if fmt in RENDERED:
+            dot, _ = await self.convert("dot", src, compact)
+            return await self.render(fmt, dot)
+        text = src.decode("utf-8")
+        # El AST y la serialización son CPU: en un hilo para que el bucle siga
+        # sirviendo las peticiones que salen de la caché
+        if fmt == "dot":
+            out = await asyncio.to_thread(py2dot.render, text, "<petición>", compact)
+        else:
+            out = await asyncio.to_thread(py2draw.render, text, "<petición>", compact)
+        return out.encode("utf-8")
+
+    async def render(self, fmt, dot):
+        """DOT -> fmt con `dot -T<fmt>` por stdin/stdout, como mucho self.jobs a la vez."""
+        async with self.graphviz:
+            self.renders += 1
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    "dot", f"-T{fmt}", stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            except OSError as e:
+                raise HTTPError(502, f"no se pudo lanzar Graphviz: {e}")
+            try:
+                out, err = await asyncio.wait_for(proc.communicate(dot), self.render_timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                raise HTTPError(504, f"Graphviz tardó más de {self.render_timeout:g} s")
+            if proc.returncode != 0:
+                msg = err.decode("utf-8", "replace").strip()
+                raise HTTPError(502, msg or f"dot terminó con código {proc.returncode}")
+            return out
+
+    def stats(self):
+        c = self.cache
+        return {"version": __version__, "uptime": round(time.time() - self.started, 3),
+                "requests": self.requests, "renders": self.renders,
+                "cache": {"entries": len(c.entries), "bytes": c.size, "hits": c.hits,
+                          "misses": c.misses, "evictions": c.evictions},
+                "inflight": len(self.inflight), "graphviz_jobs": self.jobs}
+
+    # ---------- HTTP ----------
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                self.requests += 1
+                status, ctype, data, extra = await self.dispatch(method, target, body)
+                keep = headers.get("connection", "").lower() != "close"
+                write_response(writer, status, ctype, data, extra, keep)
+                await writer.drain()
+                if not keep:
+                    break
+        except HTTPError as e:
+            write_response(writer, e.status, "text/plain; charset=utf-8",
+                           (str(e) + "\n").encode("utf-8"), {}, False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def dispatch(self, method, target, body):
+        """Devuelve (estado, content-type, cuerpo, cabeceras_extra)."""
+        url = urlsplit(target)
+        path = url.path.strip("/")
+        if path == "stats":
+            data = json.dumps(self.stats(), indent=1).encode("utf-8")
+            return 200, "application/json", data, {}
+        if path not in CONTENT_TYPES:
+            return error(404, f"ruta desconocida: /{path} (válidas: "
+                              f"{', '.join('/' + f for f in CONTENT_TYPES)}, /stats)")
+        if method != "POST":
+            return error(405, "envía el código Python con POST")
+        query = parse_qs(url.query)
+        compact = query.get("compact", ["0"])[-1].lower() in ("1", "true", "yes", "si", "sí")
+        try:
+            data, hit = await self.convert(path, body, compact)
+        except HTTPError as e:
+            return error(e.status, str(e))
+        except UnicodeDecodeError as e:
+            return error(400, f"el fuente no es UTF-8: {e}")
+        except (SyntaxError, ValueError) as e:
+            return error(400, f"{e.__class__.__name__}: {e}")
+        except Exception as e:
+            # p. ej. RecursionError con anidamientos extremos: falla la petición, no la conexión
+            return error(500, f"{e.__class__.__name__}: {e}")
+        return 200, CONTENT_TYPES[path], data, {"X-Cache": "hit" if hit else "miss"}
+
+
+def error(status, message):
+    return status, "text/plain; charset=utf-8", (message + "\n").encode("utf-8"), {}
+
+
+async def read_request(reader):
+    """Lee una petición: (método, destino, cabeceras, cuerpo) o None si se cerró la conexión."""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "línea de petición mal formada")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = b""
+    if method == "POST":
+        if "content-length" not in headers:
+            raise HTTPError(411, "falta Content-Length")
+        value = headers["content-length"]
+        # Solo dígitos: int() aceptaría también "-1", "+5" o "1_0"
+        if not (value.isascii() and value.isdigit()):
+            raise HTTPError(400, f"Content-Length no válido: {value!r}")
+        length = int(value)
+        if length > MAX_BODY:
+            raise HTTPError(413, f"el fuente supera {MAX_BODY // (1024 * 1024)} MiB")
+        body = await reader.readexactly(length)
+    return method.upper(), target, headers, body
+
+
+def write_response(writer, status, ctype, data, extra, keep):
+    head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+            f"Content-Type: {ctype}", f"Content-Length: {len(data)}",
+            "Connection: " + ("keep-alive" if keep else "close")]
+    head += [f"{k}: {v}" for k, v in extra.items()]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+
+
+async def serve(args):
+    server = DiagramServer(args.jobs, args.cache_entries, args.cache_mib * 1024 * 1024,
+                           args.render_timeout)
+    if args.unix:
+        srv = await asyncio.start_unix_server(server.handle, path=args.unix)
+        where = f"unix:{args.unix}"
+    else:
+        srv = await asyncio.start_server(server.handle, args.host, args.port)
+        host, port = srv.sockets[0].getsockname()[:2]
+        where = f"http://{host}:{port}"
+    # Primera línea de la salida: el generador de carga la usa para saber el puerto
+    print(f"Escuchando en {where}", flush=True)
+    async with srv:
+        await srv.serve_forever()
+
+
+# -------------------------
+# Generador de carga
+# -------------------------
+
+def load_sources(paths):
+    """Fuentes de la prueba de carga: los .py indicados o, si no hay, los de bench.py."""
+    if paths:
+        found = []
+        for p in py2dot.iter_sources(paths):
+            with open(p, "rb") as f:
+                found.append(f.read())
+        return found
+    import bench
+    return [bench.GENERATORS[axis](size).encode("utf-8")
+            for axis, sizes in bench.AXES.items() for size in sizes[:3]]
+
+
+async def _client(host, port, jobs, latencies, failures):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while jobs:
+            path, body = jobs.pop()
+            head = (f"POST {path} HTTP/1.1\r\nHost: {host}\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1")
+            t0 = time.perf_counter()
+            writer.write(head + body)
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - t0)
+            if status != 200:
+                failures.append(status)
+    finally:
+        writer.close()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_pass(host, port, sources, fmt, compact, requests, concurrency):
+    path = f"/{fmt}" + ("?compact=1" if compact else "")
+    jobs = [(path, sources[i % len(sources)]) for i in range(requests)]
+    jobs.reverse()
+    latencies, failures = [], []
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, jobs, latencies, failures)
+                           for _ in range(concurrency)))
+    return time.perf_counter() - t0, latencies, failures
+
+
+def print_pass(name, wall, latencies, failures):
+    print(f"{name:<6} {len(latencies):6} peticiones en {wall:7.3f} s  "
+          f"{len(latencies) / wall:8.1f} pet/s  "
+          f"p50={percentile(latencies, 0.50) * 1000:7.2f} ms  "
+          f"p95={percentile(latencies, 0.95) * 1000:7.2f} ms  "
+          f"p99={percentile(latencies, 0.99) * 1000:7.2f} ms"
+          + (f"  {len(failures)} errores" if failures else ""))
+
+
+async def bench(args):
+    sources = load_sources(args.bench)
+    proc = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port
+    else:
+        # Servidor nuevo en otro proceso, para no repartir el GIL con el cliente
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "--port", "0", "-j", str(args.jobs or 0),
+            "--cache-entries", str(args.cache_entries), "--cache-mib", str(args.cache_mib),
+            stdout=asyncio.subprocess.PIPE)
+        line = (await proc.stdout.readline()).decode()
+        url = urlsplit(line.split()[-1])
+        host, port = url.hostname, url.port
+    try:
+        requests = max(1, args.requests)
+        print(f"{len(sources)} fuentes distintas, formato {args.format}, "
+              f"{args.concurrency} clientes a la vez")
+        # Frío: cada fuente una vez (todas fallan la caché); caliente: se repiten
+        print_pass("frío", *await run_pass(host, port, sources, args.format, args.compact,
+                                           len(sources), args.concurrency))
+        print_pass("cache", *await run_pass(host, port, sources, args.format, args.compact,
+                                            requests, args.concurrency))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            await proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Servidor local que convierte código Python en diagramas (DOT, draw.io, SVG, PDF).")
+    parser.add_argument("--host", default="127.0.0.1", help="dirección (por defecto: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765,
+                        help="puerto TCP; 0 elige uno libre (por defecto: 8765)")
+    parser.add_argument("--unix", metavar="RUTA", help="escuchar en un socket Unix en lugar de TCP")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="renders de Graphviz simultáneos como máximo (por defecto: nº de CPUs)")
+    parser.add_argument("--cache-entries", type=int, default=256,
+                        help="resultados que guarda el LRU (por defecto: 256)")
+    parser.add_argument("--cache-mib", type=int, default=64,
+                        help="tamaño máximo del LRU en MiB (por defecto: 64)")
+    parser.add_argument("--render-timeout", type=float, default=30.0,
+                        help="segundos máximos por render de Graphviz (por defecto: 30)")
+    group = parser.add_argument_group("prueba de carga")
+    group.add_argument("--bench", nargs="*", metavar="FUENTE",
+                       help="lanzar la prueba de carga con estos .py o carpetas "
+                            "(sin argumentos: fuentes sintéticas de bench.py)")
+    group.add_argument("--url", help="servidor ya arrancado contra el que medir "
+                                     "(por defecto se arranca uno nuevo)")
+    group.add_argument("-c", "--concurrency", type=int, default=16,
+                       help="clientes simultáneos (por defecto: 16)")
+    group.add_argument("-n", "--requests", type=int, default=2000,
+                       help="peticiones de la pasada con caché (por defecto: 2000)")
+    group.add_argument("--format", choices=list(CONTENT_TYPES), default="dot",
+                       help="formato pedido en la prueba (por defecto: dot)")
+    group.add_argument("--compact", action="store_true", help="pedir ?compact=1 en la prueba")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(bench(args) if args.bench is not None else serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
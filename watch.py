@@ -0,0 +1,83 @@
+"""
+watch.py
+Vigilancia de carpetas de fuentes .py por sondeo (solo biblioteca estándar).
+
+Cada sondeo recorre el árbol con os.scandir y compara (mtime_ns, tamaño) de
+cada .py con la pasada anterior: con miles de ficheros son unos pocos
+milisegundos. Los cambios se agrupan (debounce): tras detectar uno se sigue
+sondeando cada `debounce` segundos hasta que una pasada no trae nada nuevo, y
+entonces se entrega el lote entero. Así un "guardar todo" del editor, o un
+guardado en varios pasos (temporal + rename), produce una sola regeneración.
+"""
+
+import os
+import time
+
+
+def scan(roots, suffix=".py"):
+    """
+    Devuelve {ruta: (mtime_ns, tamaño)} de los ficheros con ese sufijo bajo
+    roots. Mismas reglas que py2dot.iter_sources: se saltan las carpetas que
+    empiezan por '.' o '__'.
+    """
+    found = {}
+    stack = list(roots)
+    while stack:
+        path = stack.pop()
+        try:
+            it = os.scandir(path)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        with it:
+            for entry in it:
+                name = entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not name.startswith((".", "__")):
+                            stack.append(entry.path)
+                    elif name.endswith(suffix):
+                        st = entry.stat()
+                        found[entry.path] = (st.st_mtime_ns, st.st_size)
+                except FileNotFoundError:
+                    continue  # borrado mientras se recorría
+    return found
+
+
+class Watcher:
+    def __init__(self, roots, suffix=".py", interval=0.2, debounce=0.1):
+        self.roots = list(roots)
+        self.suffix = suffix
+        self.interval = interval
+        self.debounce = debounce
+        self.snapshot = scan(self.roots, suffix)
+
+    def poll(self):
+        """Una pasada: devuelve (modificados_o_nuevos, borrados) desde la anterior."""
+        current = scan(self.roots, self.suffix)
+        old = self.snapshot
+        changed = [p for p, sig in current.items() if old.get(p) != sig]
+        removed = [p for p in old if p not in current]
+        self.snapshot = current
+        return changed, removed
+
+    def batches(self):
+        """Generador infinito de lotes (modificados, borrados), ya agrupados."""
+        while True:
+            time.sleep(self.interval)
+            changed, removed = self.poll()
+            if not changed and not removed:
+                continue
+            pending_changed = set(changed)
+            pending_removed = set(removed)
+            # Debounce: esperar a que la ráfaga de guardados termine
+            while True:
+                time.sleep(self.debounce)
+                changed, removed = self.poll()
+                if not changed and not removed:
+                    break
+                pending_changed.update(changed)
+                pending_changed.difference_update(removed)
+                pending_removed.update(removed)
+                pending_removed.difference_update(changed)
+            pending_removed.difference_update(pending_changed)
+            yield sorted(pending_changed), sorted(pending_removed)